@@ -15,6 +15,64 @@ def create_app(config=None):
         SECRET_KEY=os.environ.get("SECRET_KEY", "dev-key-change-in-production"),
         DOCKER_IMAGE="linux-sandbox:latest",
         DOCKER_TIMEOUT=30,
+        # Docker daemons to spread sessions over (comma-separated URLs);
+        # empty uses the daemon from the environment
+        SANDBOX_DOCKER_HOSTS=[
+            url.strip()
+            for url in os.environ.get("SANDBOX_DOCKER_HOSTS", "").split(",")
+            if url.strip()
+        ],
+        # Idle sandbox containers kept warm for new sessions
+        SANDBOX_POOL_SIZE=int(os.environ.get("SANDBOX_POOL_SIZE", 2)),
+        # Where sessions run: "docker" containers, or "namespace" for Linux
+        # namespaces on this host (starts in milliseconds; see README)
+        SANDBOX_BACKEND=os.environ.get("SANDBOX_BACKEND", "docker"),
+        # Namespace backend: the sandbox image's unpacked root filesystem
+        # (unpacked from DOCKER_IMAGE under SANDBOX_STATE_DIR if unset), and
+        # a cgroup v2 directory delegated to this user for per-session limits
+        SANDBOX_ROOTFS=os.environ.get("SANDBOX_ROOTFS"),
+        SANDBOX_CGROUP_ROOT=os.environ.get("SANDBOX_CGROUP_ROOT"),
+        # Shared read-only containers answering read-only commands of
+        # sessions that have no container yet (0 disables)
+        SANDBOX_LANE_SIZE=int(os.environ.get("SANDBOX_LANE_SIZE", 2)),
+        # Bytes of command output kept per command before truncating
+        SANDBOX_OUTPUT_LIMIT=int(os.environ.get("SANDBOX_OUTPUT_LIMIT", 1024 * 1024)),
+        # Seconds between background sweeps for idle containers (0 disables)
+        SANDBOX_REAP_INTERVAL=int(os.environ.get("SANDBOX_REAP_INTERVAL", 30)),
+        # Idle seconds before a session's container is paused (0 disables)
+        SANDBOX_PAUSE_AFTER=int(os.environ.get("SANDBOX_PAUSE_AFTER", 300)),
+        # Where home directories of removed idle sessions are saved (defaults
+        # to a directory under SANDBOX_STATE_DIR), and the most kept per session
+        SANDBOX_HIBERNATE_DIR=os.environ.get("SANDBOX_HIBERNATE_DIR"),
+        SANDBOX_HIBERNATE_LIMIT=int(
+            os.environ.get("SANDBOX_HIBERNATE_LIMIT", 50 * 1024 * 1024)
+        ),
+        # Directory for state shared by workers (activity, job results); must be
+        # local to the host. Defaults to a directory under the system tempdir
+        SANDBOX_STATE_DIR=os.environ.get("SANDBOX_STATE_DIR"),
+        # Threads per worker running background jobs, and how many more
+        # jobs may wait for a thread before new ones are refused
+        SANDBOX_JOB_WORKERS=int(os.environ.get("SANDBOX_JOB_WORKERS", 8)),
+        SANDBOX_JOB_QUEUE=int(os.environ.get("SANDBOX_JOB_QUEUE", 32)),
+        # Host budgets for sandbox containers; memory and CPUs default to
+        # what the Docker host reports
+        SANDBOX_MAX_CONTAINERS=int(os.environ.get("SANDBOX_MAX_CONTAINERS", 50)),
+        SANDBOX_MEMORY_BUDGET=os.environ.get("SANDBOX_MEMORY_BUDGET"),
+        SANDBOX_CPU_BUDGET=float(os.environ.get("SANDBOX_CPU_BUDGET", 0)),
+        # Commands each worker runs at once
+        SANDBOX_MAX_EXECS=int(os.environ.get("SANDBOX_MAX_EXECS", 32)),
+        # Commands each worker's event loop runs at once when served by asgi.py
+        SANDBOX_ASYNC_MAX_EXECS=int(os.environ.get("SANDBOX_ASYNC_MAX_EXECS", 1000)),
+        # Token buckets for commands and resets: refill per second and
+        # burst size, per session and per client IP (0 rate disables)
+        SANDBOX_RATE=float(os.environ.get("SANDBOX_RATE", 2)),
+        SANDBOX_BURST=float(os.environ.get("SANDBOX_BURST", 10)),
+        SANDBOX_IP_RATE=float(os.environ.get("SANDBOX_IP_RATE", 20)),
+        SANDBOX_IP_BURST=float(os.environ.get("SANDBOX_IP_BURST", 100)),
+        # Results of pure commands (fixed text, root-owned image files) kept
+        # in memory per worker and served to sessions with nothing of their
+        # own yet (0 disables)
+        SANDBOX_RESULT_CACHE=int(os.environ.get("SANDBOX_RESULT_CACHE", 256)),
         # Session configuration
         SESSION_COOKIE_SECURE=os.environ.get("FLASK_ENV") == "production",
         SESSION_COOKIE_HTTPONLY=True,
@@ -26,6 +84,19 @@ def create_app(config=None):
     if config:
         app.config.update(config)
 
+    # Configure the shared session sandbox, background jobs, rate limits
+    # and result cache
+    from app.terminal.async_sandbox import async_sandbox
+    from app.terminal.jobs import job_manager
+    from app.terminal.rate_limit import rate_limiter
+    from app.terminal.result_cache import result_cache
+    from app.terminal.sandboxes import sandbox_backend
+    sandbox_backend.init_app(app)
+    async_sandbox.init_app(app)
+    job_manager.init_app(app)
+    rate_limiter.init_app(app)
+    result_cache.init_app(app)
+
     # Register blueprints
     from app.routes.main import main_bp
     from app.routes.concepts import concepts_bp
@@ -0,0 +1,106 @@
+"""ASGI application: sandbox routes on an event loop, the rest on Flask."""
+
+import asyncio
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+from app import create_app
+from app.routes.playground_async import AsyncPlayground, read_body
+
+
+class WsgiBridge:
+    """
+    Serves a WSGI application to an ASGI server from a thread pool.
+
+    asgiref's WsgiToAsgi runs every request on one shared thread, so a
+    slow page would hold up all the others; here each request gets a
+    thread of its own, up to `threads` at once. Responses are buffered,
+    which suits Flask's pages; streamed responses belong to the event
+    loop routes.
+    """
+
+    def __init__(self, wsgi_app, threads: int = 16):
+        """
+        Args:
+            wsgi_app: WSGI application to serve
+            threads: Most requests handled at once
+        """
+        self.wsgi_app = wsgi_app
+        self._executor = ThreadPoolExecutor(threads, thread_name_prefix="wsgi")
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            if scope["type"] == "websocket":
+                await send({"type": "websocket.close", "code": 1000})
+            return
+        body = await read_body(receive)
+        loop = asyncio.get_running_loop()
+        status, headers, content = await loop.run_in_executor(
+            self._executor, self._run, self._environ(scope, body)
+        )
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": content})
+
+    def _run(self, environ: Dict[str, Any]) -> Tuple[int, List[Tuple[bytes, bytes]], bytes]:
+        """Call the WSGI application and collect its whole response."""
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and started:
+                raise exc_info[1].with_traceback(exc_info[2])
+            started["status"] = int(status.split(" ", 1)[0])
+            started["headers"] = [
+                (name.lower().encode("latin-1"), value.encode("latin-1"))
+                for name, value in headers
+            ]
+
+        result = self.wsgi_app(environ, start_response)
+        try:
+            content = b"".join(result)
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+        return started["status"], started["headers"], content
+
+    @staticmethod
+    def _environ(scope, body: bytes) -> Dict[str, Any]:
+        """WSGI environ for an ASGI HTTP request."""
+        server = scope.get("server") or ("localhost", 80)
+        client = scope.get("client") or ("", 0)
+        environ = {
+            "REQUEST_METHOD": scope["method"],
+            "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+            "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+            "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+            "SERVER_NAME": server[0],
+            "SERVER_PORT": str(server[1]),
+            "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+            "REMOTE_ADDR": client[0],
+            "REMOTE_PORT": str(client[1]),
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": scope.get("scheme", "http"),
+            "wsgi.input": io.BytesIO(body),
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": True,
+            "wsgi.run_once": False,
+        }
+        for name, value in scope.get("headers", []):
+            name = name.decode("latin-1").upper().replace("-", "_")
+            value = value.decode("latin-1")
+            if name == "CONTENT_TYPE":
+                key = "CONTENT_TYPE"
+            elif name == "CONTENT_LENGTH":
+                key = "CONTENT_LENGTH"
+            else:
+                key = f"HTTP_{name}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+        return environ
+
+
+def create_asgi_app(config=None):
+    """Create the Flask application and serve it with the event loop sandbox routes."""
+    flask_app = create_app(config)
+    return AsyncPlayground(flask_app, WsgiBridge(flask_app))
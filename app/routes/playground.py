@@ -1,10 +1,62 @@
 """Playground routes - interactive terminal with session-based containers."""
 
+import json
 import uuid
-from flask import Blueprint, render_template, request, jsonify, current_app, session
-from app.terminal.session_sandbox import session_sandbox
+from functools import partial
+from flask import (
+    Blueprint,
+    Response,
+    render_template,
+    request,
+    jsonify,
+    current_app,
+    session,
+    stream_with_context,
+)
+from flask_sock import Sock
+from app.terminal.jobs import job_manager
+from app.terminal.pty_bridge import bridge_pty
+from app.terminal.rate_limit import rate_limiter
+from app.terminal.sandboxes import sandbox_backend
 
 playground_bp = Blueprint("playground", __name__)
+sock = Sock()
+
+# Security: Basic command filtering
+BLOCKED_COMMANDS = ["rm -rf /", ":(){ :|:& };:", "dd if=/dev/zero"]
+
+# Longest a job status request may wait for the job to finish
+MAX_JOB_WAIT_SECONDS = 25
+
+# Most commands accepted in one batch
+MAX_BATCH_COMMANDS = 20
+
+
+def is_blocked(command: str) -> bool:
+    """Check a command against the sandbox blocklist."""
+    return any(blocked in command for blocked in BLOCKED_COMMANDS)
+
+
+def _json_result(result: dict):
+    """JSON response for a sandbox result; 429 with Retry-After when at capacity."""
+    response = jsonify(result)
+    if "retry_after" in result:
+        response.status_code = 429
+        response.headers["Retry-After"] = str(result["retry_after"])
+    return response
+
+
+def _rate_limited(cost: int = 1):
+    """429 response if this session or client address is over its rate limit."""
+    wait = rate_limiter.check(session.get("sandbox_id"), request.remote_addr, cost)
+    if not wait:
+        return None
+    return _json_result({
+        "success": False,
+        "error": "Too many commands. Please slow down.",
+        "output": "",
+        "retry_after": wait,
+    })
 
 
 @playground_bp.before_request
@@ -13,6 +65,9 @@ def ensure_session():
     if "sandbox_id" not in session:
         session["sandbox_id"] = str(uuid.uuid4())[:8]
         session.permanent = True
+    # Start warming containers and watching Docker events once the
+    # playground is actually in use
+    sandbox_backend.start()
 
 
 @playground_bp.route("/")
@@ -38,23 +93,26 @@ def execute():
     if not command:
         return jsonify({"error": "No command provided", "output": ""})
 
-    # Security: Basic command filtering
-    blocked_commands = ["rm -rf /", ":(){ :|:& };:", "dd if=/dev/zero"]
-    for blocked in blocked_commands:
-        if blocked in command:
-            return jsonify({
-                "error": "This command is not allowed in the sandbox",
-                "output": "",
-            })
+    if is_blocked(command):
+        return jsonify({
+            "error": "This command is not allowed in the sandbox",
+            "output": "",
+        })
+
+    limited = _rate_limited()
+    if limited:
+        return limited
 
     try:
         session_id = session.get("sandbox_id")
-        result = session_sandbox.execute_command(
+        result = sandbox_backend.execute_command(
             session_id=session_id,
             command=command,
             image=current_app.config.get("DOCKER_IMAGE", "linux-sandbox:latest"),
+            timeout=current_app.config.get("DOCKER_TIMEOUT", 30),
+            output_limit=current_app.config.get("SANDBOX_OUTPUT_LIMIT", 1024 * 1024),
         )
-        return jsonify(result)
+        return _json_result(result)
     except Exception as e:
         return jsonify({
             "error": str(e),
@@ -62,6 +120,215 @@ def execute():
         })
 
 
+@playground_bp.route("/execute/batch", methods=["POST"])
+def execute_batch():
+    """
+    Execute a list of commands in order and return all their results.
+
+    Takes `{"commands": [...]}` and runs them one after another in the
+    session's shell in a single round trip, e.g. to run every example of
+    a concept. Each command counts against the rate limit.
+    """
+    data = request.get_json()
+    commands = data.get("commands") if isinstance(data, dict) else None
+
+    if not isinstance(commands, list) or not all(isinstance(c, str) for c in commands):
+        return jsonify({"error": "Expected a list of commands", "results": []}), 400
+    commands = [command.strip() for command in commands if command.strip()]
+    if not commands:
+        return jsonify({"error": "No commands provided", "results": []}), 400
+    if len(commands) > MAX_BATCH_COMMANDS:
+        return jsonify({
+            "error": f"At most {MAX_BATCH_COMMANDS} commands can run in one batch",
+            "results": [],
+        }), 400
+
+    if any(is_blocked(command) for command in commands):
+        return jsonify({
+            "error": "This command is not allowed in the sandbox",
+            "results": [],
+        }), 400
+
+    limited = _rate_limited(cost=len(commands))
+    if limited:
+        return limited
+
+    try:
+        result = sandbox_backend.execute_batch(
+            session_id=session.get("sandbox_id"),
+            commands=commands,
+            image=current_app.config.get("DOCKER_IMAGE", "linux-sandbox:latest"),
+            timeout=current_app.config.get("DOCKER_TIMEOUT", 30),
+            output_limit=current_app.config.get("SANDBOX_OUTPUT_LIMIT", 1024 * 1024),
+        )
+        for command, command_result in zip(commands, result["results"]):
+            command_result["command"] = command
+        return _json_result(result)
+    except Exception as e:
+        return jsonify({"error": str(e), "results": []})
+
+
+@playground_bp.route("/execute/stream", methods=["POST"])
+def execute_stream():
+    """
+    Execute a command and stream its output as Server-Sent Events.
+
+    Emits `output` events carrying chunks as the command produces them,
+    followed by one `done` event with the exit code and any error.
+    """
+    data = request.get_json()
+    command = data.get("command", "").strip()
+
+    def sse(event: str, payload: dict) -> str:
+        return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+    if not command:
+        error = "No command provided"
+    elif is_blocked(command):
+        error = "This command is not allowed in the sandbox"
+    else:
+        error = None
+
+    session_id = session.get("sandbox_id")
+    image = current_app.config.get("DOCKER_IMAGE", "linux-sandbox:latest")
+    timeout = current_app.config.get("DOCKER_TIMEOUT", 30)
+    output_limit = current_app.config.get("SANDBOX_OUTPUT_LIMIT", 1024 * 1024)
+
+    if not error:
+        limited = _rate_limited()
+        if limited:
+            return limited
+
+        # Queue for a container before committing to a stream, so a full
+        # host can still answer with a 429 (cached results and commands
+        # for the shared lane need none)
+        if (
+            not sandbox_backend.can_use_lane(session_id, command)
+            and sandbox_backend.cached_result(session_id, command, image) is None
+        ):
+            container_result = sandbox_backend.get_or_create_container(session_id, image)
+            if "retry_after" in container_result:
+                return _json_result(container_result)
+
+    def generate():
+        if error:
+            yield sse("done", {
+                "exit_code": -1, "timed_out": False, "truncated": False, "error": error,
+            })
+            return
+        try:
+            for event in sandbox_backend.stream_command(
+                session_id=session_id,
+                command=command,
+                image=image,
+                timeout=timeout,
+                output_limit=output_limit,
+            ):
+                if "output" in event:
+                    yield sse("output", event)
+                else:
+                    yield sse("done", event)
+        except Exception as e:
+            yield sse("done", {
+                "exit_code": -1, "timed_out": False, "truncated": False, "error": str(e),
+            })
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # Stop reverse proxies from buffering the stream
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+
+@playground_bp.route("/jobs", methods=["POST"])
+def submit_job():
+    """
+    Queue a command to run in the background and return its job id.
+
+    The command runs on a bounded thread pool instead of in the request,
+    so slow commands don't tie up web workers. Fetch the result from
+    GET /playground/jobs/<job_id>.
+    """
+    data = request.get_json()
+    command = data.get("command", "").strip()
+
+    if not command:
+        return jsonify({"success": False, "error": "No command provided"}), 400
+
+    if is_blocked(command):
+        return jsonify({
+            "success": False,
+            "error": "This command is not allowed in the sandbox",
+        }), 400
+
+    limited = _rate_limited()
+    if limited:
+        return limited
+
+    session_id = session.get("sandbox_id")
+    result = job_manager.submit(
+        session_id,
+        partial(
+            sandbox_backend.execute_command,
+            session_id=session_id,
+            command=command,
+            image=current_app.config.get("DOCKER_IMAGE", "linux-sandbox:latest"),
+            timeout=current_app.config.get("DOCKER_TIMEOUT", 30),
+            output_limit=current_app.config.get("SANDBOX_OUTPUT_LIMIT", 1024 * 1024),
+        ),
+    )
+    if not result.get("success"):
+        return jsonify(result), 429
+    return jsonify(result), 202
+
+
+@playground_bp.route("/jobs/<job_id>")
+def job_status(job_id):
+    """
+    Get a job's status and, once it is done, its result.
+
+    Pass `?wait=N` to long-poll: the request returns as soon as the job
+    finishes, or after N seconds (at most 25) with the current status.
+    """
+    try:
+        wait = float(request.args.get("wait", 0))
+    except ValueError:
+        wait = 0
+    wait = min(max(wait, 0), MAX_JOB_WAIT_SECONDS)
+
+    job = job_manager.get(job_id, session.get("sandbox_id"), wait=wait)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+
+@sock.route("/terminal", bp=playground_bp)
+def terminal_socket(ws):
+    """
+    Interactive tty terminal over a WebSocket.
+
+    Bridges the browser terminal to a bash process on a real tty in the
+    user's session container, so full-screen tools like htop, less and
+    nano work. Initial size comes from the `cols`/`rows` query parameters.
+    """
+    session_id = session.get("sandbox_id")
+    result = sandbox_backend.open_pty(
+        session_id,
+        cols=request.args.get("cols", 80, type=int),
+        rows=request.args.get("rows", 24, type=int),
+        image=current_app.config.get("DOCKER_IMAGE", "linux-sandbox:latest"),
+    )
+    if not result.get("success"):
+        ws.send(json.dumps({"type": "error", "error": result.get("error")}))
+        return
+
+    bridge_pty(ws, result["pty"])
+
+
 @playground_bp.route("/status")
 def sandbox_status():
     """Check sandbox container status for current session."""
@@ -73,18 +340,22 @@ def sandbox_status():
             "id": None,
         })
 
-    status = session_sandbox.get_session_status(session_id)
+    status = sandbox_backend.get_session_status(session_id)
     return jsonify(status)
 
 
 @playground_bp.route("/reset", methods=["POST"])
 def reset_sandbox():
     """Reset the sandbox to a clean state for current session."""
+    limited = _rate_limited()
+    if limited:
+        return limited
+
     try:
         session_id = session.get("sandbox_id")
         image = current_app.config.get("DOCKER_IMAGE", "linux-sandbox:latest")
-        result = session_sandbox.reset_session(session_id, image)
-        return jsonify(result)
+        result = sandbox_backend.reset_session(session_id, image)
+        return _json_result(result)
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
 
@@ -92,15 +363,15 @@ def reset_sandbox():
 @playground_bp.route("/cleanup", methods=["POST"])
 def cleanup_expired():
     """
-    Clean up expired session containers.
+    Sweep all expired session containers now.
 
-    This endpoint can be called by a cron job or scheduler to remove
-    containers that have been idle for more than 30 minutes.
+    Idle containers are removed automatically by the sandbox's background
+    reaper; this endpoint is only needed for a manual full sweep.
 
     For security, this should be protected in production (e.g., API key).
     """
     try:
-        result = session_sandbox.cleanup_expired()
+        result = sandbox_backend.cleanup_expired()
         return jsonify({
             "success": True,
             **result,
@@ -117,7 +388,7 @@ def list_sessions():
     For debugging and monitoring. Should be protected in production.
     """
     try:
-        result = session_sandbox.list_active_sessions()
+        result = sandbox_backend.list_active_sessions()
         return jsonify(result)
     except Exception as e:
         return jsonify({"error": str(e), "sessions": []})
@@ -0,0 +1,519 @@
+"""Playground sandbox routes served on an asyncio event loop."""
+
+import asyncio
+import json
+from typing import Any, Awaitable, Callable, Dict, Optional
+from urllib.parse import parse_qs
+
+from itsdangerous import BadSignature
+from werkzeug.http import parse_cookie
+
+from app.routes.playground import MAX_BATCH_COMMANDS, is_blocked
+from app.terminal.async_sandbox import async_sandbox
+from app.terminal.jobs import job_manager
+from app.terminal.rate_limit import rate_limiter
+from app.terminal.sandboxes import sandbox_backend
+
+Scope = Dict[str, Any]
+Receive = Callable[[], Awaitable[Dict[str, Any]]]
+Send = Callable[[Dict[str, Any]], Awaitable[None]]
+ASGIApp = Callable[[Scope, Receive, Send], Awaitable[None]]
+
+
+class Request:
+    """The parts of an ASGI request the sandbox routes use."""
+
+    def __init__(self, scope: Scope, session_id: str, body: bytes = b""):
+        self.scope = scope
+        self.session_id = session_id
+        self.body = body
+
+    @property
+    def remote_addr(self) -> Optional[str]:
+        client = self.scope.get("client")
+        return client[0] if client else None
+
+    def get_json(self) -> Any:
+        """Decoded JSON body, or None if it isn't valid JSON."""
+        try:
+            return json.loads(self.body)
+        except ValueError:
+            return None
+
+
+class AsyncPlayground:
+    """
+    ASGI application serving the playground's sandbox endpoints on the event loop.
+
+    Commands (plain, batched, streamed and background jobs), the
+    terminal WebSocket, status, reset and cleanup go through the
+    AsyncSessionSandbox, with the same requests and responses as the
+    Flask routes, so each session's commands share one shell. Every
+    other request goes to `fallback`, the Flask app, as do sandbox
+    requests without a session cookie yet, so Flask hands out the
+    session.
+    """
+
+    PREFIX = "/playground"
+
+    def __init__(self, flask_app, fallback: ASGIApp):
+        """
+        Args:
+            flask_app: Flask application, for its config and session cookie
+            fallback: ASGI application serving everything else
+        """
+        self.flask_app = flask_app
+        self.fallback = fallback
+        self._routes = {
+            ("POST", "/execute"): self.execute,
+            ("POST", "/execute/batch"): self.execute_batch,
+            ("POST", "/execute/stream"): self.execute_stream,
+            ("POST", "/jobs"): self.submit_job,
+            ("GET", "/status"): self.status,
+            ("POST", "/reset"): self.reset,
+            ("POST", "/cleanup"): self.cleanup,
+        }
+        self._pruner: Optional[asyncio.Future] = None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        path = scope.get("path", "")
+        if scope["type"] == "websocket":
+            if path == f"{self.PREFIX}/terminal":
+                await self.terminal(scope, receive, send)
+            else:
+                await send({"type": "websocket.close", "code": 1000})
+            return
+
+        handler = None
+        if path.startswith(self.PREFIX):
+            handler = self._routes.get((scope["method"], path[len(self.PREFIX):]))
+        session_id = self._session_id(scope) if handler else None
+        if session_id is None:
+            await self.fallback(scope, receive, send)
+            return
+        request = Request(scope, session_id, await read_body(receive))
+        await handler(request, receive, send)
+
+    # Routes
+
+    async def execute(self, request: Request, receive: Receive, send: Send) -> None:
+        """Execute a command in the user's session container."""
+        data = request.get_json()
+        if not isinstance(data, dict):
+            await send_json(send, {"error": "Expected a JSON object", "output": ""}, 400)
+            return
+        command = data.get("command", "").strip()
+
+        if not command:
+            await send_json(send, {"error": "No command provided", "output": ""})
+            return
+
+        if is_blocked(command):
+            await send_json(send, {
+                "error": "This command is not allowed in the sandbox",
+                "output": "",
+            })
+            return
+
+        limited = self._rate_limited(request)
+        if limited:
+            await send_result(send, limited)
+            return
+
+        try:
+            result = await async_sandbox.execute_command(
+                session_id=request.session_id,
+                command=command,
+                **self._command_options(),
+            )
+            await send_result(send, result)
+        except Exception as e:
+            await send_json(send, {"error": str(e), "output": ""})
+
+    async def execute_batch(self, request: Request, receive: Receive, send: Send) -> None:
+        """Execute a list of commands in order and return all their results."""
+        data = request.get_json()
+        commands = data.get("commands") if isinstance(data, dict) else None
+
+        if not isinstance(commands, list) or not all(isinstance(c, str) for c in commands):
+            await send_json(send, {"error": "Expected a list of commands", "results": []}, 400)
+            return
+        commands = [command.strip() for command in commands if command.strip()]
+        if not commands:
+            await send_json(send, {"error": "No commands provided", "results": []}, 400)
+            return
+        if len(commands) > MAX_BATCH_COMMANDS:
+            await send_json(send, {
+                "error": f"At most {MAX_BATCH_COMMANDS} commands can run in one batch",
+                "results": [],
+            }, 400)
+            return
+
+        if any(is_blocked(command) for command in commands):
+            await send_json(send, {
+                "error": "This command is not allowed in the sandbox",
+                "results": [],
+            }, 400)
+            return
+
+        limited = self._rate_limited(request, cost=len(commands))
+        if limited:
+            await send_result(send, limited)
+            return
+
+        try:
+            result = await async_sandbox.execute_batch(
+                session_id=request.session_id,
+                commands=commands,
+                **self._command_options(),
+            )
+            for command, command_result in zip(commands, result["results"]):
+                command_result["command"] = command
+            await send_result(send, result)
+        except Exception as e:
+            await send_json(send, {"error": str(e), "results": []})
+
+    async def execute_stream(self, request: Request, receive: Receive, send: Send) -> None:
+        """Execute a command and stream its output as Server-Sent Events."""
+        data = request.get_json()
+        command = data.get("command", "").strip() if isinstance(data, dict) else ""
+
+        if not command:
+            error = "No command provided"
+        elif is_blocked(command):
+            error = "This command is not allowed in the sandbox"
+        else:
+            error = None
+
+        session_id = request.session_id
+        options = self._command_options()
+
+        if not error:
+            limited = self._rate_limited(request)
+            if limited:
+                await send_result(send, limited)
+                return
+
+            # Queue for a container before committing to a stream, so a full
+            # host can still answer with a 429 (cached results and commands
+            # for the shared lane need none)
+            in_lane = await asyncio.to_thread(
+                sandbox_backend.can_use_lane, session_id, command
+            )
+            cached = None if in_lane else await asyncio.to_thread(
+                sandbox_backend.cached_result, session_id, command, options["image"]
+            )
+            if not in_lane and cached is None:
+                container_result = await asyncio.to_thread(
+                    sandbox_backend.get_or_create_container, session_id, options["image"]
+                )
+                if "retry_after" in container_result:
+                    await send_result(send, container_result)
+                    return
+
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream; charset=utf-8"),
+                (b"cache-control", b"no-cache"),
+                # Stop reverse proxies from buffering the stream
+                (b"x-accel-buffering", b"no"),
+            ],
+        })
+        disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+        try:
+            if error:
+                await send_sse(send, "done", {
+                    "exit_code": -1, "timed_out": False, "truncated": False, "error": error,
+                })
+            else:
+                events = async_sandbox.stream_command(
+                    session_id=session_id, command=command, **options
+                )
+                try:
+                    async for event in events:
+                        if disconnected.done():
+                            # Stop the command; nobody is listening
+                            break
+                        await send_sse(send, "output" if "output" in event else "done", event)
+                except Exception as e:
+                    await send_sse(send, "done", {
+                        "exit_code": -1, "timed_out": False, "truncated": False, "error": str(e),
+                    })
+                finally:
+                    await events.aclose()
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            disconnected.cancel()
+
+    async def submit_job(self, request: Request, receive: Receive, send: Send) -> None:
+        """
+        Queue a command to run in the background and return its job id.
+
+        The job waits on one of the job manager's threads while the
+        command runs on the event loop, in the session's shell. Results
+        are fetched from the Flask route.
+        """
+        data = request.get_json()
+        command = data.get("command", "").strip() if isinstance(data, dict) else ""
+
+        if not command:
+            await send_json(send, {"success": False, "error": "No command provided"}, 400)
+            return
+
+        if is_blocked(command):
+            await send_json(send, {
+                "success": False,
+                "error": "This command is not allowed in the sandbox",
+            }, 400)
+            return
+
+        limited = self._rate_limited(request)
+        if limited:
+            await send_result(send, limited)
+            return
+
+        loop = asyncio.get_running_loop()
+        options = self._command_options()
+
+        def run() -> Dict[str, Any]:
+            return asyncio.run_coroutine_threadsafe(
+                async_sandbox.execute_command(request.session_id, command, **options), loop
+            ).result()
+
+        result = await asyncio.to_thread(job_manager.submit, request.session_id, run)
+        await send_json(send, result, 202 if result.get("success") else 429)
+
+    async def status(self, request: Request, receive: Receive, send: Send) -> None:
+        """Check sandbox container status for current session."""
+        await send_json(send, await async_sandbox.get_session_status(request.session_id))
+
+    async def reset(self, request: Request, receive: Receive, send: Send) -> None:
+        """Reset the sandbox to a clean state for current session."""
+        limited = self._rate_limited(request)
+        if limited:
+            await send_result(send, limited)
+            return
+
+        try:
+            result = await async_sandbox.reset_session(
+                request.session_id, self._command_options()["image"]
+            )
+            await send_result(send, result)
+        except Exception as e:
+            await send_json(send, {"success": False, "error": str(e)})
+
+    async def cleanup(self, request: Request, receive: Receive, send: Send) -> None:
+        """Sweep all expired session containers now."""
+        try:
+            result = await async_sandbox.cleanup_expired()
+            await send_json(send, {"success": True, **result})
+        except Exception as e:
+            await send_json(send, {"success": False, "error": str(e)})
+
+    async def terminal(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """
+        Interactive tty terminal over a WebSocket.
+
+        Same protocol as the Flask route: see `pty_bridge.bridge_pty`.
+        """
+        message = await receive()
+        if message["type"] != "websocket.connect":
+            return
+        session_id = self._session_id(scope)
+        if session_id is None:
+            # The playground page sets up the session before connecting
+            await send({"type": "websocket.close", "code": 1008})
+            return
+        await send({"type": "websocket.accept"})
+
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        result = await async_sandbox.open_pty(
+            session_id,
+            cols=_int_arg(query, "cols", 80),
+            rows=_int_arg(query, "rows", 24),
+            image=self._command_options()["image"],
+        )
+        if not result.get("success"):
+            await send({
+                "type": "websocket.send",
+                "text": json.dumps({"type": "error", "error": result.get("error")}),
+            })
+            await send({"type": "websocket.close", "code": 1000})
+            return
+
+        await bridge_pty(receive, send, result["pty"])
+
+    # Helpers
+
+    def _session_id(self, scope: Scope) -> Optional[str]:
+        """The sandbox id in the request's Flask session cookie, if any."""
+        app = self.flask_app
+        cookies = {}
+        for name, value in scope.get("headers", []):
+            if name == b"cookie":
+                cookies.update(parse_cookie(value.decode("latin-1")))
+        cookie = cookies.get(app.config["SESSION_COOKIE_NAME"])
+        serializer = app.session_interface.get_signing_serializer(app)
+        if not cookie or serializer is None:
+            return None
+        try:
+            data = serializer.loads(
+                cookie, max_age=int(app.permanent_session_lifetime.total_seconds())
+            )
+        except BadSignature:
+            return None
+        return data.get("sandbox_id")
+
+    def _command_options(self) -> Dict[str, Any]:
+        config = self.flask_app.config
+        return {
+            "image": config.get("DOCKER_IMAGE", "linux-sandbox:latest"),
+            "timeout": config.get("DOCKER_TIMEOUT", 30),
+            "output_limit": config.get("SANDBOX_OUTPUT_LIMIT", 1024 * 1024),
+        }
+
+    def _rate_limited(self, request: Request, cost: int = 1) -> Optional[Dict[str, Any]]:
+        """Error result if this session or client address is over its rate limit."""
+        wait = rate_limiter.check(request.session_id, request.remote_addr, cost)
+        if not wait:
+            return None
+        return {
+            "success": False,
+            "error": "Too many commands. Please slow down.",
+            "output": "",
+            "retry_after": wait,
+        }
+
+    async def _lifespan(self, receive: Receive, send: Send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                # Start warming containers and watching Docker events
+                await asyncio.to_thread(sandbox_backend.start)
+                self._pruner = asyncio.ensure_future(self._prune_shells())
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self._pruner is not None:
+                    self._pruner.cancel()
+                async_sandbox.close()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _prune_shells(self) -> None:
+        """Periodically drop shells whose containers the reaper removed."""
+        interval = self.flask_app.config.get("SANDBOX_REAP_INTERVAL", 30)
+        if interval <= 0:
+            return
+        while True:
+            await asyncio.sleep(interval)
+            async_sandbox.prune_shells()
+
+
+async def bridge_pty(receive: Receive, send: Send, pty) -> None:
+    """Pump data between an ASGI WebSocket and a terminal until either side closes."""
+
+    async def pump_output():
+        while True:
+            data = await pty.read()
+            if not data:
+                break
+            await send({"type": "websocket.send", "bytes": data})
+        try:
+            await send({"type": "websocket.send", "text": json.dumps({"type": "exit"})})
+            await send({"type": "websocket.close", "code": 1000})
+        except Exception:
+            pass
+
+    async def pump_input():
+        while True:
+            message = await receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("bytes") is not None:
+                try:
+                    await pty.write(message["bytes"])
+                except OSError:
+                    return
+                continue
+
+            try:
+                control = json.loads(message.get("text") or "")
+            except ValueError:
+                continue
+            if isinstance(control, dict) and control.get("type") == "resize":
+                await pty.resize(int(control.get("cols", 80)), int(control.get("rows", 24)))
+
+    reader = asyncio.ensure_future(pump_output())
+    writer = asyncio.ensure_future(pump_input())
+    try:
+        await asyncio.wait([reader, writer], return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        writer.cancel()
+        pty.close()
+        await asyncio.wait([reader], timeout=1)
+        reader.cancel()
+
+
+async def read_body(receive: Receive) -> bytes:
+    """Read a whole HTTP request body."""
+    body = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        body.append(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    return b"".join(body)
+
+
+async def wait_for_disconnect(receive: Receive) -> None:
+    """Return once the client has gone away."""
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def send_json(send: Send, payload: Any, status: int = 200, headers=()) -> None:
+    """Send a complete JSON response."""
+    body = json.dumps(payload).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            *headers,
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def send_result(send: Send, result: Dict[str, Any]) -> None:
+    """JSON response for a sandbox result; 429 with Retry-After when at capacity."""
+    if "retry_after" in result:
+        await send_json(
+            send, result, 429, [(b"retry-after", str(result["retry_after"]).encode())]
+        )
+    else:
+        await send_json(send, result)
+
+
+async def send_sse(send: Send, event: str, payload: Dict[str, Any]) -> None:
+    """Send one Server-Sent Event of a streamed response."""
+    await send({
+        "type": "http.response.body",
+        "body": f"event: {event}\ndata: {json.dumps(payload)}\n\n".encode(),
+        "more_body": True,
+    })
+
+
+def _int_arg(query: Dict[str, list], name: str, default: int) -> int:
+    try:
+        return int(query[name][0])
+    except (KeyError, IndexError, ValueError):
+        return default
@@ -0,0 +1,269 @@
+"""Docker Engine API exec calls for asyncio event loops."""
+
+import asyncio
+import json
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import quote, urlencode
+
+from docker.errors import DockerException
+
+from app.terminal.engine_client import DEFAULT_SOCKET, EngineClient, api_error
+
+# An open connection to the daemon
+Stream = Tuple[asyncio.StreamReader, asyncio.StreamWriter]
+
+# Errors that mean the connection to the daemon is unusable
+_CONNECTION_ERRORS = (
+    OSError,
+    EOFError,
+    ValueError,
+    asyncio.IncompleteReadError,
+    asyncio.LimitOverrunError,
+    asyncio.TimeoutError,
+)
+
+
+class AsyncEngineClient:
+    """
+    The exec calls of EngineClient, awaitable from an event loop.
+
+    Requests go over keep-alive connections to the daemon's unix socket
+    opened with asyncio, so one thread can have thousands of execs in
+    flight: an attached exec is just an open stream that the loop reads
+    whenever the daemon writes to it.
+
+    Only the calls made for every command are here (exec create, attach,
+    inspect and resize); container lifecycle changes are rare and stay
+    with the blocking clients. Errors are docker-py's exceptions, as
+    with EngineClient. Connections belong to the event loop that opened
+    them, so use a client from a single loop.
+    """
+
+    API_VERSION = EngineClient.API_VERSION
+    READ_SIZE = 65536
+
+    def __init__(
+        self,
+        path: str = DEFAULT_SOCKET,
+        pool_size: int = 64,
+        timeout: Optional[float] = 60,
+    ):
+        """
+        Args:
+            path: Path of the daemon's unix socket
+            pool_size: Most idle connections kept open
+            timeout: Seconds to wait for the daemon on ordinary requests
+        """
+        self.path = path
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._idle: List[Stream] = []
+
+    @classmethod
+    def for_url(cls, url: Optional[str], **kwargs) -> Optional["AsyncEngineClient"]:
+        """
+        Client for a Docker host URL, if it is a unix socket.
+
+        Args:
+            url: Docker host URL such as unix:///var/run/docker.sock; None
+                or "" for the default socket
+
+        Returns:
+            AsyncEngineClient, or None for hosts reached over TCP or SSH
+        """
+        if not url:
+            return cls(DEFAULT_SOCKET, **kwargs)
+        if url.startswith("unix://"):
+            return cls(url[len("unix://"):], **kwargs)
+        return None
+
+    async def exec_create(
+        self,
+        container: str,
+        cmd: Any,
+        stdin: bool = False,
+        tty: bool = False,
+        environment: Optional[Dict[str, str]] = None,
+        workdir: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Create an exec instance; returns {"Id": ...}."""
+        config = {
+            "AttachStdin": stdin,
+            "AttachStdout": True,
+            "AttachStderr": True,
+            "Tty": tty,
+            "Cmd": ["/bin/sh", "-c", cmd] if isinstance(cmd, str) else cmd,
+        }
+        if environment:
+            config["Env"] = [f"{key}={value}" for key, value in environment.items()]
+        if workdir:
+            config["WorkingDir"] = workdir
+        return await self._json("POST", f"/containers/{quote(container)}/exec", config)
+
+    async def exec_attach(self, exec_id: str, tty: bool = False) -> Stream:
+        """
+        Start an exec instance attached to a connection of its own.
+
+        Returns:
+            Reader and writer of the exec's stdio; without a tty the
+            output is in Docker's multiplexed stream format
+        """
+        path = f"/exec/{exec_id}/start"
+        payload = json.dumps({"Detach": False, "Tty": tty}).encode()
+        reader, writer = await self._connect()
+        try:
+            writer.write(
+                self._head("POST", path, payload, {"Connection": "Upgrade", "Upgrade": "tcp"})
+                + payload
+            )
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self.timeout)
+            status, reason, _ = _parse_head(head)
+            # Error bodies are a short JSON message
+            data = (
+                await asyncio.wait_for(reader.read(self.READ_SIZE), self.timeout)
+                if status >= 400
+                else b""
+            )
+        except _CONNECTION_ERRORS as e:
+            writer.close()
+            raise DockerException(f"Error talking to Docker at {self.path}: {e}") from e
+
+        if status >= 400:
+            writer.close()
+            raise api_error(status, path, data, reason)
+        return reader, writer
+
+    async def exec_inspect(self, exec_id: str) -> Dict[str, Any]:
+        """Get an exec instance's state, including ExitCode and Running."""
+        return await self._json("GET", f"/exec/{exec_id}/json")
+
+    async def exec_resize(self, exec_id: str, height: int = None, width: int = None) -> None:
+        """Resize an exec instance's tty."""
+        params = {key: value for key, value in (("h", height), ("w", width)) if value}
+        await self._json("POST", f"/exec/{exec_id}/resize?{urlencode(params)}")
+
+    def close(self) -> None:
+        """Close every idle connection."""
+        while self._idle:
+            self._idle.pop()[1].close()
+
+    # Plumbing
+
+    async def _json(self, method: str, path: str, body: Any = None) -> Any:
+        """Make a request on a pooled connection and decode its JSON reply."""
+        payload = json.dumps(body).encode() if body is not None else b""
+        stream, reused = await self._take()
+        try:
+            try:
+                status, reason, headers, data = await self._request(
+                    stream, method, path, payload
+                )
+            except DockerException:
+                if not reused:
+                    raise
+                # The daemon closed the idle connection; try a fresh one
+                stream = await self._connect()
+                status, reason, headers, data = await self._request(
+                    stream, method, path, payload
+                )
+        except BaseException:
+            stream[1].close()
+            raise
+        if headers.get("connection", "").lower() == "close":
+            stream[1].close()
+        else:
+            self._give_back(stream)
+        if status >= 400:
+            raise api_error(status, path, data, reason)
+        return json.loads(data) if data else None
+
+    async def _request(
+        self, stream: Stream, method: str, path: str, payload: bytes
+    ) -> Tuple[int, str, Dict[str, str], bytes]:
+        reader, writer = stream
+        try:
+            writer.write(self._head(method, path, payload) + payload)
+            return await asyncio.wait_for(self._read_response(reader), self.timeout)
+        except _CONNECTION_ERRORS as e:
+            writer.close()
+            raise DockerException(f"Error talking to Docker at {self.path}: {e}") from e
+
+    async def _read_response(
+        self, reader: asyncio.StreamReader
+    ) -> Tuple[int, str, Dict[str, str], bytes]:
+        status, reason, headers = _parse_head(await reader.readuntil(b"\r\n\r\n"))
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            data = await _read_chunked(reader)
+        elif "content-length" in headers:
+            data = await reader.readexactly(int(headers["content-length"]))
+        elif status < 200 or status in (204, 304):
+            data = b""
+        else:
+            # No length given: the body ends when the daemon hangs up
+            data = await reader.read()
+            headers["connection"] = "close"
+        return status, reason, headers, data
+
+    def _head(
+        self,
+        method: str,
+        path: str,
+        payload: bytes,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> bytes:
+        lines = [f"{method} /v{self.API_VERSION}{path} HTTP/1.1", "Host: localhost"]
+        if payload:
+            lines.append("Content-Type: application/json")
+        if payload or method != "GET":
+            lines.append(f"Content-Length: {len(payload)}")
+        lines.extend(f"{name}: {value}" for name, value in (headers or {}).items())
+        return ("\r\n".join(lines) + "\r\n\r\n").encode()
+
+    async def _take(self) -> Tuple[Stream, bool]:
+        """An idle connection from the pool (reused=True), or a new one."""
+        while self._idle:
+            reader, writer = self._idle.pop()
+            if not reader.at_eof() and not writer.is_closing():
+                return (reader, writer), True
+            writer.close()
+        return await self._connect(), False
+
+    def _give_back(self, stream: Stream) -> None:
+        if len(self._idle) < self.pool_size:
+            self._idle.append(stream)
+        else:
+            stream[1].close()
+
+    async def _connect(self) -> Stream:
+        try:
+            return await asyncio.wait_for(
+                asyncio.open_unix_connection(self.path), self.timeout
+            )
+        except _CONNECTION_ERRORS as e:
+            raise DockerException(f"Error talking to Docker at {self.path}: {e}") from e
+
+
+def _parse_head(head: bytes) -> Tuple[int, str, Dict[str, str]]:
+    """Status, reason and (lower-cased) headers of a response head."""
+    lines = head.decode("latin-1").split("\r\n")
+    parts = lines[0].split(" ", 2)
+    headers = {}
+    for line in lines[1:]:
+        name, separator, value = line.partition(":")
+        if separator:
+            headers[name.strip().lower()] = value.strip()
+    return int(parts[1]), parts[2] if len(parts) > 2 else "", headers
+
+
+async def _read_chunked(reader: asyncio.StreamReader) -> bytes:
+    """Read a body sent with chunked transfer encoding."""
+    chunks = []
+    while True:
+        size = int((await reader.readline()).split(b";")[0], 16)
+        if size == 0:
+            # Skip any trailers, up to the blank line that ends them
+            while (await reader.readline()).strip():
+                pass
+            return b"".join(chunks)
+        chunks.append(await reader.readexactly(size))
+        await reader.readexactly(2)
@@ -0,0 +1,1008 @@
+"""Session sandbox commands on an asyncio event loop."""
+
+import asyncio
+import functools
+import time
+import uuid
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Set
+
+from docker.errors import APIError, DockerException, NotFound
+
+from app.terminal.async_engine import AsyncEngineClient, Stream
+from app.terminal.backend import BACKPRESSURE_KEYS, BackendSwitch, command_result
+from app.terminal.capacity import CapacityManager
+from app.terminal.output import OutputCapture
+from app.terminal.pty_bridge import PtySession
+from app.terminal.result_cache import result_cache
+from app.terminal.session_sandbox import SessionSandbox
+from app.terminal.sandboxes import sandbox_backend
+from app.terminal.shared_lane import SharedLane
+from app.terminal.sharding import ShardedSandbox
+from app.terminal.shell_session import (
+    BatchReader,
+    FrameDecoder,
+    MarkerReader,
+    PersistentShell,
+    ShellClosed,
+)
+
+
+class AsyncShell:
+    """
+    PersistentShell for an event loop.
+
+    Speaks the same protocol (see MarkerReader) over an asyncio stream to
+    the Docker socket, so a command in flight costs an open connection
+    rather than a thread. Create shells with `AsyncShell.start`.
+    """
+
+    READ_SIZE = PersistentShell.READ_SIZE
+    KILL_GRACE_SECONDS = PersistentShell.KILL_GRACE_SECONDS
+
+    def __init__(self, api: AsyncEngineClient, container: str, exec_id: str, stream: Stream):
+        self._api = api
+        self.container = container
+        self._exec_id = exec_id
+        self._stream, self._writer = stream
+        self._marker = uuid.uuid4().hex.encode()
+        self._frames = FrameDecoder()
+        self._reader = MarkerReader(self._marker)
+        self.closed = False
+        self.last_exit_code: Optional[int] = None
+        self.timed_out = False
+        self.pid: Optional[int] = None
+
+    @classmethod
+    async def start(
+        cls, api: AsyncEngineClient, container: str, workdir: str = "/home/learner"
+    ) -> "AsyncShell":
+        """
+        Start bash inside a container.
+
+        Args:
+            api: Asyncio Docker API client
+            container: Container name or id to attach to
+            workdir: Starting directory for the shell
+        """
+        exec_id = (
+            await api.exec_create(
+                container, PersistentShell.SHELL_COMMAND, stdin=True, workdir=workdir
+            )
+        )["Id"]
+        shell = cls(api, container, exec_id, await api.exec_attach(exec_id))
+        try:
+            await shell._send(PersistentShell.SETUP)
+            # Anything the shell printed while starting up precedes the pid
+            shell.pid = int((await shell.run("echo $$"))["output"].split()[-1])
+        except BaseException:
+            shell.close()
+            raise
+        return shell
+
+    @property
+    def hung_up(self) -> bool:
+        """Whether the shell is known to have ended, without reading from it."""
+        return self.closed or self._stream.at_eof()
+
+    async def run(self, command: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Run a command in the shell and wait for it to finish.
+
+        Returns:
+            Dictionary with raw output bytes and exit_code
+
+        Raises:
+            ShellClosed: If the shell exited (e.g. the command was `exit`)
+        """
+        output = []
+        try:
+            async for chunk in self.stream(command, timeout):
+                output.append(chunk)
+        except ShellClosed as e:
+            raise ShellClosed(b"".join(output) + e.output)
+        return {"output": b"".join(output), "exit_code": self.last_exit_code}
+
+    async def stream(
+        self, command: str, timeout: Optional[float] = None
+    ) -> AsyncIterator[bytes]:
+        """
+        Run a command in the shell, yielding output as it arrives.
+
+        Behaves like PersistentShell.stream, timeouts included. Closing
+        the generator early closes the shell.
+
+        Raises:
+            ShellClosed: If the shell exited (e.g. the command was `exit`)
+        """
+        self.last_exit_code = None
+        self.timed_out = False
+        deadline = time.monotonic() + timeout if timeout else None
+        await self._send(self._reader.command(command))
+
+        finished = False
+        kill_stage = 0
+        try:
+            while True:
+                output, status = self._reader.take()
+                if output:
+                    yield output
+                if status is not None:
+                    self.last_exit_code = status
+                    finished = True
+                    return
+
+                try:
+                    chunk = await self._read(deadline)
+                except asyncio.TimeoutError:
+                    deadline = time.monotonic() + self.KILL_GRACE_SECONDS
+                    self.timed_out = True
+                    kill_stage += 1
+                    if kill_stage == 1:
+                        await self._signal_command("INT")
+                        continue
+                    if kill_stage == 2:
+                        await self._signal_command("KILL")
+                        continue
+                    if kill_stage == 3:
+                        # The shell itself is stuck; take it down
+                        await self._exec(["kill", "-KILL", str(self.pid)])
+                        continue
+                    # The container is unresponsive; give up on the shell
+                    chunk = b""
+                if not chunk:
+                    finished = True
+                    self.close()
+                    raise ShellClosed(self._reader.flush())
+                self._reader.feed(chunk)
+        finally:
+            if not finished:
+                self.close()
+
+    async def stream_batch(
+        self, commands: List[str], timeout: Optional[float] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Run several commands in one go, yielding each one's output and status.
+
+        See PersistentShell.stream_batch.
+
+        Raises:
+            ShellClosed: If the shell exited (e.g. a command was `exit`)
+        """
+        reader = BatchReader(self._marker)
+        chunks = self.stream(reader.script(commands), timeout)
+        try:
+            async for chunk in chunks:
+                for event in reader.feed(chunk):
+                    yield event
+        except ShellClosed as e:
+            for event in reader.finish(e.output):
+                yield event
+            raise ShellClosed()
+        finally:
+            await chunks.aclose()
+        for event in reader.finish():
+            yield event
+
+    async def exit_code(self) -> Optional[int]:
+        """Exit code of the shell process once it has ended."""
+        try:
+            return (await self._api.exec_inspect(self._exec_id)).get("ExitCode")
+        except DockerException:
+            return None
+
+    def close(self) -> None:
+        """Close the attach stream, which ends the shell."""
+        if self.closed:
+            return
+        self.closed = True
+        self._writer.close()
+
+    async def _send(self, data: bytes) -> None:
+        try:
+            if self._writer.is_closing():
+                raise ConnectionResetError()
+            self._writer.write(data)
+            await self._writer.drain()
+        except OSError:
+            self.close()
+            raise ShellClosed()
+
+    async def _signal_command(self, signal: str) -> None:
+        """Signal every process started by the shell, then interrupt the shell."""
+        await self._exec(
+            ["/bin/bash", "-c", PersistentShell.SIGNAL_TREE_SCRIPT, str(self.pid), signal]
+        )
+
+    async def _exec(self, cmd: List[str]) -> None:
+        """Run a helper command next to the shell and wait for it to finish."""
+        try:
+            exec_id = (await self._api.exec_create(self.container, cmd))["Id"]
+            reader, writer = await self._api.exec_attach(exec_id)
+            try:
+                while await reader.read(self.READ_SIZE):
+                    pass
+            finally:
+                writer.close()
+        except (DockerException, OSError):
+            pass
+
+    async def _read(self, deadline: Optional[float] = None) -> bytes:
+        """
+        Read the next chunk of output from the multiplexed attach stream.
+
+        Raises:
+            asyncio.TimeoutError: If nothing arrived before the deadline
+        """
+        while True:
+            try:
+                if deadline is None:
+                    data = await self._stream.read(self.READ_SIZE)
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise asyncio.TimeoutError()
+                    data = await asyncio.wait_for(
+                        self._stream.read(self.READ_SIZE), remaining
+                    )
+            except asyncio.TimeoutError:
+                raise
+            except OSError:
+                return b""
+            if not data:
+                return b""
+            output = self._frames.feed(data)
+            if output:
+                return output
+
+
+class AsyncPty:
+    """PtySession for an event loop. Create terminals with `AsyncPty.start`."""
+
+    READ_SIZE = PtySession.READ_SIZE
+
+    def __init__(
+        self,
+        api: AsyncEngineClient,
+        exec_id: str,
+        stream: Stream,
+        on_input: Optional[Callable[[], None]] = None,
+    ):
+        self._api = api
+        self._exec_id = exec_id
+        self._reader, self._writer = stream
+        self._on_input = on_input
+        self.closed = False
+
+    @classmethod
+    async def start(
+        cls,
+        api: AsyncEngineClient,
+        container: str,
+        workdir: str = "/home/learner",
+        cols: int = 80,
+        rows: int = 24,
+        on_input: Optional[Callable[[], None]] = None,
+    ) -> "AsyncPty":
+        """
+        Start bash on a tty inside a container.
+
+        Args:
+            api: Asyncio Docker API client
+            container: Container name or id to run in
+            workdir: Starting directory for the shell
+            cols: Initial terminal width
+            rows: Initial terminal height
+            on_input: Called whenever the user sends input; must not block
+        """
+        exec_id = (
+            await api.exec_create(
+                container,
+                PtySession.SHELL_COMMAND,
+                stdin=True,
+                tty=True,
+                workdir=workdir,
+                environment={"TERM": "xterm-256color"},
+            )
+        )["Id"]
+        pty = cls(api, exec_id, await api.exec_attach(exec_id, tty=True), on_input)
+        await pty.resize(cols, rows)
+        return pty
+
+    async def read(self) -> bytes:
+        """Read terminal output; returns b"" once the shell has exited."""
+        try:
+            return await self._reader.read(self.READ_SIZE)
+        except OSError:
+            return b""
+
+    async def write(self, data: bytes) -> None:
+        """Send keystrokes to the terminal."""
+        if self._on_input is not None:
+            self._on_input()
+        self._writer.write(data)
+        await self._writer.drain()
+
+    async def resize(self, cols: int, rows: int) -> None:
+        """Resize the terminal."""
+        try:
+            await self._api.exec_resize(self._exec_id, height=rows, width=cols)
+        except DockerException:
+            # The process may not have started yet or already exited
+            pass
+
+    def close(self) -> None:
+        """Close the terminal, which hangs up the shell."""
+        if self.closed:
+            return
+        self.closed = True
+        self._writer.close()
+
+
+class _ThreadedPty:
+    """A blocking PtySession behind AsyncPty's interface."""
+
+    def __init__(self, pty: PtySession):
+        self._pty = pty
+
+    @property
+    def closed(self) -> bool:
+        return self._pty.closed
+
+    async def read(self) -> bytes:
+        return await asyncio.to_thread(self._pty.read)
+
+    async def write(self, data: bytes) -> None:
+        await asyncio.to_thread(self._pty.write, data)
+
+    async def resize(self, cols: int, rows: int) -> None:
+        await asyncio.to_thread(self._pty.resize, cols, rows)
+
+    def close(self) -> None:
+        self._pty.close()
+
+
+class AsyncSessionSandbox:
+    """
+    SessionSandbox for an asyncio event loop.
+
+    A command spends nearly all its time waiting, for its exec to start
+    and then for output. Here that waiting happens on the event loop:
+    each session's shell is an asyncio stream to the Docker socket (see
+    AsyncShell), so one worker can have thousands of commands and
+    streams in flight instead of one per thread.
+
+    The containers are the ones the threaded sandbox manages, with the
+    same names, pool, shared lane, result cache, activity records and
+    idle reaper. Creating, resetting and removing containers is rare and
+    involves files and SQLite stores, so those calls run the threaded
+    sandbox's methods in a thread. Docker hosts reached over TCP have no
+    asyncio client; their commands run through the threaded sandbox too,
+    as do all commands when sessions run in Linux namespaces instead of
+    containers (see NamespaceSandbox).
+    """
+
+    DEFAULT_MAX_EXECS = 1000
+
+    def __init__(self, sandbox: BackendSwitch):
+        """
+        Args:
+            sandbox: Threaded sandbox backend managing the sessions
+        """
+        self.sandbox = sandbox
+        self.max_execs = self.DEFAULT_MAX_EXECS
+        self._exec_slots: Optional[asyncio.Semaphore] = None
+        # Striped locks serializing work on a single session's shell
+        self._session_locks = [asyncio.Lock() for _ in range(SessionSandbox.LOCK_STRIPES)]
+        # Attached bash process for each session, used under its session lock
+        self._shells: Dict[str, AsyncShell] = {}
+        # Docker host URL -> asyncio client
+        self._engines: Dict[str, AsyncEngineClient] = {}
+        # Blocking work started in threads without waiting for it
+        self._background: Set[asyncio.Task] = set()
+        # Sessions whose container is being resumed after terminal input
+        self._resuming: Set[str] = set()
+
+    def init_app(self, app) -> None:
+        """Apply the execution limit from the Flask app config."""
+        self.max_execs = app.config.get("SANDBOX_ASYNC_MAX_EXECS", self.max_execs)
+        self._exec_slots = None
+
+    def _session_lock(self, session_id: str) -> asyncio.Lock:
+        """Get the lock stripe guarding a session's shell."""
+        return self._session_locks[hash(session_id) % len(self._session_locks)]
+
+    async def _shard(self, session_id: str) -> Optional[SessionSandbox]:
+        """Docker host holding a session; None when sessions don't run on Docker."""
+        if not isinstance(self.sandbox.backend, ShardedSandbox):
+            return None
+        return await asyncio.to_thread(self.sandbox.backend.shard_for, session_id)
+
+    def _engine(self, shard: Optional[SessionSandbox]) -> Optional[AsyncEngineClient]:
+        """Asyncio client for a host's daemon; None if it has none."""
+        if shard is None or shard.base_url is None:
+            # Only the host's client factory knows where it is
+            return None
+        if shard.base_url not in self._engines:
+            engine = AsyncEngineClient.for_url(shard.base_url)
+            if engine is None:
+                return None
+            self._engines[shard.base_url] = engine
+        return self._engines[shard.base_url]
+
+    async def _acquire_slot(self) -> Optional[asyncio.Semaphore]:
+        """Take an execution slot; returns the semaphore to release, or None if busy."""
+        if self._exec_slots is None:
+            self._exec_slots = asyncio.Semaphore(self.max_execs)
+        slots = self._exec_slots
+        try:
+            await asyncio.wait_for(slots.acquire(), CapacityManager.EXEC_WAIT_SECONDS)
+        except asyncio.TimeoutError:
+            return None
+        return slots
+
+    async def execute_command(
+        self,
+        session_id: str,
+        command: str,
+        workdir: str = "/home/learner",
+        image: str = None,
+        timeout: Optional[float] = None,
+        output_limit: int = OutputCapture.DEFAULT_LIMIT,
+    ) -> Dict[str, Any]:
+        """
+        Execute a command in the session's container.
+
+        See SandboxBackend.execute_command.
+
+        Returns:
+            Dictionary with output, exit_code, timed_out, truncated, and
+            optionally error
+        """
+        output = []
+        result: Dict[str, Any] = {}
+        async for event in self.stream_command(
+            session_id, command, workdir, image, timeout, output_limit
+        ):
+            if "output" in event:
+                output.append(event["output"])
+            else:
+                result = event
+        return command_result(output, result)
+
+    async def stream_command(
+        self,
+        session_id: str,
+        command: str,
+        workdir: str = "/home/learner",
+        image: str = None,
+        timeout: Optional[float] = None,
+        output_limit: int = OutputCapture.DEFAULT_LIMIT,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Execute a command in the session's container, yielding output as it arrives.
+
+        See SessionSandbox.stream_command.
+
+        Yields:
+            Dictionaries with an output chunk, then a final dictionary
+            with exit_code, timed_out, truncated and error
+        """
+        shard = await self._shard(session_id)
+        engine = self._engine(shard)
+        if engine is None:
+            events = _in_thread(
+                self.sandbox.stream_command(
+                    session_id, command, workdir, image, timeout, output_limit
+                )
+            )
+            async for event in events:
+                yield event
+            return
+
+        cached = None
+        cacheable = result_cache.cacheable(command) and not await asyncio.to_thread(
+            shard.has_own_state, session_id
+        )
+        if cacheable:
+            cached = await asyncio.to_thread(shard.cached_result, session_id, command, image)
+        if cached is not None:
+            capture = OutputCapture(output_limit)
+            text = capture.feed(cached["output"].encode()) + capture.finish()
+            if text:
+                yield {"output": text}
+            yield {
+                "exit_code": cached["exit_code"],
+                "timed_out": False,
+                "truncated": capture.truncated,
+                "error": None,
+            }
+            return
+
+        slots = await self._acquire_slot()
+        if slots is None:
+            yield {
+                "exit_code": -1,
+                "timed_out": False,
+                "truncated": False,
+                "error": "The sandbox is busy. Please try again in a moment.",
+                "retry_after": 1,
+            }
+            return
+        try:
+            events = None
+            if shard.can_use_lane(session_id, command):
+                events = await self._stream_in_lane(
+                    engine, shard, command, image, workdir, timeout, output_limit
+                )
+            if events is None:
+                events = self._stream_in_container(
+                    engine, shard, session_id, command, workdir, image, timeout, output_limit
+                )
+            output = []
+            try:
+                async for event in events:
+                    if "output" in event:
+                        output.append(event["output"])
+                    elif cacheable:
+                        await asyncio.to_thread(
+                            shard.remember_result,
+                            command,
+                            image,
+                            {**event, "output": "".join(output)},
+                        )
+                    yield event
+            finally:
+                await events.aclose()
+        finally:
+            slots.release()
+
+    async def _stream_in_lane(
+        self,
+        engine: AsyncEngineClient,
+        shard: SessionSandbox,
+        command: str,
+        image: Optional[str],
+        workdir: str,
+        timeout: Optional[float],
+        output_limit: int,
+    ) -> Optional[AsyncIterator[Dict[str, Any]]]:
+        """Start a read-only command in the shared lane; None if it can't take it."""
+        lane = shard.lane
+        name = lane.pick(image or shard.DEFAULT_IMAGE)
+        if name is None:
+            return None
+        try:
+            exec_id = (
+                await engine.exec_create(name, lane.argv(command, timeout), workdir=workdir)
+            )["Id"]
+            deadline = time.monotonic() + timeout if timeout else None
+            stream = await engine.exec_attach(exec_id)
+        except DockerException:
+            lane.discard(name)
+            return None
+        return self._lane_events(engine, exec_id, stream, deadline, output_limit)
+
+    async def _lane_events(
+        self,
+        engine: AsyncEngineClient,
+        exec_id: str,
+        stream: Stream,
+        deadline: Optional[float],
+        output_limit: int,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        reader, writer = stream
+        frames = FrameDecoder()
+        capture = OutputCapture(output_limit)
+        final = {"exit_code": -1, "timed_out": False, "error": None}
+        try:
+            while True:
+                data = await reader.read(AsyncShell.READ_SIZE)
+                if not data:
+                    break
+                text = capture.feed(frames.feed(data))
+                if text:
+                    yield {"output": text}
+            exit_code = (await engine.exec_inspect(exec_id)).get("ExitCode")
+            final["exit_code"] = exit_code if exit_code is not None else -1
+            # See SharedLane._events
+            final["timed_out"] = (
+                deadline is not None
+                and exit_code in SharedLane.TIMEOUT_EXIT_CODES
+                and time.monotonic() >= deadline
+            )
+        except (DockerException, OSError) as e:
+            final["error"] = str(e)
+        finally:
+            writer.close()
+        text = capture.finish()
+        if text:
+            yield {"output": text}
+        final["truncated"] = capture.truncated
+        yield final
+
+    async def _stream_in_container(
+        self,
+        engine: AsyncEngineClient,
+        shard: SessionSandbox,
+        session_id: str,
+        command: str,
+        workdir: str,
+        image: Optional[str],
+        timeout: Optional[float],
+        output_limit: int,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Run a command in the session's shell; see stream_command."""
+        async with self._session_lock(session_id):
+            container_result = await asyncio.to_thread(
+                shard.get_or_create_container, session_id, image
+            )
+            if not container_result.get("success"):
+                final = {
+                    "exit_code": -1,
+                    "timed_out": False,
+                    "truncated": False,
+                    "error": container_result.get("error"),
+                }
+                for key in BACKPRESSURE_KEYS:
+                    if key in container_result:
+                        final[key] = container_result[key]
+                yield final
+                return
+
+            capture = OutputCapture(output_limit)
+            shell = None
+            chunks = None
+            try:
+                shell = await self._get_shell(
+                    engine, session_id, container_result["container_id"], workdir
+                )
+                chunks = shell.stream(command, timeout)
+                async for chunk in chunks:
+                    text = capture.feed(chunk)
+                    if text:
+                        yield {"output": text}
+                await self._touch(shard, session_id)
+                final = {
+                    "exit_code": shell.last_exit_code,
+                    "timed_out": shell.timed_out,
+                    "error": None,
+                }
+
+            except ShellClosed as e:
+                # The command ended the shell (e.g. `exit`); the next
+                # command starts a fresh one
+                self._close_shell(session_id)
+                text = capture.feed(e.output)
+                if text:
+                    yield {"output": text}
+                exit_code = await shell.exit_code() if shell else None
+                final = {
+                    "exit_code": exit_code if exit_code is not None else -1,
+                    "timed_out": shell.timed_out if shell else False,
+                    "error": None,
+                }
+
+            except NotFound:
+                self._close_shell(session_id)
+                await asyncio.to_thread(shard.container_lost, session_id)
+                final = {
+                    "exit_code": -1,
+                    "timed_out": False,
+                    "error": "Container not found. Please try again.",
+                }
+
+            except APIError as e:
+                # e.g. the container was stopped behind our back
+                self._close_shell(session_id)
+                await asyncio.to_thread(shard.container_lost, session_id)
+                final = {"exit_code": -1, "timed_out": False, "error": str(e)}
+
+            except Exception as e:
+                final = {"exit_code": -1, "timed_out": False, "error": str(e)}
+
+            finally:
+                # Stop reading if the consumer went away mid-command
+                if chunks is not None:
+                    await chunks.aclose()
+
+            text = capture.finish()
+            if text:
+                yield {"output": text}
+            final["truncated"] = capture.truncated
+            yield final
+
+    async def _get_shell(
+        self, engine: AsyncEngineClient, session_id: str, container_id: str, workdir: str
+    ) -> AsyncShell:
+        """Get the session's shell, starting one if it is missing or stale."""
+        shell = self._shells.get(session_id)
+        if shell is not None and (shell.closed or shell.container != container_id):
+            # The container was replaced since the shell was attached
+            shell.close()
+            shell = None
+        if shell is None:
+            shell = await AsyncShell.start(engine, container_id, workdir)
+            self._shells[session_id] = shell
+        return shell
+
+    async def _touch(self, shard: SessionSandbox, session_id: str) -> None:
+        """Record activity after a command ran in the session's running container."""
+        timestamp = shard.touch(session_id)
+        if timestamp is not None:
+            await asyncio.to_thread(shard.activity.touch, session_id, timestamp)
+
+    def _record_input(self, shard: SessionSandbox, session_id: str) -> None:
+        """
+        Record terminal input without holding up the keystroke.
+
+        A container that may be paused is resumed in a thread, one resume
+        at a time per session; keystrokes sent meanwhile wait in the socket.
+        """
+        if not shard.may_be_paused(session_id):
+            timestamp = shard.touch(session_id)
+            if timestamp is not None:
+                self._in_background(functools.partial(shard.activity.touch, session_id, timestamp))
+        elif session_id not in self._resuming:
+            self._resuming.add(session_id)
+            task = self._in_background(functools.partial(shard.resume, session_id))
+            task.add_done_callback(lambda _: self._resuming.discard(session_id))
+
+    def _in_background(self, work: Callable[[], Any]) -> asyncio.Task:
+        """Run blocking work in a thread without waiting for it."""
+        task = asyncio.get_running_loop().create_task(asyncio.to_thread(work))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
+
+    def _close_shell(self, session_id: str) -> None:
+        """Close and forget the session's shell, if any."""
+        shell = self._shells.pop(session_id, None)
+        if shell is not None:
+            shell.close()
+
+    async def execute_batch(
+        self,
+        session_id: str,
+        commands: List[str],
+        workdir: str = "/home/learner",
+        image: str = None,
+        timeout: Optional[float] = None,
+        output_limit: int = OutputCapture.DEFAULT_LIMIT,
+    ) -> Dict[str, Any]:
+        """
+        Execute several commands in order in the session's shell.
+
+        See SessionSandbox.execute_batch.
+
+        Returns:
+            Dictionary with results (output, exit_code and truncated for
+            each command that ran, in order), timed_out, and optionally
+            error
+        """
+        shard = await self._shard(session_id)
+        engine = self._engine(shard)
+        if engine is None:
+            return await asyncio.to_thread(
+                self.sandbox.execute_batch,
+                session_id,
+                commands,
+                workdir,
+                image,
+                timeout,
+                output_limit,
+            )
+
+        slots = await self._acquire_slot()
+        if slots is None:
+            return {
+                "results": [],
+                "timed_out": False,
+                "error": "The sandbox is busy. Please try again in a moment.",
+                "retry_after": 1,
+            }
+        try:
+            async with self._session_lock(session_id):
+                return await self._run_batch(
+                    engine, shard, session_id, commands, workdir, image, timeout, output_limit
+                )
+        finally:
+            slots.release()
+
+    async def _run_batch(
+        self,
+        engine: AsyncEngineClient,
+        shard: SessionSandbox,
+        session_id: str,
+        commands: List[str],
+        workdir: str,
+        image: Optional[str],
+        timeout: Optional[float],
+        output_limit: int,
+    ) -> Dict[str, Any]:
+        """Run a batch in the session's shell; see execute_batch."""
+        container_result = await asyncio.to_thread(
+            shard.get_or_create_container, session_id, image
+        )
+        if not container_result.get("success"):
+            response = {
+                "results": [],
+                "timed_out": False,
+                "error": container_result.get("error"),
+            }
+            for key in BACKPRESSURE_KEYS:
+                if key in container_result:
+                    response[key] = container_result[key]
+            return response
+
+        captures = [OutputCapture(output_limit) for _ in commands]
+        outputs: List[List[str]] = [[] for _ in commands]
+        exit_codes: List[Optional[int]] = [None] * len(commands)
+        # Index of the command that was running when the batch stopped
+        current = 0
+        shell = None
+        error = None
+        try:
+            shell = await self._get_shell(
+                engine, session_id, container_result["container_id"], workdir
+            )
+            async for event in shell.stream_batch(commands, timeout):
+                current = event["index"]
+                if "output" in event:
+                    outputs[current].append(captures[current].feed(event["output"]))
+                else:
+                    exit_codes[current] = event["exit_code"]
+                    current += 1
+            await self._touch(shard, session_id)
+            if current < len(commands):
+                # Interrupted: the shell reports the batch's status
+                exit_codes[current] = shell.last_exit_code
+        except ShellClosed:
+            # A command ended the shell (e.g. `exit`)
+            self._close_shell(session_id)
+            if current < len(commands):
+                exit_code = await shell.exit_code() if shell else None
+                exit_codes[current] = exit_code if exit_code is not None else -1
+        except (NotFound, APIError) as e:
+            self._close_shell(session_id)
+            await asyncio.to_thread(shard.container_lost, session_id)
+            error = (
+                "Container not found. Please try again."
+                if isinstance(e, NotFound)
+                else str(e)
+            )
+        except Exception as e:
+            error = str(e)
+
+        results = []
+        for index, exit_code in enumerate(exit_codes):
+            if exit_code is None:
+                break
+            results.append({
+                "output": "".join(outputs[index]) + captures[index].finish(),
+                "exit_code": exit_code,
+                "truncated": captures[index].truncated,
+            })
+        return {
+            "results": results,
+            "timed_out": shell.timed_out if shell else False,
+            "error": error,
+        }
+
+    async def open_pty(
+        self,
+        session_id: str,
+        cols: int = 80,
+        rows: int = 24,
+        workdir: str = "/home/learner",
+        image: str = None,
+    ) -> Dict[str, Any]:
+        """
+        Open an interactive terminal in the session's container.
+
+        Returns:
+            Dictionary with an AsyncPty (or a terminal with the same
+            methods) under "pty", or an error
+        """
+        shard = await self._shard(session_id)
+        engine = self._engine(shard)
+        if engine is None:
+            result = await asyncio.to_thread(
+                self.sandbox.open_pty, session_id, cols, rows, workdir, image
+            )
+            if result.get("success"):
+                result["pty"] = _ThreadedPty(result["pty"])
+            return result
+
+        container_result = await asyncio.to_thread(
+            shard.get_or_create_container, session_id, image
+        )
+        if not container_result.get("success"):
+            return {"success": False, "error": container_result.get("error")}
+        try:
+            pty = await AsyncPty.start(
+                engine,
+                container_result["container_id"],
+                workdir,
+                cols=cols,
+                rows=rows,
+                on_input=functools.partial(self._record_input, shard, session_id),
+            )
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+        return {"success": True, "pty": pty}
+
+    async def reset_session(self, session_id: str, image: str = None) -> Dict[str, Any]:
+        """
+        Replace the session's container with a clean one.
+
+        See SessionSandbox.reset_session.
+
+        Returns:
+            Dictionary with success status and message
+        """
+        async with self._session_lock(session_id):
+            self._close_shell(session_id)
+            return await asyncio.to_thread(self.sandbox.reset_session, session_id, image)
+
+    async def get_session_status(self, session_id: str) -> Dict[str, Any]:
+        """
+        Get the status of a session's container.
+
+        See SessionSandbox.get_session_status.
+        """
+        return await asyncio.to_thread(self.sandbox.get_session_status, session_id)
+
+    async def cleanup_expired(self) -> Dict[str, Any]:
+        """
+        Remove containers that have been idle for more than IDLE_TIMEOUT_MINUTES.
+
+        See SessionSandbox.cleanup_expired.
+
+        Returns:
+            Dictionary with cleanup results
+        """
+        result = await asyncio.to_thread(self.sandbox.cleanup_expired)
+        for session_id in result.get("removed_sessions", []):
+            self._close_shell(session_id)
+        return result
+
+    def prune_shells(self) -> int:
+        """
+        Forget shells that have ended, e.g. because the reaper removed
+        their container.
+
+        Returns:
+            Number of shells forgotten
+        """
+        ended = [
+            session_id
+            for session_id, shell in self._shells.items()
+            if shell.hung_up and not self._session_lock(session_id).locked()
+        ]
+        for session_id in ended:
+            self._close_shell(session_id)
+        return len(ended)
+
+    def close(self) -> None:
+        """Close every shell and idle Docker connection."""
+        for session_id in list(self._shells):
+            self._close_shell(session_id)
+        for engine in self._engines.values():
+            engine.close()
+
+
+async def _in_thread(events: Iterator[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+    """Iterate a blocking generator without blocking the event loop."""
+    try:
+        while True:
+            event = await asyncio.to_thread(next, events, None)
+            if event is None:
+                return
+            yield event
+    finally:
+        await asyncio.to_thread(events.close)
+
+
+# Singleton instance for the application
+async_sandbox = AsyncSessionSandbox(sandbox_backend)
@@ -0,0 +1,310 @@
+"""Interface shared by the sandbox backends and the switch between them."""
+
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterator, List, Optional
+
+from app.terminal.output import OutputCapture
+
+# Keys describing backpressure that are passed through to clients
+BACKPRESSURE_KEYS = ("queue_position", "eta_seconds", "retry_after")
+
+
+def command_result(output: List[str], final: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Turn a streamed command into the result execute_command returns.
+
+    Args:
+        output: The command's output chunks, in order
+        final: Its final event (empty if the stream ended without one)
+
+    Returns:
+        Dictionary with output, exit_code, timed_out, truncated, and
+        optionally error and backpressure keys
+    """
+    response = {
+        "output": "".join(output),
+        "exit_code": final.get("exit_code", -1),
+        "timed_out": final.get("timed_out", False),
+        "truncated": final.get("truncated", False),
+        "error": final.get("error"),
+    }
+    for key in BACKPRESSURE_KEYS:
+        if key in final:
+            response[key] = final[key]
+    return response
+
+
+class SandboxBackend(ABC):
+    """
+    What the playground needs from a sandbox: one isolated Linux
+    environment per session, with a shell whose state carries over
+    between commands.
+
+    ShardedSandbox runs sessions in Docker containers and
+    NamespaceSandbox in Linux namespaces on the local kernel. Results
+    are the dictionaries documented on SessionSandbox, so routes and
+    jobs work the same with either.
+    """
+
+    def init_app(self, app) -> None:
+        """Apply settings from the Flask app config."""
+
+    def start(self) -> None:
+        """Start background workers (idempotent)."""
+
+    @abstractmethod
+    def get_or_create_container(
+        self, session_id: str, image: str = None
+    ) -> Dict[str, Any]:
+        """
+        Make sure the session's environment is running.
+
+        Returns:
+            Dictionary with success and container_id, or an error (with
+            backpressure keys when the host is full)
+        """
+
+    def execute_command(
+        self,
+        session_id: str,
+        command: str,
+        workdir: str = "/home/learner",
+        image: str = None,
+        timeout: Optional[float] = None,
+        output_limit: int = OutputCapture.DEFAULT_LIMIT,
+    ) -> Dict[str, Any]:
+        """
+        Execute a command in the session's environment.
+
+        Returns:
+            Dictionary with output, exit_code, timed_out, truncated, and
+            optionally error
+        """
+        output = []
+        result: Dict[str, Any] = {}
+        for event in self.stream_command(
+            session_id, command, workdir, image, timeout, output_limit
+        ):
+            if "output" in event:
+                output.append(event["output"])
+            else:
+                result = event
+        return command_result(output, result)
+
+    @abstractmethod
+    def stream_command(
+        self,
+        session_id: str,
+        command: str,
+        workdir: str = "/home/learner",
+        image: str = None,
+        timeout: Optional[float] = None,
+        output_limit: int = OutputCapture.DEFAULT_LIMIT,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Execute a command, yielding output as it arrives.
+
+        Yields:
+            Dictionaries with an output chunk, then a final dictionary
+            with exit_code, timed_out, truncated and error
+        """
+
+    @abstractmethod
+    def execute_batch(
+        self,
+        session_id: str,
+        commands: List[str],
+        workdir: str = "/home/learner",
+        image: str = None,
+        timeout: Optional[float] = None,
+        output_limit: int = OutputCapture.DEFAULT_LIMIT,
+    ) -> Dict[str, Any]:
+        """
+        Execute several commands in order in the session's shell.
+
+        Returns:
+            Dictionary with results, timed_out, and optionally error
+        """
+
+    def cached_result(
+        self, session_id: str, command: str, image: str = None
+    ) -> Optional[Dict[str, Any]]:
+        """A remembered result that answers the command without running it, if any."""
+        return None
+
+    def can_use_lane(self, session_id: str, command: str) -> bool:
+        """Whether the command can run without the session's own environment."""
+        return False
+
+    @abstractmethod
+    def open_pty(
+        self,
+        session_id: str,
+        cols: int = 80,
+        rows: int = 24,
+        workdir: str = "/home/learner",
+        image: str = None,
+    ) -> Dict[str, Any]:
+        """
+        Open an interactive terminal in the session's environment.
+
+        Returns:
+            Dictionary with a terminal (read, write, resize, close and
+            closed, like PtySession) under "pty", or an error
+        """
+
+    @abstractmethod
+    def reset_session(self, session_id: str, image: str = None) -> Dict[str, Any]:
+        """
+        Replace the session's environment with a clean one.
+
+        Returns:
+            Dictionary with success status and message
+        """
+
+    @abstractmethod
+    def get_session_status(self, session_id: str) -> Dict[str, Any]:
+        """
+        Get the status of a session's environment.
+
+        Returns:
+            Dictionary with running, status, id and session_id
+        """
+
+    @abstractmethod
+    def cleanup_expired(self) -> Dict[str, Any]:
+        """
+        Remove every environment idle for longer than the idle timeout.
+
+        Returns:
+            Dictionary with removed_count, removed_sessions and errors
+        """
+
+    @abstractmethod
+    def list_active_sessions(self) -> Dict[str, Any]:
+        """
+        List the sessions with an environment.
+
+        Returns:
+            Dictionary with sessions and count
+        """
+
+
+class BackendSwitch(SandboxBackend):
+    """
+    The sandbox backend chosen by the SANDBOX_BACKEND setting.
+
+    Routes and jobs hold this one object; `init_app` picks the backend
+    that every call is passed on to. Only the chosen backend is
+    configured and started.
+    """
+
+    def __init__(self, backends: Dict[str, SandboxBackend], default: str):
+        """
+        Args:
+            backends: Backends by setting value
+            default: Name of the backend used unless configured otherwise
+        """
+        self.backends = backends
+        self.backend = backends[default]
+
+    def init_app(self, app) -> None:
+        """Choose the backend named by SANDBOX_BACKEND and configure it."""
+        name = app.config.get("SANDBOX_BACKEND") or ""
+        if name:
+            if name not in self.backends:
+                raise ValueError(
+                    f"Unknown SANDBOX_BACKEND '{name}'; "
+                    f"expected one of: {', '.join(sorted(self.backends))}"
+                )
+            self.backend = self.backends[name]
+        self.backend.init_app(app)
+
+    def start(self) -> None:
+        """See SandboxBackend.start."""
+        self.backend.start()
+
+    def get_or_create_container(
+        self, session_id: str, image: str = None
+    ) -> Dict[str, Any]:
+        """See SandboxBackend.get_or_create_container."""
+        return self.backend.get_or_create_container(session_id, image)
+
+    def execute_command(
+        self,
+        session_id: str,
+        command: str,
+        workdir: str = "/home/learner",
+        image: str = None,
+        timeout: Optional[float] = None,
+        output_limit: int = OutputCapture.DEFAULT_LIMIT,
+    ) -> Dict[str, Any]:
+        """See SandboxBackend.execute_command."""
+        return self.backend.execute_command(
+            session_id, command, workdir, image, timeout, output_limit
+        )
+
+    def stream_command(
+        self,
+        session_id: str,
+        command: str,
+        workdir: str = "/home/learner",
+        image: str = None,
+        timeout: Optional[float] = None,
+        output_limit: int = OutputCapture.DEFAULT_LIMIT,
+    ) -> Iterator[Dict[str, Any]]:
+        """See SandboxBackend.stream_command."""
+        return self.backend.stream_command(
+            session_id, command, workdir, image, timeout, output_limit
+        )
+
+    def execute_batch(
+        self,
+        session_id: str,
+        commands: List[str],
+        workdir: str = "/home/learner",
+        image: str = None,
+        timeout: Optional[float] = None,
+        output_limit: int = OutputCapture.DEFAULT_LIMIT,
+    ) -> Dict[str, Any]:
+        """See SandboxBackend.execute_batch."""
+        return self.backend.execute_batch(
+            session_id, commands, workdir, image, timeout, output_limit
+        )
+
+    def cached_result(
+        self, session_id: str, command: str, image: str = None
+    ) -> Optional[Dict[str, Any]]:
+        """See SandboxBackend.cached_result."""
+        return self.backend.cached_result(session_id, command, image)
+
+    def can_use_lane(self, session_id: str, command: str) -> bool:
+        """See SandboxBackend.can_use_lane."""
+        return self.backend.can_use_lane(session_id, command)
+
+    def open_pty(
+        self,
+        session_id: str,
+        cols: int = 80,
+        rows: int = 24,
+        workdir: str = "/home/learner",
+        image: str = None,
+    ) -> Dict[str, Any]:
+        """See SandboxBackend.open_pty."""
+        return self.backend.open_pty(session_id, cols, rows, workdir, image)
+
+    def reset_session(self, session_id: str, image: str = None) -> Dict[str, Any]:
+        """See SandboxBackend.reset_session."""
+        return self.backend.reset_session(session_id, image)
+
+    def get_session_status(self, session_id: str) -> Dict[str, Any]:
+        """See SandboxBackend.get_session_status."""
+        return self.backend.get_session_status(session_id)
+
+    def cleanup_expired(self) -> Dict[str, Any]:
+        """See SandboxBackend.cleanup_expired."""
+        return self.backend.cleanup_expired()
+
+    def list_active_sessions(self) -> Dict[str, Any]:
+        """See SandboxBackend.list_active_sessions."""
+        return self.backend.list_active_sessions()
@@ -0,0 +1,232 @@
+"""Admission control for sandbox containers and command executions."""
+
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+import docker
+from docker.errors import DockerException
+from docker.utils import parse_bytes
+
+from app.terminal.state_store import SqliteStore
+
+
+class TicketStore(SqliteStore):
+    """
+    Sessions waiting for a container, shared between workers.
+
+    Waiting clients retry on whichever worker they land on, so the line
+    lives here rather than in process memory. A ticket drops out of line
+    when its client stops retrying.
+    """
+
+    FILENAME = "capacity.db"
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS tickets ("
+        "session_id TEXT PRIMARY KEY, enqueued REAL NOT NULL, seen REAL NOT NULL)"
+    )
+
+    def join(self, session_id: str, now: float) -> None:
+        """Join the line, or refresh an existing place in it."""
+        self._write(
+            "INSERT INTO tickets (session_id, enqueued, seen) VALUES (?, ?, ?) "
+            "ON CONFLICT(session_id) DO UPDATE SET seen = excluded.seen",
+            (session_id, now, now),
+        )
+
+    def leave(self, session_id: str) -> None:
+        """Leave the line."""
+        self._write("DELETE FROM tickets WHERE session_id = ?", (session_id,))
+
+    def position(self, session_id: str, stale_before: float) -> int:
+        """
+        Get a session's place in line, counting from 1.
+
+        Tickets not refreshed since `stale_before` are dropped first.
+        Returns 0 if the session is not in line.
+        """
+        self._write("DELETE FROM tickets WHERE seen < ?", (stale_before,))
+        rows = self._query(
+            "SELECT COUNT(*) FROM tickets WHERE enqueued <= "
+            "(SELECT enqueued FROM tickets WHERE session_id = ?)",
+            (session_id,),
+        )
+        return rows[0][0] if rows else 0
+
+    def length(self, stale_before: float) -> int:
+        """Number of sessions waiting."""
+        rows = self._query(
+            "SELECT COUNT(*) FROM tickets WHERE seen >= ?", (stale_before,)
+        )
+        return rows[0][0] if rows else 0
+
+
+class CapacityManager:
+    """
+    Keeps sandbox usage within the host's budgets.
+
+    New containers are only started while the number of live sandbox
+    containers stays under the smallest of three limits: the container
+    count, the memory budget divided by each container's memory limit,
+    and the CPU budget divided by each container's CPU quota. When the
+    host is full, new sessions wait in a first-come line and are told
+    their position, an estimated wait, and when to retry. Budgets default
+    to the Docker host's total memory and CPUs.
+
+    Command executions are capped separately, per worker, so a burst of
+    commands queues briefly instead of piling onto the host.
+    """
+
+    # Seconds clients are asked to wait before retrying
+    RETRY_SECONDS = 5
+    # Tickets not refreshed for this many retry intervals leave the line
+    STALE_RETRIES = 3
+    # Seconds an execution waits for a free slot before giving up
+    EXEC_WAIT_SECONDS = 2
+    # Assumed seconds between freed containers until some have been seen
+    DEFAULT_RELEASE_SECONDS = 60
+
+    def __init__(
+        self,
+        client_getter: Callable[[], docker.DockerClient],
+        usage: Callable[[], Dict[str, int]],
+        container_memory: str = "256m",
+        container_cpus: float = 0.5,
+        tickets_filename: Optional[str] = None,
+    ):
+        self._client_getter = client_getter
+        self._usage = usage
+        self.container_memory = parse_bytes(container_memory)
+        self.container_cpus = container_cpus
+        self.max_containers = 50
+        self.memory_budget: Optional[int] = None
+        self.cpu_budget: Optional[float] = None
+        self.max_execs = 32
+        self.tickets = TicketStore(filename=tickets_filename)
+        self._exec_slots = threading.BoundedSemaphore(self.max_execs)
+        # Times containers were released, for estimating the wait
+        self._releases = deque(maxlen=20)
+        self._lock = threading.Lock()
+
+    def configure(
+        self,
+        max_containers: int = None,
+        memory_budget: str = None,
+        cpu_budget: float = None,
+        max_execs: int = None,
+        state_dir: str = None,
+    ) -> None:
+        """Update budgets; unset memory and CPU budgets come from the Docker host."""
+        if max_containers is not None:
+            self.max_containers = max_containers
+        if memory_budget:
+            self.memory_budget = parse_bytes(memory_budget)
+        if cpu_budget:
+            self.cpu_budget = cpu_budget
+        if max_execs is not None and max_execs != self.max_execs:
+            self.max_execs = max_execs
+            self._exec_slots = threading.BoundedSemaphore(max_execs)
+        if state_dir:
+            self.tickets.configure(state_dir)
+
+    def free_slots(self) -> int:
+        """
+        Number of containers the host could still start.
+
+        Paused containers count against the container and memory budgets
+        but not the CPU budget, since frozen processes are never scheduled.
+        """
+        self._load_host_budgets()
+        usage = self._usage()
+        free = self.max_containers - usage["containers"]
+        if self.memory_budget:
+            free = min(free, self.memory_budget // self.container_memory - usage["containers"])
+        if self.cpu_budget:
+            free = min(free, int(self.cpu_budget / self.container_cpus) - usage["running"])
+        return free
+
+    def has_room(self) -> bool:
+        """Whether a container could be started without anyone waiting."""
+        stale_before = time.time() - self.RETRY_SECONDS * self.STALE_RETRIES
+        return self.tickets.length(stale_before) == 0 and self.free_slots() > 0
+
+    def admit(self, session_id: str) -> Dict[str, Any]:
+        """
+        Ask to start a container for a session.
+
+        Args:
+            session_id: Session that needs a container
+
+        Returns:
+            {"success": True} if the container may be started now, else an
+            error with queue_position, eta_seconds and retry_after
+        """
+        now = time.time()
+        stale_before = now - self.RETRY_SECONDS * self.STALE_RETRIES
+        try:
+            free = self.free_slots()
+        except (DockerException, RuntimeError):
+            # Can't tell; let the create itself succeed or fail
+            return {"success": True}
+
+        self.tickets.join(session_id, now)
+        # Treat an unreadable line as empty
+        position = self.tickets.position(session_id, stale_before) or 1
+        if position <= free:
+            self.tickets.leave(session_id)
+            return {"success": True}
+
+        waiting_for = position - max(free, 0)
+        eta = math.ceil(waiting_for * self._release_interval())
+        return {
+            "success": False,
+            "error": (
+                "The sandbox is at capacity. "
+                f"You are number {position} in line (about {eta} seconds)."
+            ),
+            "queue_position": position,
+            "eta_seconds": eta,
+            "retry_after": self.RETRY_SECONDS,
+        }
+
+    def released(self) -> None:
+        """Note that a sandbox container was removed."""
+        with self._lock:
+            self._releases.append(time.monotonic())
+
+    @contextmanager
+    def exec_slot(self) -> Iterator[bool]:
+        """
+        Hold one of the worker's execution slots.
+
+        Yields:
+            True if a slot was acquired, False if all stayed busy
+        """
+        slots = self._exec_slots
+        acquired = slots.acquire(timeout=self.EXEC_WAIT_SECONDS)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                slots.release()
+
+    def _release_interval(self) -> float:
+        """Average seconds between released containers."""
+        with self._lock:
+            releases = list(self._releases)
+        if len(releases) < 2:
+            return self.DEFAULT_RELEASE_SECONDS
+        return max(1.0, (releases[-1] - releases[0]) / (len(releases) - 1))
+
+    def _load_host_budgets(self) -> None:
+        if self.memory_budget is not None and self.cpu_budget is not None:
+            return
+        info = self._client_getter().info()
+        with self._lock:
+            if self.memory_budget is None:
+                self.memory_budget = info.get("MemTotal") or 0
+            if self.cpu_budget is None:
+                self.cpu_budget = info.get("NCPU") or 0
@@ -0,0 +1,369 @@
+"""Recognizing shell commands that don't need the session's own container."""
+
+import posixpath
+import shlex
+from typing import List, Optional, Tuple
+
+# Root-owned files baked into the sandbox image, outside /home/learner.
+# The learner runs as a non-root user without sudo (the image never
+# installs it), so these can't change for an image id. Docker-managed
+# files like /etc/hosts are deliberately absent.
+IMAGE_FILES = frozenset({
+    "/etc/os-release",
+    "/etc/passwd",
+    "/etc/group",
+    "/etc/services",
+    "/etc/protocols",
+    "/var/log/sample-app.log",
+})
+
+# Characters that make bash expand, redirect or glob when unquoted
+_UNQUOTED_UNSAFE = set("$`\\*?[]{}~!<>()#\n")
+# ...and inside double quotes
+_DOUBLE_QUOTED_UNSAFE = set("$`\\!")
+
+# Looser rules for read-only commands: variables and globs are fine
+_READ_ONLY_UNQUOTED_UNSAFE = set("`\\!()\n#")
+_READ_ONLY_DOUBLE_QUOTED_UNSAFE = set("`\\!")
+
+_SEPARATORS = {"&&", "||", ";"}
+_REDIRECTIONS = {">", ">>", ">&", "&>", "<"}
+
+# Filters that read only their file operands (or stdin): allowed flags,
+# and flags that take a value
+_FILTERS = {
+    "cat": ("nAbEsTv", ""),
+    "head": ("", "nc"),
+    "tail": ("", "nc"),
+    "wc": ("lwcm", ""),
+    "grep": ("icnvwxoEFhH", ""),
+    "sort": ("nrufb", ""),
+    "uniq": ("cdui", ""),
+    "cut": ("s", "dfc"),
+}
+
+
+def is_pure(command: str) -> bool:
+    """
+    Whether a command's output depends only on the command and the image.
+
+    Pure commands are lists (`;`, `&&`, `||`) of pipelines made of
+    `echo`/`printf` with literal arguments, and simple text filters
+    (`cat`, `grep`, `head`, ...) reading their stdin or root-owned files
+    baked into the image (`IMAGE_FILES`). Anything with expansions,
+    globs, redirections or subshells, and any other file operand, is
+    impure.
+
+    A session's own shell can still shadow these commands with aliases
+    or functions, so only sessions with nothing of their own may use
+    results cached for pure commands.
+
+    Args:
+        command: Shell command as typed by the learner
+
+    Returns:
+        True if running the command again in a fresh shell on the same
+        image always prints the same thing
+    """
+    words = _split(command)
+    if not words:
+        return False
+    for pipeline in _split_on(words, _SEPARATORS):
+        stages = _split_on(pipeline, {"|"})
+        for index, stage in enumerate(stages):
+            if not stage or not _pure_stage(stage, reads_stdin=index > 0):
+                return False
+    return True
+
+
+# Commands that never change the filesystem or the shell, with options
+# that would make them write files or list processes (short flag letters,
+# long options). Process listings (`ps`, `lsof`) are left out: in the
+# shared lane they would show other learners' commands.
+_READ_ONLY_COMMANDS = {
+    name: ("", ())
+    for name in (
+        "cat", "ls", "head", "tail", "wc", "grep", "egrep", "fgrep", "cut",
+        "tr", "nl", "column", "pwd", "whoami", "id", "groups", "uname", "date",
+        "uptime", "df", "du", "free", "env", "printenv", "which", "whereis",
+        "type", "stat", "basename", "dirname", "readlink", "realpath",
+        "nproc", "getent", "true", "false", "test", "[", "echo", "dig",
+        "nslookup", "host", "ping", "traceroute", "tracepath", "hostname",
+        "uniq",
+    )
+}
+_READ_ONLY_COMMANDS.update({
+    # `-p` names the processes behind sockets
+    "ss": ("p", ("--processes",)),
+    "netstat": ("p", ("--program",)),
+    "sort": ("o", ("--output",)),
+    "printf": ("v", ()),
+    "tree": ("o", ()),
+    "file": ("C", ("--compile",)),
+    "curl": ("oOTcDK", (
+        "--output", "--remote-name", "--remote-name-all", "--upload-file",
+        "--cookie-jar", "--dump-header", "--config", "--output-dir",
+    )),
+})
+# Commands that walk directory trees: always (None), or given one of
+# these options (short flag letters, long options)
+_TREE_WALKERS = {
+    "find": None,
+    "du": None,
+    "tree": None,
+    "ls": ("R", ("--recursive",)),
+    "grep": ("rRd", ("--recursive", "--dereference-recursive", "--directories")),
+    "egrep": ("rRd", ("--recursive", "--dereference-recursive", "--directories")),
+    "fgrep": ("rRd", ("--recursive", "--dereference-recursive", "--directories")),
+}
+# Characters that make a path impossible to check before bash expands it
+_PATH_EXPANSIONS = set("*?[]{}~")
+# Where a leading `~` points in the image
+_HOME = "/home/learner"
+# `find` actions that run or write things
+_FIND_ACTIONS = {
+    "-exec", "-execdir", "-ok", "-okdir", "-delete",
+    "-fprint", "-fprint0", "-fprintf", "-fls",
+}
+# `ip` objects' verbs that change the network
+_IP_CHANGES = {"add", "del", "delete", "change", "replace", "set", "flush", "append"}
+
+
+def is_read_only(command: str) -> bool:
+    """
+    Whether a command only looks at the system and leaves it unchanged.
+
+    Read-only commands (`ls`, `cat`, `grep`, `dig`, `ip addr`, ...) give
+    the same answer in any fresh container of the image, so they don't
+    need one of their own. Command substitution, background jobs,
+    redirections other than to /dev/null or between stdout and stderr,
+    and anything that changes the shell (`cd`, assignments) disqualify
+    a command.
+
+    Lane containers run every learner's commands at once as the same
+    user, so commands that could look at other processes are not
+    read-only here either: any path through /proc (or a `..` that could
+    climb into it from a symlink like /dev/fd), globs and other
+    expansions in paths, variables outside `echo`/`printf`, and tree
+    walks (`find`, `ls -R`, `grep -r`, ...) starting at the root.
+
+    Args:
+        command: Shell command as typed by the learner
+
+    Returns:
+        True if the command can't change files, processes or the shell
+    """
+    if "$(" in command:
+        return False
+    words = _split(command, _READ_ONLY_UNQUOTED_UNSAFE, _READ_ONLY_DOUBLE_QUOTED_UNSAFE)
+    words = _strip_redirections(words) if words else None
+    if not words:
+        return False
+    for pipeline in _split_on(words, _SEPARATORS):
+        for stage in _split_on(pipeline, {"|"}):
+            if not stage or not _read_only_stage(stage):
+                return False
+    return True
+
+
+def _read_only_stage(stage: List[str]) -> bool:
+    name, args = stage[0], stage[1:]
+    if name not in ("echo", "printf") and any(_may_see_processes(word) for word in stage):
+        return False
+    if name == "timeout":
+        # `timeout [options] DURATION COMMAND...`
+        while args and args[0].startswith("-"):
+            args = args[1:]
+        return len(args) > 1 and _read_only_stage(args[1:])
+    operands = [arg for arg in args if not arg.startswith("-")]
+    if _walks_tree(name, args) and any(_may_reach_root(arg) for arg in operands):
+        return False
+    if name == "find":
+        return not any(arg in _FIND_ACTIONS for arg in args)
+    if name == "ip":
+        return not any(arg in _IP_CHANGES for arg in args)
+    if name == "nc":
+        # Only port scans (`nc -z`) return on their own without sending data
+        return any(arg.startswith("-") and "z" in arg for arg in args)
+    if name in ("env", "hostname") and operands:
+        # `env` runs its operands as a command; `hostname NAME` renames
+        return False
+    if name == "uniq" and len(operands) > 1:
+        # The second operand is an output file
+        return False
+    if name not in _READ_ONLY_COMMANDS:
+        return False
+    return not _has_option(args, *_READ_ONLY_COMMANDS[name])
+
+
+def _has_option(args: List[str], flags: str, long_options: Tuple[str, ...]) -> bool:
+    """Whether any argument is one of the short flag letters or long options."""
+    for arg in args:
+        if arg.startswith("--"):
+            if arg.split("=", 1)[0] in long_options:
+                return True
+        elif arg.startswith("-") and any(letter in flags for letter in arg[1:]):
+            return True
+    return False
+
+
+def _may_see_processes(word: str) -> bool:
+    """Whether a word may name a path under /proc once bash expands it."""
+    if "$" in word:
+        # Variables, `$_` included, can hold any path
+        return True
+    word = _expand_home(word)
+    if "/" not in word:
+        # A name in the working directory; globs only match there
+        return False
+    if any(char in _PATH_EXPANSIONS for char in word):
+        return True
+    parts = word.split("/")
+    if "proc" in parts:
+        return True
+    # `..` after a directory may leave a symlink, as in /dev/fd/../..
+    after_name = False
+    for part in parts:
+        if part == ".." and after_name:
+            return True
+        after_name = after_name or part not in ("", ".", "..")
+    return False
+
+
+def _expand_home(word: str) -> str:
+    if word == "~" or word.startswith("~/"):
+        return _HOME + word[1:]
+    return word
+
+
+def _walks_tree(name: str, args: List[str]) -> bool:
+    if name not in _TREE_WALKERS:
+        return False
+    options = _TREE_WALKERS[name]
+    return options is None or _has_option(args, *options)
+
+
+def _may_reach_root(operand: str) -> bool:
+    """Whether a path may be /, whose tree includes /proc."""
+    operand = _expand_home(operand)
+    if operand.startswith(".."):
+        return True
+    return operand.startswith("/") and posixpath.normpath(operand).strip("/") == ""
+
+
+def _strip_redirections(words: List[str]) -> Optional[List[str]]:
+    """Drop harmless redirections; None if any other redirection is present."""
+    kept = []
+    index = 0
+    while index < len(words):
+        word = words[index]
+        if word not in _REDIRECTIONS:
+            kept.append(word)
+            index += 1
+            continue
+        target = words[index + 1] if index + 1 < len(words) else None
+        if word == ">&":
+            harmless = target in ("1", "2")
+        elif word == "<":
+            harmless = (
+                target is not None
+                and target not in _REDIRECTIONS
+                and not _may_see_processes(target)
+            )
+        else:
+            harmless = target == "/dev/null"
+        if not harmless:
+            return None
+        if kept and kept[-1].isdigit() and word != "&>":
+            # The file descriptor, as in `2>/dev/null`
+            kept.pop()
+        index += 2
+    return kept
+
+
+def _pure_stage(stage: List[str], reads_stdin: bool) -> bool:
+    name, args = stage[0], stage[1:]
+    if name == "echo":
+        return True
+    if name == "printf":
+        # `printf -v` sets a variable and `%(...)T` prints the time
+        return bool(args) and not args[0].startswith("-") and "%(" not in args[0]
+    if name not in _FILTERS:
+        return False
+
+    flags, value_flags = _FILTERS[name]
+    operands = []
+    args = iter(args)
+    for arg in args:
+        if arg.startswith("-") and len(arg) > 1 and not arg.startswith("--"):
+            letters = arg[1:]
+            if name in ("head", "tail") and letters.isdigit():
+                continue
+            for position, letter in enumerate(letters):
+                if letter in value_flags:
+                    # The rest of the word, or the next word, is the value
+                    if position == len(letters) - 1 and next(args, None) is None:
+                        return False
+                    break
+                if letter not in flags:
+                    return False
+        elif arg.startswith("--"):
+            return False
+        else:
+            operands.append(arg)
+
+    if name == "grep":
+        if not operands:
+            return False
+        operands = operands[1:]
+    if not operands:
+        # Reads stdin: the previous stage's output, or nothing at all
+        return reads_stdin or name != "cat"
+    return all(operand in IMAGE_FILES for operand in operands)
+
+
+def _split(
+    command: str,
+    unquoted_unsafe: set = _UNQUOTED_UNSAFE,
+    double_quoted_unsafe: set = _DOUBLE_QUOTED_UNSAFE,
+) -> Optional[List[str]]:
+    """Split a command into words and operators, or None if it isn't simple."""
+    quote = None
+    for char in command:
+        if quote == "'":
+            if char == "'":
+                quote = None
+        elif quote == '"':
+            if char == '"':
+                quote = None
+            elif char in double_quoted_unsafe:
+                return None
+        elif char in "'\"":
+            quote = char
+        elif char in unquoted_unsafe:
+            return None
+    if quote is not None:
+        return None
+
+    lexer = shlex.shlex(command, posix=True, punctuation_chars=";&|<>")
+    lexer.whitespace_split = True
+    lexer.commenters = ""
+    try:
+        words = list(lexer)
+    except ValueError:
+        return None
+    operators = _SEPARATORS | _REDIRECTIONS | {"|"}
+    if any(set(word) <= set(";&|<>") and word not in operators for word in words):
+        # A lone `&` (background job), `|&` and so on
+        return None
+    return words
+
+
+def _split_on(words: List[str], operators: set) -> List[List[str]]:
+    parts = [[]]
+    for word in words:
+        if word in operators:
+            parts.append([])
+        else:
+            parts[-1].append(word)
+    return parts
@@ -0,0 +1,222 @@
+"""Warm pool of pre-started sandbox containers."""
+
+import atexit
+import os
+import socket
+import threading
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+import docker
+from docker.errors import APIError, DockerException, NotFound
+
+
+class ContainerPool:
+    """
+    Keeps idle sandbox containers running ahead of demand.
+
+    A session claims a pooled container by renaming it to its own
+    container name, so the first command skips the container boot.
+    A background thread tops the pool back up after every claim.
+
+    Each process only claims containers it created itself (tracked by
+    the owner label), so gunicorn workers never hand the same container
+    to two sessions. The pool only grows while `has_room` says the host
+    has capacity to spare.
+    """
+
+    POOL_PREFIX = "sandbox-pool-"
+    POOL_LABEL = "learn-pool"
+    OWNER_LABEL = "learn-pool-owner"
+    RETRY_SECONDS = 10
+
+    def __init__(
+        self,
+        client_getter: Callable[[], docker.DockerClient],
+        run_options: Dict[str, Any],
+        image: str = "linux-sandbox:latest",
+        size: int = 0,
+        has_room: Optional[Callable[[], bool]] = None,
+    ):
+        self._client_getter = client_getter
+        self._has_room = has_room
+        self._run_options = run_options
+        self.image = image
+        self.size = size
+        self._owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._idle: List[Any] = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._drain_registered = False
+
+    def configure(self, image: str = None, size: int = None) -> None:
+        """Update the pool image and target size."""
+        with self._lock:
+            if image is not None and image != self.image:
+                # Containers of the old image can no longer be handed out
+                stale, self._idle = self._idle, []
+                self.image = image
+            else:
+                stale = []
+            if size is not None:
+                self.size = max(0, size)
+        self._remove_all(stale)
+        self._wakeup.set()
+
+    def start(self) -> None:
+        """Start the background refill thread (idempotent)."""
+        if self.size <= 0:
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            # Forked workers inherit the parent's state; claim a new identity
+            self._owner = f"{socket.gethostname()}:{os.getpid()}"
+            self._idle = []
+            self._thread = threading.Thread(
+                target=self._refill_loop, name="sandbox-pool", daemon=True
+            )
+            self._thread.start()
+            # A restarted refill thread must not register a second drain
+            register, self._drain_registered = not self._drain_registered, True
+        if register:
+            atexit.register(self.drain)
+
+    def claim(self, name: str, image: str) -> Optional[Any]:
+        """
+        Take an idle container and rename it for a session.
+
+        The container keeps its empty `learn-session` label, as Docker
+        cannot relabel an existing container. That is harmless: sessions
+        are always looked up by container name, and the label is only
+        ever used as a presence filter for sandbox containers.
+
+        Args:
+            name: Container name the session expects
+            image: Image the session needs
+
+        Returns:
+            The claimed container, or None if no matching container is idle
+        """
+        while True:
+            with self._lock:
+                if image != self.image or not self._idle:
+                    container = None
+                else:
+                    container = self._idle.pop()
+            self._wakeup.set()
+            if container is None:
+                return None
+
+            try:
+                container.rename(name)
+                container.reload()
+                if container.status == "running":
+                    return container
+            except NotFound:
+                continue
+            except APIError as e:
+                if e.status_code == 409:
+                    # The name is taken; the session already has a container
+                    with self._lock:
+                        self._idle.append(container)
+                    return None
+            self._remove_all([container])
+
+    def idle_count(self) -> int:
+        """Number of containers currently waiting to be claimed."""
+        with self._lock:
+            return len(self._idle)
+
+    def drain(self) -> None:
+        """Remove every idle container owned by this process."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self.size = 0
+        self._wakeup.set()
+        self._remove_all(idle)
+
+    def _refill_loop(self) -> None:
+        """Create containers until the pool is full, then wait for claims."""
+        self._prune_stale()
+        while True:
+            self._wakeup.clear()
+            try:
+                while self._deficit() > 0 and self._room():
+                    self._add_container()
+                # If the host is full, leave the room to sessions for now
+                timeout = None if self._deficit() <= 0 else self.RETRY_SECONDS
+            except (DockerException, RuntimeError):
+                # Docker unavailable or image missing; retry later
+                timeout = self.RETRY_SECONDS
+            self._wakeup.wait(timeout)
+
+    def _room(self) -> bool:
+        return self._has_room is None or self._has_room()
+
+    def _deficit(self) -> int:
+        with self._lock:
+            return self.size - len(self._idle)
+
+    def _add_container(self) -> None:
+        with self._lock:
+            image = self.image
+        container = self._new_container(image)
+        with self._lock:
+            if image == self.image and len(self._idle) < self.size:
+                self._idle.append(container)
+                return
+        self._remove_all([container])
+
+    def _new_container(self, image: str) -> Any:
+        """Start a container owned by this pool."""
+        return self._client_getter().containers.run(
+            image,
+            name=f"{self.POOL_PREFIX}{uuid.uuid4().hex[:12]}",
+            labels={
+                "learn-session": "",
+                self.POOL_LABEL: "1",
+                self.OWNER_LABEL: self._owner,
+            },
+            **self._run_options,
+        )
+
+    def _prune_stale(self) -> None:
+        """Remove idle pool containers left behind by dead processes on this host."""
+        hostname = socket.gethostname()
+        try:
+            containers = self._client_getter().containers.list(
+                all=True, filters={"label": self.POOL_LABEL}
+            )
+        except (DockerException, RuntimeError):
+            return
+
+        for container in containers:
+            if not container.name.startswith(self.POOL_PREFIX):
+                # Already claimed by a session
+                continue
+            owner_host, _, owner_pid = container.labels.get(
+                self.OWNER_LABEL, ""
+            ).partition(":")
+            if owner_host == hostname and not _pid_alive(owner_pid):
+                self._remove_all([container])
+
+    @staticmethod
+    def _remove_all(containers: List[Any]) -> None:
+        for container in containers:
+            try:
+                container.remove(force=True)
+            except (DockerException, RuntimeError):
+                pass
+
+
+def _pid_alive(pid: str) -> bool:
+    """Check whether a process id on this host is still running."""
+    try:
+        os.kill(int(pid), 0)
+    except (ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -0,0 +1,158 @@
+"""In-memory view of sandbox containers, kept current from Docker events."""
+
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import docker
+from docker.errors import DockerException
+
+# Event actions that change a container's status
+_STATUS_BY_ACTION = {
+    "create": "created",
+    "start": "running",
+    "restart": "running",
+    "unpause": "running",
+    "pause": "paused",
+    "die": "exited",
+    "stop": "exited",
+}
+
+
+class ContainerStateCache:
+    """
+    Tracks sandbox containers by subscribing to the Docker event stream.
+
+    A background thread takes one snapshot of every container carrying
+    the `learn-session` label and then applies create/start/pause/die/
+    rename/destroy events as they happen, so status checks become
+    dictionary lookups instead of daemon round trips. Until the first
+    snapshot has loaded (or while the daemon is unreachable) `ready` is
+    False and callers should ask Docker directly.
+    """
+
+    LABEL = "learn-session"
+    RETRY_SECONDS = 5
+
+    def __init__(self, client_getter: Callable[[], docker.DockerClient]):
+        self._client_getter = client_getter
+        # Container name -> {"id", "name", "status", "labels"}
+        self._containers: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def ready(self) -> bool:
+        """Whether the cache is synced with the daemon."""
+        return self._ready.is_set()
+
+    def start(self) -> None:
+        """Start the event subscriber thread (idempotent)."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._run, name="sandbox-events", daemon=True
+            )
+            self._thread.start()
+
+    def get(self, name: str) -> Optional[Dict[str, Any]]:
+        """Get the cached state of a container by name."""
+        with self._lock:
+            entry = self._containers.get(name)
+            return dict(entry) if entry else None
+
+    def list(self, prefix: str = "") -> List[Dict[str, Any]]:
+        """List cached containers whose name starts with a prefix."""
+        with self._lock:
+            return [
+                dict(entry)
+                for name, entry in self._containers.items()
+                if name.startswith(prefix)
+            ]
+
+    def record(self, name: str, container_id: str, status: str) -> None:
+        """Record a change we made ourselves, ahead of its event."""
+        with self._lock:
+            entry = self._containers.setdefault(
+                name, {"id": container_id, "name": name, "labels": {}}
+            )
+            entry.update(id=container_id, status=status)
+
+    def discard(self, name: str) -> None:
+        """Forget a container we removed ourselves, ahead of its event."""
+        with self._lock:
+            self._containers.pop(name, None)
+
+    def _run(self) -> None:
+        while True:
+            events = None
+            try:
+                client = self._client_getter()
+                # Subscribe before the snapshot so no change slips between them
+                events = client.events(
+                    decode=True,
+                    filters={"type": "container", "label": self.LABEL},
+                )
+                self._load_snapshot(client)
+                self._ready.set()
+                for event in events:
+                    self._apply(event)
+            except (DockerException, RuntimeError, OSError):
+                pass
+            finally:
+                self._ready.clear()
+                if events is not None:
+                    try:
+                        events.close()
+                    except Exception:
+                        pass
+            time.sleep(self.RETRY_SECONDS)
+
+    def _load_snapshot(self, client: docker.DockerClient) -> None:
+        containers = client.containers.list(all=True, filters={"label": self.LABEL})
+        snapshot = {
+            container.name: {
+                "id": container.id,
+                "name": container.name,
+                "status": container.status,
+                "labels": container.labels,
+            }
+            for container in containers
+        }
+        with self._lock:
+            self._containers = snapshot
+
+    def _apply(self, event: Dict[str, Any]) -> None:
+        action = event.get("Action", "")
+        actor = event.get("Actor", {})
+        attributes = actor.get("Attributes", {})
+        name = attributes.get("name", "")
+        container_id = actor.get("ID", "")
+
+        with self._lock:
+            if action == "destroy":
+                entry = self._containers.get(name)
+                if entry and entry["id"] == container_id:
+                    del self._containers[name]
+            elif action == "rename":
+                old_name = attributes.get("oldName", "").lstrip("/")
+                entry = self._containers.pop(old_name, None) or {
+                    "id": container_id,
+                    "status": "running",
+                    "labels": {},
+                }
+                entry["name"] = name
+                self._containers[name] = entry
+            elif action in _STATUS_BY_ACTION:
+                entry = self._containers.setdefault(
+                    name, {"id": container_id, "name": name, "labels": {}}
+                )
+                entry.update(id=container_id, status=_STATUS_BY_ACTION[action])
+                if action == "create":
+                    entry["labels"] = {
+                        key: value
+                        for key, value in attributes.items()
+                        if key.startswith("learn-")
+                    }
@@ -0,0 +1,398 @@
+"""Lean Docker Engine API client for the calls made on every command."""
+
+import http.client
+import json
+import queue
+import socket
+import struct
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote, urlencode
+
+import requests
+from docker.errors import DockerException, create_api_error_from_http_exception
+
+DEFAULT_SOCKET = "/var/run/docker.sock"
+
+
+class _UnixConnection(http.client.HTTPConnection):
+    """HTTP/1.1 connection to the daemon's unix socket."""
+
+    def __init__(self, path: str, timeout: Optional[float] = None):
+        super().__init__("localhost", timeout=timeout)
+        self.path = path
+
+    def connect(self) -> None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.path)
+        self.sock = sock
+
+
+class _NotSent(DockerException):
+    """A request failed before the daemon could have received it."""
+
+
+class EngineClient:
+    """
+    Talks to the Docker Engine API over keep-alive connections to its
+    unix socket.
+
+    docker-py goes through a `requests` session and adapters for every
+    call. The handful of endpoints on the hot path (exec create, start
+    and inspect, container start/pause/rename/remove/list, and events)
+    are plain HTTP requests here, on connections kept open and reused
+    from a pool sized to the worker's threads.
+
+    Method names, arguments and return values match docker-py's
+    `APIClient`, and errors are docker-py's exceptions (`NotFound`,
+    `APIError` with `status_code`), so it can be passed wherever the
+    sandbox expects `client.api`.
+    """
+
+    API_VERSION = "1.41"
+    # Requests that are safe to repeat when a kept-alive connection fails
+    IDEMPOTENT_METHODS = ("GET", "HEAD", "PUT", "DELETE")
+    READ_SIZE = 65536
+
+    def __init__(
+        self,
+        path: str = DEFAULT_SOCKET,
+        pool_size: int = 32,
+        timeout: Optional[float] = 60,
+    ):
+        """
+        Args:
+            path: Path of the daemon's unix socket
+            pool_size: Most idle connections kept open
+            timeout: Seconds to wait for the daemon on ordinary requests
+        """
+        self.path = path
+        self.timeout = timeout
+        self._idle: "queue.LifoQueue[_UnixConnection]" = queue.LifoQueue(pool_size)
+
+    @classmethod
+    def for_url(cls, url: Optional[str], **kwargs) -> Optional["EngineClient"]:
+        """
+        Client for a Docker host URL, if it is a unix socket.
+
+        Args:
+            url: Docker host URL such as unix:///var/run/docker.sock; None
+                for the default socket
+
+        Returns:
+            EngineClient, or None for hosts reached over TCP or SSH
+        """
+        if not url:
+            return cls(DEFAULT_SOCKET, **kwargs)
+        if url.startswith("unix://"):
+            return cls(url[len("unix://"):], **kwargs)
+        return None
+
+    # Exec
+
+    def exec_create(
+        self,
+        container: str,
+        cmd: Any,
+        stdout: bool = True,
+        stderr: bool = True,
+        stdin: bool = False,
+        tty: bool = False,
+        privileged: bool = False,
+        user: str = "",
+        environment: Optional[Dict[str, str]] = None,
+        workdir: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Create an exec instance; returns {"Id": ...}."""
+        config = {
+            "AttachStdin": stdin,
+            "AttachStdout": stdout,
+            "AttachStderr": stderr,
+            "Tty": tty,
+            "Privileged": privileged,
+            "User": user,
+            "Cmd": ["/bin/sh", "-c", cmd] if isinstance(cmd, str) else cmd,
+        }
+        if environment:
+            config["Env"] = [f"{key}={value}" for key, value in environment.items()]
+        if workdir:
+            config["WorkingDir"] = workdir
+        return self._json("POST", f"/containers/{quote(container)}/exec", config)
+
+    def exec_start(
+        self,
+        exec_id: str,
+        detach: bool = False,
+        tty: bool = False,
+        stream: bool = False,
+        socket: bool = False,
+    ) -> Any:
+        """
+        Start an exec instance.
+
+        Returns:
+            The raw attached socket if `socket`, else a generator of output
+            chunks if `stream`, else all output as bytes
+        """
+        body = {"Detach": detach, "Tty": tty}
+        if detach:
+            self._json("POST", f"/exec/{exec_id}/start", body)
+            return b""
+        if socket:
+            return self._upgrade(f"/exec/{exec_id}/start", body)
+        # The daemon ends an attached exec by closing the connection, so
+        # this one is never returned to the pool
+        path = f"/exec/{exec_id}/start"
+        connection = self._new_connection(timeout=None)
+        response = self._send(connection, "POST", path, body)
+        if response.status >= 400:
+            data = response.read()
+            connection.close()
+            self._raise_for_status(response, path, data)
+        chunks = self._stream_output(connection, response, tty)
+        return chunks if stream else b"".join(chunks)
+
+    def exec_inspect(self, exec_id: str) -> Dict[str, Any]:
+        """Get an exec instance's state, including ExitCode and Running."""
+        return self._json("GET", f"/exec/{exec_id}/json")
+
+    def exec_resize(self, exec_id: str, height: int = None, width: int = None) -> None:
+        """Resize an exec instance's tty."""
+        params = {key: value for key, value in (("h", height), ("w", width)) if value}
+        self._json("POST", f"/exec/{exec_id}/resize?{urlencode(params)}")
+
+    # Containers
+
+    def create_container_from_config(
+        self, config: Dict[str, Any], name: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Create a container from an Engine API config; returns {"Id": ...}."""
+        path = "/containers/create"
+        if name:
+            path += "?" + urlencode({"name": name})
+        return self._json("POST", path, config)
+
+    def start(self, container: str) -> None:
+        """Start a container."""
+        self._json("POST", f"/containers/{quote(container)}/start")
+
+    def pause(self, container: str) -> None:
+        """Pause a container."""
+        self._json("POST", f"/containers/{quote(container)}/pause")
+
+    def unpause(self, container: str) -> None:
+        """Unpause a container."""
+        self._json("POST", f"/containers/{quote(container)}/unpause")
+
+    def rename(self, container: str, name: str) -> None:
+        """Rename a container."""
+        self._json("POST", f"/containers/{quote(container)}/rename?{urlencode({'name': name})}")
+
+    def remove_container(self, container: str, v: bool = False, force: bool = False) -> None:
+        """Remove a container."""
+        params = urlencode({"v": str(v).lower(), "force": str(force).lower()})
+        self._json("DELETE", f"/containers/{quote(container)}?{params}")
+
+    def containers(
+        self, all: bool = False, filters: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """List containers as the Engine API describes them."""
+        params = {"all": str(all).lower()}
+        if filters:
+            params["filters"] = json.dumps(_filter_lists(filters))
+        return self._json("GET", f"/containers/json?{urlencode(params)}")
+
+    def events(
+        self, filters: Optional[Dict[str, Any]] = None, decode: bool = True
+    ) -> Iterator[Any]:
+        """Follow the daemon's event stream, yielding one event at a time."""
+        path = "/events"
+        if filters:
+            path += "?" + urlencode({"filters": json.dumps(_filter_lists(filters))})
+        connection = self._new_connection(timeout=None)
+        response = self._send(connection, "GET", path)
+        if response.status >= 400:
+            data = response.read()
+            connection.close()
+            self._raise_for_status(response, path, data)
+        try:
+            while True:
+                line = response.readline()
+                if not line:
+                    return
+                if line.strip():
+                    yield json.loads(line) if decode else line
+        finally:
+            connection.close()
+
+    def close(self) -> None:
+        """Close every idle connection."""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    # Plumbing
+
+    def _json(self, method: str, path: str, body: Any = None) -> Any:
+        """Make a request on a pooled connection and decode its JSON reply."""
+        connection, reused = self._take()
+        try:
+            try:
+                response = self._send(connection, method, path, body)
+            except DockerException as e:
+                if not reused or not (
+                    isinstance(e, _NotSent) or method in self.IDEMPOTENT_METHODS
+                ):
+                    # The daemon may have acted on the request; repeating
+                    # it could e.g. start a second exec
+                    raise
+                # The daemon closed the idle connection; try a fresh one
+                connection = self._new_connection(self.timeout)
+                response = self._send(connection, method, path, body)
+            data = response.read()
+        except BaseException:
+            connection.close()
+            raise
+        if response.will_close:
+            connection.close()
+        else:
+            self._give_back(connection)
+        self._raise_for_status(response, path, data)
+        return json.loads(data) if data else None
+
+    def _send(
+        self,
+        connection: _UnixConnection,
+        method: str,
+        path: str,
+        body: Any = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> http.client.HTTPResponse:
+        payload = json.dumps(body).encode() if body is not None else None
+        all_headers = {"Content-Type": "application/json"} if payload else {}
+        all_headers.update(headers or {})
+        try:
+            connection.request(
+                method, f"/v{self.API_VERSION}{path}", body=payload, headers=all_headers
+            )
+        except (OSError, http.client.HTTPException) as e:
+            connection.close()
+            raise _NotSent(f"Error talking to Docker at {self.path}: {e}") from e
+        try:
+            response = connection.getresponse()
+        except (OSError, http.client.HTTPException) as e:
+            connection.close()
+            raise DockerException(f"Error talking to Docker at {self.path}: {e}") from e
+        return response
+
+    def _stream_output(
+        self,
+        connection: _UnixConnection,
+        response: http.client.HTTPResponse,
+        tty: bool,
+    ) -> Iterator[bytes]:
+        """Output chunks of an attached exec, without the stream framing."""
+        try:
+            if tty:
+                while True:
+                    chunk = response.read1(self.READ_SIZE)
+                    if not chunk:
+                        return
+                    yield chunk
+            while True:
+                header = response.read(8)
+                if len(header) < 8:
+                    return
+                _, length = struct.unpack(">BxxxL", header)
+                if length:
+                    yield response.read(length)
+        finally:
+            connection.close()
+
+    def _upgrade(self, path: str, body: Dict[str, Any]) -> socket.socket:
+        """Start an attached exec and hand back its raw, bidirectional socket."""
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(self.timeout)
+            sock.connect(self.path)
+            payload = json.dumps(body).encode()
+            sock.sendall(
+                f"POST /v{self.API_VERSION}{path} HTTP/1.1\r\n"
+                "Host: localhost\r\n"
+                "Content-Type: application/json\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                "Connection: Upgrade\r\n"
+                "Upgrade: tcp\r\n\r\n".encode() + payload
+            )
+            head = _read_head(sock)
+            status = int(head.split(b" ", 2)[1])
+            # Error bodies are a short JSON message
+            data = sock.recv(self.READ_SIZE) if status >= 400 else b""
+        except (OSError, ValueError, IndexError) as e:
+            sock.close()
+            raise DockerException(f"Error talking to Docker at {self.path}: {e}") from e
+
+        if status >= 400:
+            sock.close()
+            raise api_error(status, path, data)
+        sock.settimeout(None)
+        return sock
+
+    def _take(self) -> Tuple[_UnixConnection, bool]:
+        """An idle connection from the pool (reused=True), or a new one."""
+        try:
+            return self._idle.get_nowait(), True
+        except queue.Empty:
+            return self._new_connection(self.timeout), False
+
+    def _give_back(self, connection: _UnixConnection) -> None:
+        try:
+            self._idle.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def _new_connection(self, timeout: Optional[float]) -> _UnixConnection:
+        return _UnixConnection(self.path, timeout=timeout)
+
+    @staticmethod
+    def _raise_for_status(response: http.client.HTTPResponse, path: str, data: bytes) -> None:
+        if response.status >= 400:
+            raise api_error(response.status, path, data, response.reason)
+
+
+def _read_head(sock: socket.socket) -> bytes:
+    """Read a response's status line and headers, and nothing after them."""
+    head = b""
+    while True:
+        # Peek first so bytes of the attached stream stay in the socket
+        peeked = sock.recv(4096, socket.MSG_PEEK)
+        if not peeked:
+            raise OSError("Connection closed by Docker")
+        end = (head + peeked).find(b"\r\n\r\n")
+        if end != -1:
+            head += sock.recv(end + 4 - len(head))
+            return head
+        head += sock.recv(len(peeked))
+
+
+def api_error(status: int, path: str, data: bytes, reason: str = "") -> DockerException:
+    """docker-py's exception for an error response."""
+    response = requests.Response()
+    response.status_code = status
+    response.reason = reason
+    response.url = path
+    response._content = data
+    try:
+        create_api_error_from_http_exception(requests.HTTPError(response=response))
+    except DockerException as e:
+        return e
+
+
+def _filter_lists(filters: Dict[str, Any]) -> Dict[str, List[str]]:
+    """Engine API filters map each key to a list of values."""
+    return {
+        key: value if isinstance(value, list) else [value]
+        for key, value in filters.items()
+    }
@@ -1,32 +1,84 @@
 """Docker-based command execution for the sandbox environment."""
 
+import os
+import threading
+
 import docker
 from docker.errors import DockerException, ImageNotFound, APIError
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+
+from app.terminal.engine_client import EngineClient
+from app.terminal.one_shot_pool import OneShotPool
+
+DEFAULT_IMAGE = "linux-sandbox:latest"
+
+# Containers kept started ahead of commands, for the default image
+POOL_SIZE = 2
+
+RUN_OPTIONS = {
+    "detach": True,
+    "tty": True,
+    "stdin_open": True,
+    "command": "/bin/bash",
+    # Security constraints
+    "mem_limit": "256m",
+    "cpu_period": 100000,
+    "cpu_quota": 50000,  # 50% CPU
+    "network_mode": "bridge",
+}
+
+# Shared by every call in this process; replaced after a fork
+_client: Optional[docker.DockerClient] = None
+_client_pid: Optional[int] = None
+_api: Any = None
+_client_lock = threading.Lock()
 
 
 def get_docker_client():
     """Get Docker client, with helpful error message if Docker isn't available."""
-    try:
-        client = docker.from_env()
-        client.ping()
+    global _client, _client_pid, _api
+    with _client_lock:
+        if _client is not None and _client_pid == os.getpid():
+            return _client
+        try:
+            client = docker.from_env()
+            client.ping()
+        except DockerException as e:
+            raise RuntimeError(
+                "Docker is not available. Please ensure Docker is installed and running. "
+                f"Error: {e}"
+            )
+        _client, _client_pid, _api = client, os.getpid(), None
         return client
-    except DockerException as e:
-        raise RuntimeError(
-            "Docker is not available. Please ensure Docker is installed and running. "
-            f"Error: {e}"
-        )
+
+
+def get_docker_api() -> Any:
+    """
+    Low-level client for the execs the runner makes per command.
+
+    The lean EngineClient for a daemon on a local unix socket, otherwise
+    docker-py's APIClient.
+    """
+    global _api
+    client = get_docker_client()
+    with _client_lock:
+        if _api is None:
+            _api = EngineClient.for_url(os.environ.get("DOCKER_HOST", "")) or client.api
+        return _api
 
 
 def execute_command(
     command: str,
     timeout: int = 30,
-    image: str = "linux-sandbox:latest",
+    image: str = DEFAULT_IMAGE,
     working_dir: str = "/home/learner",
 ) -> Dict[str, Any]:
     """
     Execute a command in a Docker container and return the result.
 
+    Every command gets a fresh container: one started ahead of time from
+    the pool when available, which is removed in the background afterwards.
+
     Args:
         command: The shell command to execute
         timeout: Maximum execution time in seconds
@@ -34,10 +86,11 @@ def execute_command(
         working_dir: Working directory inside the container
 
     Returns:
-        Dictionary with 'output', 'exit_code', and optionally 'error'
+        Dictionary with 'output', 'exit_code', 'timed_out', 'truncated', and
+        optionally 'error'
     """
     try:
-        client = get_docker_client()
+        get_docker_client()
     except RuntimeError as e:
         return {
             "output": "",
@@ -46,50 +99,21 @@ def execute_command(
         }
 
     try:
-        # Check if image exists
-        try:
-            client.images.get(image)
-        except ImageNotFound:
-            return {
-                "output": "",
-                "exit_code": -1,
-                "error": f"Docker image '{image}' not found. Run 'docker build -t {image} docker/' to build it.",
-            }
-
-        # Run command in container
-        container = client.containers.run(
-            image,
-            command=f"/bin/bash -c {repr(command)}",
-            working_dir=working_dir,
-            remove=True,
-            detach=False,
-            stdout=True,
-            stderr=True,
-            # Security constraints
-            mem_limit="256m",
-            cpu_period=100000,
-            cpu_quota=50000,  # 50% CPU
-            network_mode="bridge",
-            # Timeouts
-            # Note: actual timeout is handled by Docker daemon
-        )
-
-        # Docker SDK returns bytes
-        output = container.decode("utf-8") if isinstance(container, bytes) else str(container)
-
+        one_shot_pool.start()
+        result = one_shot_pool.run(command, image, working_dir, timeout)
         return {
-            "output": output,
-            "exit_code": 0,
-            "error": None,
+            "output": result["output"],
+            "exit_code": result["exit_code"],
+            "timed_out": result["timed_out"],
+            "truncated": result["truncated"],
+            "error": None,  # A non-zero exit is not an error
         }
 
-    except docker.errors.ContainerError as e:
-        # Command executed but returned non-zero exit code
-        output = e.stderr.decode("utf-8") if e.stderr else ""
+    except ImageNotFound:
         return {
-            "output": output,
-            "exit_code": e.exit_status,
-            "error": None,  # Not an error, just non-zero exit
+            "output": "",
+            "exit_code": -1,
+            "error": f"Docker image '{image}' not found. Run 'docker build -t {image} docker/' to build it.",
         }
 
     except APIError as e:
@@ -107,7 +131,7 @@ def execute_command(
         }
 
 
-def check_image_exists(image: str = "linux-sandbox:latest") -> bool:
+def check_image_exists(image: str = DEFAULT_IMAGE) -> bool:
     """Check if the sandbox Docker image exists."""
     try:
         client = get_docker_client()
@@ -115,3 +139,13 @@ def check_image_exists(image: str = "linux-sandbox:latest") -> bool:
         return True
     except (ImageNotFound, RuntimeError):
         return False
+
+
+# Singleton instance for the application
+one_shot_pool = OneShotPool(
+    get_docker_client,
+    RUN_OPTIONS,
+    image=DEFAULT_IMAGE,
+    size=POOL_SIZE,
+    api_getter=get_docker_api,
+)
@@ -0,0 +1,216 @@
+"""Saving idle sessions' home directories to disk and restoring them."""
+
+import io
+import json
+import os
+import tarfile
+import tempfile
+import time
+from typing import Any, Iterator, List, Optional
+
+from docker.errors import DockerException, NotFound
+
+from app.terminal.state_store import STATE_DIR
+
+# Kinds reported by `docker diff`
+_MODIFIED, _ADDED, _DELETED = 0, 1, 2
+
+
+class HibernationStore:
+    """
+    Keeps what a learner changed in their home directory after the
+    container is removed.
+
+    Only the delta against the image is saved: `container.diff()` lists
+    changed paths, and the home directory archive is filtered down to
+    those. Deleted paths are recorded alongside so restoring reproduces
+    them too. Restoring is one `put_archive` into a fresh container
+    (plus one `rm` if anything was deleted), which is far quicker than
+    a learner redoing a lesson.
+    """
+
+    HOME = "/home/learner"
+    DEFAULT_LIMIT = 50 * 1024 * 1024
+    RETENTION_DAYS = 7
+
+    def __init__(self, directory: Optional[str] = None, limit: int = DEFAULT_LIMIT):
+        self.directory = directory or os.path.join(STATE_DIR, "hibernate")
+        self.limit = limit
+
+    def configure(self, directory: str = None, limit: int = None) -> None:
+        """Update the storage directory or the size limit."""
+        if directory:
+            self.directory = directory
+        if limit is not None:
+            self.limit = limit
+
+    def save(self, session_id: str, container: Any) -> bool:
+        """
+        Save the changes to a container's home directory.
+
+        Args:
+            session_id: Session the container belongs to
+            container: The session's container (running, paused or stopped)
+
+        Returns:
+            True if saved; False if nothing changed or the changed files
+            exceeded the size limit
+
+        Raises:
+            HibernationFailed: If Docker or the disk failed, so the
+                changes were not saved and the container should be kept
+            NotFound: If the container no longer exists
+        """
+        prefix = self.HOME + "/"
+        try:
+            changes = container.diff() or []
+        except NotFound:
+            raise
+        except DockerException as e:
+            raise HibernationFailed(f"Could not list changed files: {e}") from e
+        changed = {
+            change["Path"]
+            for change in changes
+            if change["Kind"] in (_MODIFIED, _ADDED)
+            and change["Path"].startswith(prefix)
+        }
+        deleted = sorted(
+            change["Path"]
+            for change in changes
+            if change["Kind"] == _DELETED and change["Path"].startswith(prefix)
+        )
+        if not changed and not deleted:
+            self.discard(session_id)
+            return False
+
+        base = os.path.dirname(self.HOME)
+        partial = None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, partial = tempfile.mkstemp(dir=self.directory, suffix=".part")
+            chunks, _ = container.get_archive(self.HOME)
+            size = 0
+            # Read the home directory archive as it streams in, keeping
+            # only the changed members; unchanged files never touch disk
+            with os.fdopen(fd, "wb") as out, tarfile.open(
+                fileobj=_ChunkReader(chunks), mode="r|"
+            ) as source:
+                with tarfile.open(fileobj=out, mode="w") as delta:
+                    for member in source:
+                        path = f"{base}/{member.name}".rstrip("/")
+                        if path not in changed:
+                            continue
+                        size += member.size if member.isfile() else 0
+                        if size > self.limit:
+                            raise _TooLarge()
+                        data = source.extractfile(member) if member.isfile() else None
+                        delta.addfile(member, data)
+            with open(self._path(session_id, ".json"), "w") as manifest:
+                json.dump({"deleted": deleted, "saved": time.time()}, manifest)
+            os.replace(partial, self._path(session_id, ".tar"))
+        except _TooLarge:
+            self._remove_partial(partial)
+            return False
+        except NotFound:
+            self._remove_partial(partial)
+            raise
+        except (DockerException, OSError, tarfile.TarError) as e:
+            self._remove_partial(partial)
+            raise HibernationFailed(f"Could not save the home directory: {e}") from e
+        return True
+
+    def restore(self, session_id: str, container: Any) -> bool:
+        """
+        Apply a saved home directory delta to a fresh container.
+
+        Returns:
+            True if a saved delta was restored (and then discarded)
+        """
+        tar_path = self._path(session_id, ".tar")
+        if not os.path.exists(tar_path):
+            return False
+        try:
+            with open(tar_path, "rb") as archive:
+                data = archive.read()
+            deleted = self._deleted(session_id)
+            if not container.put_archive(os.path.dirname(self.HOME), data):
+                return False
+            if deleted:
+                container.exec_run(["rm", "-rf", "--"] + deleted)
+        except (OSError, ValueError, DockerException):
+            return False
+        self.discard(session_id)
+        return True
+
+    def has(self, session_id: str) -> bool:
+        """Whether a session has a saved delta."""
+        return os.path.exists(self._path(session_id, ".tar"))
+
+    def discard(self, session_id: str) -> None:
+        """Delete a session's saved delta."""
+        for suffix in (".tar", ".json"):
+            try:
+                os.remove(self._path(session_id, suffix))
+            except FileNotFoundError:
+                pass
+
+    def prune(self) -> None:
+        """Delete deltas saved more than RETENTION_DAYS ago."""
+        cutoff = time.time() - self.RETENTION_DAYS * 24 * 60 * 60
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def _remove_partial(self, partial: Optional[str]) -> None:
+        if partial and os.path.exists(partial):
+            os.remove(partial)
+
+    def _deleted(self, session_id: str) -> List[str]:
+        try:
+            with open(self._path(session_id, ".json")) as manifest:
+                return json.load(manifest).get("deleted", [])
+        except FileNotFoundError:
+            return []
+
+    def _path(self, session_id: str, suffix: str) -> str:
+        # Session ids come from our own cookie, but never trust them as paths
+        safe = "".join(c for c in session_id if c.isalnum() or c in "-_")
+        return os.path.join(self.directory, f"{safe}{suffix}")
+
+
+class HibernationFailed(Exception):
+    """A home directory could not be saved; its container must not be removed."""
+
+
+class _TooLarge(Exception):
+    """The changed files add up to more than the size limit."""
+
+
+class _ChunkReader(io.RawIOBase):
+    """Read-only file over an iterator of byte chunks, for tarfile's stream mode."""
+
+    def __init__(self, chunks: Iterator[bytes]):
+        self._chunks = iter(chunks)
+        self._buffer = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, target) -> int:
+        while not self._buffer:
+            self._buffer = next(self._chunks, None)
+            if self._buffer is None:
+                self._buffer = b""
+                return 0
+        size = min(len(target), len(self._buffer))
+        target[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
@@ -0,0 +1,211 @@
+"""Background execution jobs polled for their result by job id."""
+
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from app.terminal.state_store import SqliteStore
+
+
+class JobStore(SqliteStore):
+    """
+    Job states shared between workers.
+
+    A job runs in the worker that accepted it, but the client's next
+    request may land on any worker, so every state change is written here.
+    """
+
+    FILENAME = "jobs.db"
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS jobs ("
+        "job_id TEXT PRIMARY KEY, session_id TEXT NOT NULL, status TEXT NOT NULL, "
+        "result TEXT, updated REAL NOT NULL)"
+    )
+
+    def save(self, job: Dict[str, Any]) -> None:
+        """Insert or update a job."""
+        result = job.get("result")
+        self._write(
+            "INSERT OR REPLACE INTO jobs (job_id, session_id, status, result, updated) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (
+                job["job_id"],
+                job["session_id"],
+                job["status"],
+                json.dumps(result) if result is not None else None,
+                time.time(),
+            ),
+        )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Get a job by id, or None if it is unknown."""
+        rows = self._query(
+            "SELECT session_id, status, result FROM jobs WHERE job_id = ?", (job_id,)
+        )
+        if not rows:
+            return None
+        session_id, status, result = rows[0]
+        return {
+            "job_id": job_id,
+            "session_id": session_id,
+            "status": status,
+            "result": json.loads(result) if result is not None else None,
+        }
+
+    def prune(self, before: float) -> None:
+        """Delete jobs last updated before a timestamp."""
+        self._write("DELETE FROM jobs WHERE updated < ?", (before,))
+
+
+class JobManager:
+    """
+    Runs commands on a bounded thread pool so requests return immediately.
+
+    `submit` hands back a job id at once; the command runs on one of
+    `max_workers` threads, with at most `max_pending` more waiting in
+    line. Clients fetch the result with `get`, optionally long-polling
+    until the job finishes.
+    """
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    # Finished jobs are kept this long for clients to collect
+    RESULT_TTL_SECONDS = 3600
+    # How often a waiter checks the store for jobs run by other workers
+    POLL_SECONDS = 0.5
+
+    def __init__(self, max_workers: int = 8, max_pending: int = 32):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.store = JobStore()
+        # Jobs accepted by this process, by job id
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._finished = threading.Condition(self._lock)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_pid: Optional[int] = None
+
+    def init_app(self, app) -> None:
+        """Apply job settings from the Flask app config."""
+        self.max_workers = app.config.get("SANDBOX_JOB_WORKERS", self.max_workers)
+        self.max_pending = app.config.get("SANDBOX_JOB_QUEUE", self.max_pending)
+        state_dir = app.config.get("SANDBOX_STATE_DIR")
+        if state_dir:
+            self.store.configure(state_dir)
+
+    def submit(
+        self, session_id: str, func: Callable[[], Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """
+        Queue a call to run in the background.
+
+        Args:
+            session_id: Session that owns the job
+            func: Callable returning the job's result dictionary
+
+        Returns:
+            Dictionary with the job id, or an error if the queue is full
+        """
+        job_id = uuid.uuid4().hex
+        job = {
+            "job_id": job_id,
+            "session_id": session_id,
+            "status": self.QUEUED,
+            "result": None,
+        }
+        with self._lock:
+            self._prune_locked()
+            unfinished = sum(1 for j in self._jobs.values() if j["status"] != self.DONE)
+            if unfinished >= self.max_workers + self.max_pending:
+                return {
+                    "success": False,
+                    "error": "Too many commands are waiting to run. Please try again shortly.",
+                }
+            self._jobs[job_id] = job
+            executor = self._get_executor_locked()
+        self.store.prune(time.time() - self.RESULT_TTL_SECONDS)
+        self.store.save(job)
+        executor.submit(self._run, job_id, func)
+        return {"success": True, "job_id": job_id, "status": self.QUEUED}
+
+    def get(
+        self, job_id: str, session_id: str, wait: float = 0
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Get a job's status, waiting up to `wait` seconds for it to finish.
+
+        Args:
+            job_id: Id returned by submit
+            session_id: Session asking; jobs of other sessions are not found
+            wait: Seconds to wait for the job to finish
+
+        Returns:
+            Dictionary with job_id, status and (once done) result, or None
+        """
+        deadline = time.monotonic() + wait
+        while True:
+            job = self._lookup(job_id)
+            if job is None or job["session_id"] != session_id:
+                return None
+            remaining = deadline - time.monotonic()
+            if job["status"] == self.DONE or remaining <= 0:
+                view = {"job_id": job_id, "status": job["status"]}
+                if job["status"] == self.DONE:
+                    view["result"] = job["result"]
+                return view
+            with self._finished:
+                local = self._jobs.get(job_id)
+                if local is None or local["status"] != self.DONE:
+                    # Local jobs wake us when they finish; others are polled
+                    self._finished.wait(min(self.POLL_SECONDS, remaining))
+
+    def _lookup(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return dict(job)
+        return self.store.get(job_id)
+
+    def _run(self, job_id: str, func: Callable[[], Dict[str, Any]]) -> None:
+        self._update(job_id, status=self.RUNNING)
+        try:
+            result = func()
+        except Exception as e:
+            result = {"error": str(e)}
+        self._update(job_id, status=self.DONE, result=result, finished=time.monotonic())
+
+    def _update(self, job_id: str, **changes) -> None:
+        with self._finished:
+            job = self._jobs[job_id]
+            job.update(changes)
+            snapshot = dict(job)
+            if job["status"] == self.DONE:
+                self._finished.notify_all()
+        self.store.save(snapshot)
+
+    def _get_executor_locked(self) -> ThreadPoolExecutor:
+        # Forked workers can't use the parent's threads; start their own pool
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="sandbox-job"
+            )
+            self._executor_pid = os.getpid()
+        return self._executor
+
+    def _prune_locked(self) -> None:
+        cutoff = time.monotonic() - self.RESULT_TTL_SECONDS
+        for job_id in [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job["status"] == self.DONE and job["finished"] < cutoff
+        ]:
+            del self._jobs[job_id]
+
+
+# Singleton instance for the application
+job_manager = JobManager()
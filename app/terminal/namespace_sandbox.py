@@ -0,0 +1,1086 @@
+"""Sandbox sessions in Linux namespaces instead of Docker containers."""
+
+import fcntl
+import os
+import re
+import shutil
+import signal
+import socket
+import sqlite3
+import struct
+import subprocess
+import tarfile
+import tempfile
+import termios
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import docker
+from docker.errors import DockerException, ImageNotFound
+
+from app.terminal.backend import BACKPRESSURE_KEYS, SandboxBackend
+from app.terminal.capacity import CapacityManager
+from app.terminal.hibernate import HibernationStore
+from app.terminal.output import OutputCapture
+from app.terminal.pty_bridge import PtySession
+from app.terminal.reaper import Reaper
+from app.terminal.session_sandbox import SessionSandbox
+from app.terminal.shell_session import MarkerReader, PersistentShell, ShellClosed
+from app.terminal.state_store import STATE_DIR, SqliteStore
+
+# Runs as root of the new namespaces with the host's tools: gives the
+# session a read-only view of the shared root filesystem with its own
+# home, /tmp and a few harmless devices, makes that the root, and then
+# runs the given command (_LEARNER_SCRIPT). This shell stays behind
+# as the namespaces' first process, so terminals can join them later (see
+# NamespaceSandbox.open_pty).
+_SETUP_SCRIPT = """
+set -e
+root=$1 home=$2 workdir=$3
+mount --bind "$root" "$root"
+mount -o remount,bind,ro,nosuid,nodev "$root"
+mount -t proc -o nosuid,nodev,noexec proc "$root/proc"
+mount -t tmpfs -o "nosuid,nodev,size=$4,mode=1777" tmpfs "$root/tmp"
+mount -t tmpfs -o nosuid,noexec,size=64k,mode=755 tmpfs "$root/dev"
+for dev in null zero full random urandom tty; do
+    touch "$root/dev/$dev"
+    mount --bind "/dev/$dev" "$root/dev/$dev"
+done
+for fd in 0:stdin 1:stdout 2:stderr; do
+    ln -s "/proc/self/fd/${fd%%:*}" "$root/dev/${fd#*:}"
+done
+ln -s /proc/self/fd "$root/dev/fd"
+mount --bind "$home" "$root/home/learner"
+ip link set lo up 2>/dev/null || true
+hostname sandbox 2>/dev/null || true
+cd "$root"
+pivot_root . .
+umount -l .
+cd "$workdir" 2>/dev/null || cd /
+shift 4
+"$@"
+"""
+
+# Runs a command as the learner (uid and gid 1000 in the image), with the
+# image's tools. Root here is the worker's user on the host, the only user
+# the namespaces map, so the command gets a user namespace of its own that
+# maps the learner to it. The image's unshare predates --map-user, so a
+# background subshell writes the mapping from outside, like newuidmap,
+# and then lets the command start. The command itself runs in the
+# foreground, since background commands would start with SIGINT ignored.
+_LEARNER_SCRIPT = """
+ready=/dev/.learner-$$
+mkfifo -m 600 "$ready"
+(
+    until echo deny 2>/dev/null > "/proc/$$/setgroups"; do
+        sleep 0.01
+    done
+    echo "1000 0 1" > "/proc/$$/uid_map"
+    echo "1000 0 1" > "/proc/$$/gid_map"
+    echo > "$ready"
+    rm -f "$ready"
+) &
+exec unshare --user /bin/sh -c 'read _ < "$0"; exec "$@"' "$ready" "$@"
+"""
+
+# Session ids become directory names
+_SESSION_ID = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+class ShellRegistry(SqliteStore):
+    """
+    Namespace sessions running in any worker on this host.
+
+    A session's shell lives in the worker that started it, so workers
+    record their shells here to share one session limit. Each row names
+    its worker by pid and start time; rows of workers that have exited
+    are cleared when the next shell is claimed.
+    """
+
+    FILENAME = "namespace-shells.db"
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS shells ("
+        "session_id TEXT PRIMARY KEY, worker TEXT NOT NULL)"
+    )
+
+    def claim(self, session_id: str, limit: int) -> bool:
+        """
+        Record a shell for a session if fewer than `limit` are running.
+
+        Returns:
+            True if the session may start its shell; False at the limit,
+            or when the registry can't be read
+        """
+        try:
+            connection = self._connection()
+            with connection:
+                connection.execute("BEGIN IMMEDIATE")
+                workers = connection.execute("SELECT DISTINCT worker FROM shells").fetchall()
+                connection.executemany(
+                    "DELETE FROM shells WHERE worker = ?",
+                    [row for row in workers if not _worker_alive(row[0])],
+                )
+                running = connection.execute(
+                    "SELECT COUNT(*) FROM shells WHERE session_id != ?", (session_id,)
+                ).fetchone()[0]
+                if running >= limit:
+                    return False
+                connection.execute(
+                    "INSERT OR REPLACE INTO shells (session_id, worker) VALUES (?, ?)",
+                    (session_id, _worker_id(os.getpid())),
+                )
+                return True
+        except (sqlite3.Error, OSError):
+            # Unknown load; refuse rather than exceed the limit
+            return False
+
+    def release(self, session_id: str) -> None:
+        """Forget this worker's shell for a session."""
+        self._write(
+            "DELETE FROM shells WHERE session_id = ? AND worker = ?",
+            (session_id, _worker_id(os.getpid())),
+        )
+
+
+class NamespaceShell(PersistentShell):
+    """
+    PersistentShell running in a session's namespaces on this host.
+
+    The shell's stdin and stdout are a socket pair rather than a Docker
+    attach stream, and helper commands (signalling a runaway command)
+    run on the host against the shell's host PID. Closing the shell
+    kills the namespaces' first process, which ends every process the
+    learner started.
+    """
+
+    # Seconds the namespaces get to come up
+    START_TIMEOUT_SECONDS = 10
+
+    def __init__(self, argv: List[str], env: Dict[str, str], container: str):
+        """
+        Start the namespaces and the shell in them.
+
+        Args:
+            argv: Command line that sets up the namespaces and runs bash
+            env: Environment for the command line
+            container: Name of the session's sandbox
+
+        Raises:
+            ShellClosed: If the sandbox could not be set up; its output
+                says why
+        """
+        self.container = container
+        self._marker = uuid.uuid4().hex.encode()
+        self._sock, theirs = socket.socketpair()
+        self._socket = self._sock
+        try:
+            self._process = subprocess.Popen(
+                argv,
+                stdin=theirs,
+                stdout=theirs,
+                stderr=subprocess.STDOUT,
+                env=env,
+                start_new_session=True,
+            )
+        finally:
+            theirs.close()
+        self._reader = MarkerReader(self._marker)
+        self.closed = False
+        self.last_exit_code: Optional[int] = None
+        self.timed_out = False
+        # Host PIDs of the namespaces' first process and of bash, which
+        # live inside the PID namespace under other numbers
+        self.init_pid = self._process.pid
+        self.pid = self._process.pid
+
+        self._send(self.SETUP)
+        self.run("true", timeout=self.START_TIMEOUT_SECONDS)
+        if self.timed_out:
+            self.close()
+            raise ShellClosed(b"Timed out setting up the sandbox")
+        self.init_pid = _child_pid(self._process.pid) or self.init_pid
+        self.pid = _child_pid(self.init_pid) or self.pid
+
+    @property
+    def alive(self) -> bool:
+        """Whether the shell can still take commands."""
+        return not self.closed and self._process.poll() is None
+
+    def exit_code(self) -> Optional[int]:
+        """Exit code of the shell once it has ended."""
+        try:
+            return self._process.wait(timeout=self.KILL_GRACE_SECONDS)
+        except subprocess.TimeoutExpired:
+            return None
+
+    def close(self) -> None:
+        """Close the shell and end everything running in its namespaces."""
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self._sock.close()
+        except OSError:
+            pass
+        for pid in (self.init_pid, self._process.pid):
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except OSError:
+                pass
+        try:
+            self._process.wait(timeout=self.KILL_GRACE_SECONDS)
+        except subprocess.TimeoutExpired:
+            pass
+
+    def _exec(self, cmd) -> None:
+        """Run a helper command on the host."""
+        try:
+            subprocess.run(
+                cmd,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                timeout=self.KILL_GRACE_SECONDS,
+            )
+        except (OSError, subprocess.SubprocessError):
+            pass
+
+    def _read_stream(self, deadline: Optional[float] = None) -> bytes:
+        """
+        Read the next chunk of output.
+
+        Raises:
+            socket.timeout: If nothing arrived before the deadline
+        """
+        return self._recv(self.READ_SIZE, deadline)
+
+
+class NamespacePty:
+    """PtySession for a terminal that joins a session's namespaces."""
+
+    READ_SIZE = PtySession.READ_SIZE
+
+    def __init__(
+        self,
+        argv: List[str],
+        env: Dict[str, str],
+        cols: int = 80,
+        rows: int = 24,
+        on_input: Optional[Callable[[], None]] = None,
+    ):
+        """
+        Start a command on a new pseudo-terminal.
+
+        Args:
+            argv: Command line to run; it must make the terminal its
+                controlling tty (e.g. with `setsid --ctty`)
+            env: Environment for the command line
+            cols: Initial terminal width
+            rows: Initial terminal height
+            on_input: Called whenever the user sends input
+        """
+        self._on_input = on_input
+        self._master, terminal = os.openpty()
+        self.closed = False
+        try:
+            self.resize(cols, rows)
+            self._process = subprocess.Popen(
+                argv, stdin=terminal, stdout=terminal, stderr=terminal, env=env
+            )
+        except OSError:
+            os.close(self._master)
+            raise
+        finally:
+            os.close(terminal)
+
+    def read(self) -> bytes:
+        """Read terminal output; returns b"" once the shell has exited."""
+        try:
+            return os.read(self._master, self.READ_SIZE)
+        except OSError:
+            return b""
+
+    def write(self, data: bytes) -> None:
+        """Send keystrokes to the terminal."""
+        if self._on_input is not None:
+            self._on_input()
+        while data:
+            data = data[os.write(self._master, data):]
+
+    def resize(self, cols: int, rows: int) -> None:
+        """Resize the terminal."""
+        try:
+            fcntl.ioctl(self._master, termios.TIOCSWINSZ, struct.pack("HHHH", rows, cols, 0, 0))
+        except OSError:
+            pass
+
+    def close(self) -> None:
+        """Close the terminal, which hangs up the shell."""
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            os.close(self._master)
+        except OSError:
+            pass
+        try:
+            self._process.wait(timeout=PersistentShell.KILL_GRACE_SECONDS)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+
+
+class NamespaceSandbox(SandboxBackend):
+    """
+    Runs each session in Linux namespaces on this host instead of a
+    Docker container.
+
+    A session is bash in its own user, mount, PID, network, UTS and IPC
+    namespaces, with the sandbox image's root filesystem (unpacked once
+    and shared by every session) mounted read-only, plus the session's
+    own home directory and /tmp. Starting one is a fork and a handful of
+    mounts, so a new session's first command answers in milliseconds
+    instead of waiting for a container. Nothing needs privileges: root
+    inside the namespaces, and the learner user bash runs as, are the
+    worker's own user outside. With a delegated cgroup v2 directory
+    configured, sessions also get the containers' memory, CPU and
+    process limits.
+
+    Only use this where the kernel's isolation is trusted, i.e. with
+    unprivileged user namespaces enabled and kept patched. The network
+    namespace has loopback only. A session's namespaces live as long as
+    its shell, in the worker that started it: the home directory is on
+    disk and outlives both, but with several workers, the shell's
+    working directory and variables only carry over between commands
+    served by the same worker. The session limit covers all workers on
+    the host (see ShellRegistry).
+
+    As in the Docker image, the learner can't become root: nothing in
+    the namespaces can gain privileges beyond the worker's own user.
+    """
+
+    HOME = "/home/learner"
+    DEFAULT_IMAGE = SessionSandbox.DEFAULT_IMAGE
+    IDLE_TIMEOUT_MINUTES = SessionSandbox.IDLE_TIMEOUT_MINUTES
+    LOCK_STRIPES = SessionSandbox.LOCK_STRIPES
+    # Home directories untouched for this long are deleted
+    RETENTION_DAYS = HibernationStore.RETENTION_DAYS
+    TMP_SIZE = "64m"
+    # The containers' limits, plus a cap on processes
+    CGROUP_LIMITS = {
+        "memory.max": SessionSandbox.CONTAINER_OPTIONS["mem_limit"].upper(),
+        "cpu.max": (
+            f"{SessionSandbox.CONTAINER_OPTIONS['cpu_quota']} "
+            f"{SessionSandbox.CONTAINER_OPTIONS['cpu_period']}"
+        ),
+        "pids.max": "256",
+    }
+    SHELL_ENV = {
+        "PATH": "/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin",
+        "HOME": HOME,
+        "USER": "learner",
+        "LANG": "C.UTF-8",
+    }
+
+    def __init__(
+        self,
+        client_factory: Optional[Callable[[], docker.DockerClient]] = None,
+    ):
+        """
+        Args:
+            client_factory: Creates the Docker client used to unpack the
+                image when no root filesystem is ready
+        """
+        self._client_factory = client_factory or docker.from_env
+        self.image = self.DEFAULT_IMAGE
+        self.rootfs = os.path.join(STATE_DIR, "rootfs")
+        self.homes = os.path.join(STATE_DIR, "homes")
+        self.cgroup_root: Optional[str] = None
+        self.max_sessions = 50
+        # Shells of every worker, counted against max_sessions
+        self.registry = ShellRegistry()
+        self._rootfs_ready = False
+        self._rootfs_lock = threading.Lock()
+        # Guards the shared registries below; never held while starting shells
+        self._lock = threading.RLock()
+        self._session_locks = [threading.RLock() for _ in range(self.LOCK_STRIPES)]
+        # Running shell, and so namespaces, of each session in this worker
+        self._shells: Dict[str, NamespaceShell] = {}
+        self._last_activity: Dict[str, datetime] = {}
+        # Shells belong to this worker, so every worker reaps its own
+        self.reaper = Reaper(self.reap_expired, lock_path=None)
+
+    def init_app(self, app) -> None:
+        """Apply sandbox settings from the Flask app config."""
+        self.image = app.config.get("DOCKER_IMAGE", self.DEFAULT_IMAGE)
+        state_dir = app.config.get("SANDBOX_STATE_DIR") or STATE_DIR
+        self.rootfs = app.config.get("SANDBOX_ROOTFS") or os.path.join(state_dir, "rootfs")
+        self.homes = os.path.join(state_dir, "homes")
+        self.cgroup_root = app.config.get("SANDBOX_CGROUP_ROOT") or None
+        self.max_sessions = app.config.get("SANDBOX_MAX_CONTAINERS", self.max_sessions)
+        self.registry.configure(state_dir)
+        self.reaper.interval = app.config.get("SANDBOX_REAP_INTERVAL", 30)
+        with self._rootfs_lock:
+            self._rootfs_ready = False
+
+    def start(self) -> None:
+        """Start the reaper and unpack the image in the background if needed."""
+        self.reaper.start()
+        if not self._rootfs_ready:
+            threading.Thread(
+                target=self._prepare_quietly, name="sandbox-rootfs", daemon=True
+            ).start()
+
+    def _session_lock(self, session_id: str) -> threading.RLock:
+        """Get the lock stripe guarding a session's shell."""
+        return self._session_locks[hash(session_id) % len(self._session_locks)]
+
+    def _container_name(self, session_id: str) -> str:
+        """Get the sandbox name for a session."""
+        return f"{SessionSandbox.CONTAINER_PREFIX}{session_id}"
+
+    def _home(self, session_id: str) -> str:
+        """Host directory holding a session's home directory."""
+        if not _SESSION_ID.match(session_id):
+            raise ValueError(f"Invalid session id: {session_id!r}")
+        return os.path.join(self.homes, session_id)
+
+    def _update_activity(self, session_id: str) -> None:
+        """Note that a session was just used."""
+        with self._lock:
+            self._last_activity[session_id] = datetime.now()
+        try:
+            # The home's timestamp tells any worker how recently it was used
+            os.utime(self._home(session_id))
+        except OSError:
+            pass
+
+    # Root filesystem
+
+    def prepare_rootfs(self) -> None:
+        """
+        Make sure the root filesystem is ready, unpacking the image if needed.
+
+        A directory that already exists at SANDBOX_ROOTFS is used as it
+        is, e.g. one made with `docker export $(docker create IMAGE) |
+        tar -x -C DIR`. Otherwise the configured image is exported through
+        Docker once and unpacked there.
+
+        Raises:
+            RuntimeError: If there is no root filesystem and the image
+                can't be unpacked
+        """
+        with self._rootfs_lock:
+            if self._rootfs_ready:
+                return
+            if not os.path.isdir(os.path.join(self.rootfs, "bin")):
+                try:
+                    unpack_image(self._client_factory(), self.image, self.rootfs)
+                except ImageNotFound:
+                    raise RuntimeError(
+                        f"Docker image '{self.image}' not found. "
+                        f"Run 'docker build -t {self.image} docker/' to build it."
+                    )
+                except (DockerException, OSError, tarfile.TarError) as e:
+                    raise RuntimeError(f"Could not unpack '{self.image}': {e}")
+            for path in ("proc", "dev", "tmp", self.HOME.lstrip("/")):
+                os.makedirs(os.path.join(self.rootfs, path), exist_ok=True)
+            self._rootfs_ready = True
+
+    def _prepare_quietly(self) -> None:
+        try:
+            self.prepare_rootfs()
+        except RuntimeError:
+            # Reported to the first session that needs it
+            pass
+
+    # Sessions
+
+    def get_or_create_container(
+        self, session_id: str, image: str = None, workdir: str = HOME
+    ) -> Dict[str, Any]:
+        """
+        Get the session's running sandbox, starting one if needed.
+
+        Args:
+            session_id: Unique session identifier
+            image: Image the session should run; only the configured one is available
+            workdir: Starting directory when the shell is started
+
+        Returns:
+            Dictionary with container info or error
+        """
+        if image and image != self.image:
+            return {
+                "success": False,
+                "error": f"Only the '{self.image}' image is available in this sandbox.",
+            }
+        with self._session_lock(session_id):
+            shell = self._shells.get(session_id)
+            if shell is not None and shell.alive:
+                self._update_activity(session_id)
+                return {
+                    "success": True,
+                    "container_id": str(shell.init_pid),
+                    "status": "running",
+                    "created": False,
+                }
+            self._close_shell(session_id)
+
+            if not self.registry.claim(session_id, self.max_sessions):
+                return {
+                    "success": False,
+                    "error": "The sandbox is at capacity. Please try again in a moment.",
+                    "retry_after": CapacityManager.RETRY_SECONDS,
+                }
+
+            try:
+                self.prepare_rootfs()
+                home = self._home(session_id)
+                created = not os.path.isdir(home)
+                if created:
+                    # Start from the image's home directory
+                    shutil.copytree(
+                        os.path.join(self.rootfs, self.HOME.lstrip("/")), home, symlinks=True
+                    )
+                shell = NamespaceShell(
+                    self._shell_argv(session_id, home, workdir),
+                    self.SHELL_ENV,
+                    self._container_name(session_id),
+                )
+            except ShellClosed as e:
+                self.registry.release(session_id)
+                return {
+                    "success": False,
+                    "error": "Could not start the sandbox: "
+                    + e.output.decode("utf-8", "replace").strip(),
+                }
+            except Exception as e:
+                self.registry.release(session_id)
+                return {"success": False, "error": str(e)}
+
+            with self._lock:
+                self._shells[session_id] = shell
+            self._update_activity(session_id)
+            return {
+                "success": True,
+                "container_id": str(shell.init_pid),
+                "status": "running",
+                "created": created,
+            }
+
+    def _shell_argv(self, session_id: str, home: str, workdir: str) -> List[str]:
+        """Command line that starts a session's namespaces with bash in them."""
+        argv = [
+            "unshare",
+            "--user",
+            "--map-root-user",
+            "--mount",
+            "--pid",
+            "--fork",
+            "--kill-child",
+            "--net",
+            "--uts",
+            "--ipc",
+            "/bin/sh",
+            "-c",
+            _SETUP_SCRIPT,
+            "sandbox-init",
+            self.rootfs,
+            home,
+            workdir,
+            self.TMP_SIZE,
+            *self._learner_argv(),
+            *PersistentShell.SHELL_COMMAND,
+        ]
+        procs = self._cgroup_procs(session_id)
+        if procs:
+            # Join the cgroup before starting, so every process is in it
+            argv = ["/bin/sh", "-c", 'echo $$ > "$0" && exec "$@"', procs] + argv
+        return argv
+
+    def _learner_argv(self) -> List[str]:
+        """Prefix that runs a command as the learner user, inside the namespaces."""
+        return ["/bin/sh", "-c", _LEARNER_SCRIPT, "sandbox-learner"]
+
+    def _cgroup_procs(self, session_id: str) -> Optional[str]:
+        """
+        Create a session's cgroup with the sandbox limits.
+
+        Returns:
+            Path of its cgroup.procs file, or None without usable cgroups
+        """
+        if not self.cgroup_root:
+            return None
+        path = os.path.join(self.cgroup_root, self._container_name(session_id))
+        try:
+            with open(os.path.join(self.cgroup_root, "cgroup.subtree_control"), "w") as f:
+                f.write("+memory +cpu +pids")
+        except OSError:
+            # Already enabled, or managed by whoever delegated the directory
+            pass
+        try:
+            os.makedirs(path, exist_ok=True)
+        except OSError:
+            return None
+        for name, value in self.CGROUP_LIMITS.items():
+            try:
+                with open(os.path.join(path, name), "w") as f:
+                    f.write(value)
+            except OSError:
+                # That controller isn't available here
+                pass
+        return os.path.join(path, "cgroup.procs")
+
+    def _close_shell(self, session_id: str) -> None:
+        """End the session's shell and namespaces, if any."""
+        with self._lock:
+            shell = self._shells.pop(session_id, None)
+        if shell is not None:
+            shell.close()
+            self.registry.release(session_id)
+        if self.cgroup_root:
+            try:
+                os.rmdir(os.path.join(self.cgroup_root, self._container_name(session_id)))
+            except OSError:
+                pass
+
+    def stream_command(
+        self,
+        session_id: str,
+        command: str,
+        workdir: str = HOME,
+        image: str = None,
+        timeout: Optional[float] = None,
+        output_limit: int = OutputCapture.DEFAULT_LIMIT,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Execute a command in the session's shell, yielding output as it arrives.
+
+        Args:
+            session_id: Unique session identifier
+            command: Shell command to execute
+            workdir: Starting directory when the session's shell is started
+            image: Image the session should run
+            timeout: Seconds before the command is killed (None for no limit)
+            output_limit: Maximum bytes of output to pass on
+
+        Yields:
+            Dictionaries with an output chunk, then a final dictionary
+            with exit_code, timed_out, truncated and error
+        """
+        with self._session_lock(session_id):
+            sandbox_result = self.get_or_create_container(session_id, image, workdir)
+            if not sandbox_result.get("success"):
+                final = {
+                    "exit_code": -1,
+                    "timed_out": False,
+                    "truncated": False,
+                    "error": sandbox_result.get("error"),
+                }
+                for key in BACKPRESSURE_KEYS:
+                    if key in sandbox_result:
+                        final[key] = sandbox_result[key]
+                yield final
+                return
+
+            capture = OutputCapture(output_limit)
+            shell = self._shells[session_id]
+            chunks = None
+            try:
+                chunks = shell.stream(command, timeout)
+                for chunk in chunks:
+                    text = capture.feed(chunk)
+                    if text:
+                        yield {"output": text}
+                self._update_activity(session_id)
+                final = {
+                    "exit_code": shell.last_exit_code,
+                    "timed_out": shell.timed_out,
+                    "error": None,
+                }
+
+            except ShellClosed as e:
+                # The command ended the shell (e.g. `exit`); the next
+                # command starts fresh namespaces with the same home
+                self._close_shell(session_id)
+                text = capture.feed(e.output)
+                if text:
+                    yield {"output": text}
+                exit_code = shell.exit_code()
+                final = {
+                    "exit_code": exit_code if exit_code is not None else -1,
+                    "timed_out": shell.timed_out,
+                    "error": None,
+                }
+
+            except Exception as e:
+                final = {"exit_code": -1, "timed_out": False, "error": str(e)}
+
+            finally:
+                # Stop reading if the consumer went away mid-command
+                if chunks is not None:
+                    chunks.close()
+
+            text = capture.finish()
+            if text:
+                yield {"output": text}
+            final["truncated"] = capture.truncated
+            yield final
+
+    def execute_batch(
+        self,
+        session_id: str,
+        commands: List[str],
+        workdir: str = HOME,
+        image: str = None,
+        timeout: Optional[float] = None,
+        output_limit: int = OutputCapture.DEFAULT_LIMIT,
+    ) -> Dict[str, Any]:
+        """
+        Execute several commands in order in the session's shell.
+
+        See SessionSandbox.execute_batch.
+
+        Returns:
+            Dictionary with results (output, exit_code and truncated for
+            each command that ran, in order), timed_out, and optionally
+            error
+        """
+        with self._session_lock(session_id):
+            sandbox_result = self.get_or_create_container(session_id, image, workdir)
+            if not sandbox_result.get("success"):
+                response = {
+                    "results": [],
+                    "timed_out": False,
+                    "error": sandbox_result.get("error"),
+                }
+                for key in BACKPRESSURE_KEYS:
+                    if key in sandbox_result:
+                        response[key] = sandbox_result[key]
+                return response
+
+            captures = [OutputCapture(output_limit) for _ in commands]
+            outputs: List[List[str]] = [[] for _ in commands]
+            exit_codes: List[Optional[int]] = [None] * len(commands)
+            # Index of the command that was running when the batch stopped
+            current = 0
+            shell = self._shells[session_id]
+            error = None
+            try:
+                for event in shell.stream_batch(commands, timeout):
+                    current = event["index"]
+                    if "output" in event:
+                        outputs[current].append(captures[current].feed(event["output"]))
+                    else:
+                        exit_codes[current] = event["exit_code"]
+                        current += 1
+                self._update_activity(session_id)
+                if current < len(commands):
+                    # Interrupted: the shell reports the batch's status
+                    exit_codes[current] = shell.last_exit_code
+            except ShellClosed:
+                # A command ended the shell (e.g. `exit`)
+                self._close_shell(session_id)
+                if current < len(commands):
+                    exit_code = shell.exit_code()
+                    exit_codes[current] = exit_code if exit_code is not None else -1
+            except Exception as e:
+                error = str(e)
+
+            results = []
+            for index, exit_code in enumerate(exit_codes):
+                if exit_code is None:
+                    break
+                results.append({
+                    "output": "".join(outputs[index]) + captures[index].finish(),
+                    "exit_code": exit_code,
+                    "truncated": captures[index].truncated,
+                })
+            return {"results": results, "timed_out": shell.timed_out, "error": error}
+
+    def open_pty(
+        self,
+        session_id: str,
+        cols: int = 80,
+        rows: int = 24,
+        workdir: str = HOME,
+        image: str = None,
+    ) -> Dict[str, Any]:
+        """
+        Open an interactive terminal in the session's namespaces.
+
+        The terminal's bash joins the namespaces of the session's shell,
+        so both see the same files, /tmp and processes.
+
+        Returns:
+            Dictionary with the NamespacePty under "pty", or an error
+        """
+        with self._session_lock(session_id):
+            sandbox_result = self.get_or_create_container(session_id, image)
+            if not sandbox_result.get("success"):
+                return {"success": False, "error": sandbox_result.get("error")}
+            shell = self._shells[session_id]
+
+            argv = [
+                "setsid",
+                "--ctty",
+                "--wait",
+                "nsenter",
+                f"--target={shell.init_pid}",
+                "--user",
+                "--mount",
+                "--pid",
+                "--net",
+                "--uts",
+                "--ipc",
+                "--root",
+                "--wd",
+                "--preserve-credentials",
+                *self._learner_argv(),
+                "/bin/sh",
+                "-c",
+                'cd "$0" 2>/dev/null; exec "$@"',
+                workdir,
+                *PtySession.SHELL_COMMAND,
+            ]
+            try:
+                pty = NamespacePty(
+                    argv,
+                    {**self.SHELL_ENV, "TERM": "xterm-256color"},
+                    cols=cols,
+                    rows=rows,
+                    on_input=lambda: self._update_activity(session_id),
+                )
+            except Exception as e:
+                return {"success": False, "error": str(e)}
+
+            return {"success": True, "pty": pty}
+
+    def reset_session(self, session_id: str, image: str = None) -> Dict[str, Any]:
+        """
+        Replace the session's sandbox and home directory with clean ones.
+
+        Args:
+            session_id: Unique session identifier
+            image: Image the session should run
+
+        Returns:
+            Dictionary with success status and message
+        """
+        with self._session_lock(session_id):
+            self._close_shell(session_id)
+            with self._lock:
+                self._last_activity.pop(session_id, None)
+            try:
+                shutil.rmtree(self._home(session_id), ignore_errors=True)
+            except ValueError as e:
+                return {"success": False, "error": str(e)}
+
+            result = self.get_or_create_container(session_id, image)
+            if result.get("success"):
+                return {"success": True, "message": "Sandbox reset successfully"}
+            failure = {"success": False, "error": result.get("error")}
+            for key in BACKPRESSURE_KEYS:
+                if key in result:
+                    failure[key] = result[key]
+            return failure
+
+    def get_session_status(self, session_id: str) -> Dict[str, Any]:
+        """
+        Get the status of a session's sandbox.
+
+        Args:
+            session_id: Unique session identifier
+
+        Returns:
+            Dictionary with sandbox status information
+        """
+        with self._lock:
+            shell = self._shells.get(session_id)
+            last_activity = self._last_activity.get(session_id)
+        if shell is not None and shell.alive:
+            return {
+                "running": True,
+                "status": "running",
+                "id": str(shell.init_pid),
+                "session_id": session_id,
+                "last_activity": last_activity.isoformat() if last_activity else None,
+            }
+        try:
+            has_home = os.path.isdir(self._home(session_id))
+        except ValueError:
+            has_home = False
+        return {
+            "running": False,
+            # A home directory without a shell is resumed on the next command
+            "status": "exited" if has_home else "not_created",
+            "id": None,
+            "session_id": session_id,
+        }
+
+    def reap_expired(self) -> Dict[str, Any]:
+        """
+        End idle sessions' shells and delete long-unused home directories.
+
+        Called by the background reaper.
+
+        Returns:
+            Dictionary with cleanup results
+        """
+        cutoff = datetime.now() - timedelta(minutes=self.IDLE_TIMEOUT_MINUTES)
+        with self._lock:
+            idle = [
+                session_id
+                for session_id, shell in self._shells.items()
+                if not shell.alive or self._last_activity.get(session_id, cutoff) <= cutoff
+            ]
+
+        removed = []
+        for session_id in idle:
+            with self._session_lock(session_id):
+                with self._lock:
+                    last_active = self._last_activity.get(session_id)
+                if last_active is not None and last_active > cutoff:
+                    # Became active while we were scanning
+                    continue
+                self._close_shell(session_id)
+                with self._lock:
+                    self._last_activity.pop(session_id, None)
+                removed.append(session_id)
+
+        self._prune_homes()
+        return {"removed_count": len(removed), "removed_sessions": removed, "errors": []}
+
+    def cleanup_expired(self) -> Dict[str, Any]:
+        """
+        End shells idle for more than IDLE_TIMEOUT_MINUTES.
+
+        Returns:
+            Dictionary with cleanup results
+        """
+        return self.reap_expired()
+
+    def _prune_homes(self) -> None:
+        """Delete home directories no worker has used for RETENTION_DAYS."""
+        cutoff = time.time() - self.RETENTION_DAYS * 24 * 60 * 60
+        try:
+            names = os.listdir(self.homes)
+        except OSError:
+            return
+        for session_id in names:
+            path = os.path.join(self.homes, session_id)
+            try:
+                if os.stat(path).st_mtime >= cutoff:
+                    continue
+            except OSError:
+                continue
+            with self._session_lock(session_id):
+                with self._lock:
+                    if session_id in self._shells:
+                        continue
+                shutil.rmtree(path, ignore_errors=True)
+
+    def list_active_sessions(self) -> Dict[str, Any]:
+        """
+        List the sessions with a running shell in this worker.
+
+        Returns:
+            Dictionary with list of active sessions
+        """
+        with self._lock:
+            shells = list(self._shells.items())
+            activity = dict(self._last_activity)
+        sessions = []
+        for session_id, shell in shells:
+            last_activity = activity.get(session_id)
+            sessions.append({
+                "session_id": session_id,
+                "container_id": str(shell.init_pid),
+                "status": "running" if shell.alive else "exited",
+                "last_activity": last_activity.isoformat() if last_activity else None,
+            })
+        return {"sessions": sessions, "count": len(sessions)}
+
+
+def unpack_image(client: docker.DockerClient, image: str, directory: str) -> None:
+    """
+    Unpack an image's root filesystem into a directory.
+
+    The image is exported through a stopped container and extracted
+    next to the target, which is then moved into place, so a directory
+    that exists is always complete. Device files are skipped; sessions
+    get their own /dev.
+
+    Args:
+        client: Docker client
+        image: Image to unpack
+        directory: Directory to create
+    """
+    parent = os.path.dirname(os.path.abspath(directory))
+    os.makedirs(parent, exist_ok=True)
+    container = client.containers.create(image, command="true")
+    try:
+        with tempfile.TemporaryFile(dir=parent) as archive_file:
+            for chunk in container.export():
+                archive_file.write(chunk)
+            archive_file.seek(0)
+            staging = tempfile.mkdtemp(prefix=".rootfs-", dir=parent)
+            try:
+                with tarfile.open(fileobj=archive_file) as archive:
+                    members = [member for member in archive if not member.isdev()]
+                    # The image is our own build, so its links are trusted
+                    extra = {"filter": "fully_trusted"} if hasattr(tarfile, "data_filter") else {}
+                    archive.extractall(staging, members=members, numeric_owner=True, **extra)
+                os.rename(staging, directory)
+            except BaseException:
+                shutil.rmtree(staging, ignore_errors=True)
+                raise
+    finally:
+        container.remove(force=True)
+
+
+def _worker_id(pid: int) -> Optional[str]:
+    """A process's pid and start time, which together never repeat; None if it is gone."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # The command name may contain spaces; fields resume after ")"
+            fields = f.read().rsplit(")", 1)[1].split()
+    except (OSError, IndexError):
+        return None
+    return f"{pid}-{fields[19]}"
+
+
+def _worker_alive(worker: str) -> bool:
+    """Whether the process a worker id names is still running."""
+    return _worker_id(int(worker.split("-", 1)[0])) == worker
+
+
+def _child_pid(pid: int) -> Optional[int]:
+    """Host PID of a process's first child, or None if it has none."""
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            children = f.read().split()
+        if children:
+            return int(children[0])
+    except OSError:
+        pass
+    # Kernels without the children file: look for a process with this parent
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name may contain spaces; fields resume after ")"
+                fields = f.read().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        if int(fields[1]) == pid:
+            return int(entry)
+    return None
+
+
+# Singleton instance for the application
+namespace_sandbox = NamespaceSandbox()
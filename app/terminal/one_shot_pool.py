@@ -0,0 +1,203 @@
+"""Pre-started containers that each run a single command."""
+
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import docker
+from docker.errors import APIError, DockerException
+
+from app.terminal.container_pool import ContainerPool
+from app.terminal.output import OutputCapture
+
+
+class OneShotPool(ContainerPool):
+    """
+    Keeps containers running for the stateless runner, each used once.
+
+    A command takes an idle container and runs as an exec in it, so it
+    waits for neither a container boot nor a removal. Afterwards the
+    container is handed back to the background thread, which removes it
+    and starts a replacement; no command sees what an earlier one left
+    behind. When the pool is empty, or the command needs another image,
+    a container is started for it on the spot and thrown away the same way.
+    """
+
+    POOL_PREFIX = "sandbox-oneshot-"
+    POOL_LABEL = "learn-oneshot"
+    OWNER_LABEL = "learn-oneshot-owner"
+    # Seconds a timed-out command gets after SIGTERM before SIGKILL
+    KILL_GRACE_SECONDS = 2
+    # Exit statuses of `timeout` when it had to stop the command
+    TIMEOUT_EXIT_CODES = (124, 137)
+
+    def __init__(
+        self,
+        client_getter: Callable[[], docker.DockerClient],
+        run_options: Dict[str, Any],
+        image: str = "linux-sandbox:latest",
+        size: int = 0,
+        api_getter: Optional[Callable[[], Any]] = None,
+    ):
+        super().__init__(client_getter, run_options, image=image, size=size)
+        # Low-level client for execs; docker-py's unless given a leaner one
+        self._api_getter = api_getter or (lambda: client_getter().api)
+        # Used containers waiting for the background thread to remove them
+        self._spent: List[Any] = []
+        # Images known to exist, so starting a container never pulls one
+        self._images: Set[str] = set()
+
+    def run(
+        self,
+        command: str,
+        image: str,
+        workdir: str = "/home/learner",
+        timeout: Optional[float] = None,
+        output_limit: int = OutputCapture.DEFAULT_LIMIT,
+    ) -> Dict[str, Any]:
+        """
+        Run a command in a container of its own.
+
+        The command is stopped by `timeout` inside the container; should
+        that not end it, the container is removed from under it.
+
+        Args:
+            command: Shell command to execute
+            image: Image to run the command in
+            workdir: Directory to run the command in
+            timeout: Seconds before the command is killed (None for no limit)
+            output_limit: Maximum bytes of output to keep
+
+        Returns:
+            Dictionary with output, exit_code, timed_out and truncated
+
+        Raises:
+            DockerException: If Docker failed (ImageNotFound if the image
+                doesn't exist)
+        """
+        api = self._api_getter()
+        container, exec_id = self._start_exec(api, command, image, workdir, timeout)
+
+        watchdog = None
+        if timeout:
+            watchdog = threading.Timer(
+                timeout + 2 * self.KILL_GRACE_SECONDS, self._remove_all, [[container]]
+            )
+            watchdog.daemon = True
+            watchdog.start()
+
+        capture = OutputCapture(output_limit)
+        output = []
+        started = time.monotonic()
+        try:
+            chunks = api.exec_start(exec_id, stream=True)
+            try:
+                for chunk in chunks:
+                    output.append(capture.feed(chunk))
+            finally:
+                if hasattr(chunks, "close"):
+                    chunks.close()
+            output.append(capture.finish())
+            if watchdog is not None and watchdog.finished.is_set():
+                exit_code, timed_out = 137, True
+            else:
+                exit_code = api.exec_inspect(exec_id).get("ExitCode")
+                # The command itself may exit 124 or be OOM-killed; only
+                # `timeout` stopping it at the deadline counts
+                timed_out = (
+                    bool(timeout)
+                    and exit_code in self.TIMEOUT_EXIT_CODES
+                    and time.monotonic() - started >= timeout
+                )
+        finally:
+            if watchdog is not None:
+                watchdog.cancel()
+            self._recycle(container)
+
+        return {
+            "output": "".join(output),
+            "exit_code": exit_code if exit_code is not None else -1,
+            "timed_out": timed_out,
+            "truncated": capture.truncated,
+        }
+
+    def argv(self, command: str, timeout: Optional[float] = None) -> List[str]:
+        """Command line that runs a command, killed after the timeout."""
+        argv = ["/bin/bash", "-c", command]
+        if timeout:
+            argv = ["timeout", "-k", str(self.KILL_GRACE_SECONDS), str(timeout)] + argv
+        return argv
+
+    def _start_exec(
+        self,
+        api: Any,
+        command: str,
+        image: str,
+        workdir: str,
+        timeout: Optional[float],
+    ) -> Tuple[Any, str]:
+        """
+        Create the command's exec in an unused container.
+
+        Returns:
+            The container and the exec id
+        """
+        argv = self.argv(command, timeout)
+        while True:
+            with self._lock:
+                container = self._idle.pop() if image == self.image and self._idle else None
+            self._wakeup.set()
+            pooled = container is not None
+            if not pooled:
+                # Nothing pooled; start one just for this command
+                if image not in self._images:
+                    self._client_getter().images.get(image)
+                    self._images.add(image)
+                container = self._new_container(image)
+            try:
+                exec_id = api.exec_create(container.id, argv, workdir=workdir)["Id"]
+            except APIError as e:
+                self._recycle(container)
+                if pooled and e.status_code in (404, 409):
+                    # The pooled container died or was removed; take another
+                    continue
+                raise
+            return container, exec_id
+
+    def _recycle(self, container: Any) -> None:
+        """Have a used container removed in the background."""
+        with self._lock:
+            running = self._thread is not None and self._thread.is_alive()
+            if running:
+                self._spent.append(container)
+        if running:
+            self._wakeup.set()
+        else:
+            threading.Thread(
+                target=self._remove_all, args=([container],), daemon=True
+            ).start()
+
+    def drain(self) -> None:
+        """Remove every idle and used container owned by this process."""
+        with self._lock:
+            spent, self._spent = self._spent, []
+        self._remove_all(spent)
+        super().drain()
+
+    def _refill_loop(self) -> None:
+        """Remove used containers and start replacements, then wait for more."""
+        self._prune_stale()
+        while True:
+            self._wakeup.clear()
+            with self._lock:
+                spent, self._spent = self._spent, []
+            # Free the host's room before taking it up again
+            self._remove_all(spent)
+            try:
+                while self._deficit() > 0 and self._room():
+                    self._add_container()
+                timeout = None if self._deficit() <= 0 else self.RETRY_SECONDS
+            except (DockerException, RuntimeError):
+                # Docker unavailable or image missing; retry later
+                timeout = self.RETRY_SECONDS
+            self._wakeup.wait(timeout)
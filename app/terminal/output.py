@@ -0,0 +1,70 @@
+"""Bounded, binary-safe capture of command output."""
+
+import codecs
+
+
+class OutputCapture:
+    """
+    Decodes command output as it arrives while capping what is kept.
+
+    The first `limit // 2` bytes are passed through as they arrive; after
+    that only the most recent `limit // 2` bytes are kept in a ring buffer
+    and returned by `finish()` after a truncation notice. Invalid UTF-8
+    (e.g. binary output) is replaced rather than raising, and characters
+    split across chunks are decoded correctly.
+    """
+
+    DEFAULT_LIMIT = 1024 * 1024
+
+    def __init__(self, limit: int = DEFAULT_LIMIT):
+        self.limit = limit
+        self._head_limit = limit // 2
+        self._tail_limit = limit - self._head_limit
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._tail = bytearray()
+        self.total_bytes = 0
+
+    @property
+    def truncated(self) -> bool:
+        """Whether any output was dropped."""
+        return self.total_bytes > self.limit
+
+    def feed(self, data: bytes) -> str:
+        """
+        Add a chunk of raw output.
+
+        Returns:
+            Text that can be shown right away (empty once past the head)
+        """
+        head_room = max(0, self._head_limit - self.total_bytes)
+        self.total_bytes += len(data)
+        head, rest = data[:head_room], data[head_room:]
+
+        if rest:
+            self._tail += rest
+            if len(self._tail) > self._tail_limit:
+                del self._tail[:len(self._tail) - self._tail_limit]
+
+        return self._decoder.decode(head) if head else ""
+
+    def finish(self) -> str:
+        """
+        Flush the decoder and return whatever was held back.
+
+        Returns:
+            Remaining text, including a truncation notice and the tail of
+            the output if it exceeded the limit
+        """
+        tail = bytes(self._tail)
+        if not self.truncated:
+            # Head and tail are contiguous; keep decoding across the seam
+            return self._decoder.decode(tail, final=True)
+
+        text = self._decoder.decode(b"", final=True)
+        omitted = self.total_bytes - self._head_limit - len(tail)
+        # Don't start the tail in the middle of a UTF-8 sequence
+        start = 0
+        while start < min(len(tail), 3) and tail[start] & 0xC0 == 0x80:
+            start += 1
+        text += f"\n[... output truncated: {omitted + start} bytes omitted ...]\n"
+        return text + tail[start:].decode("utf-8", errors="replace")
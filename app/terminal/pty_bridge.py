@@ -0,0 +1,135 @@
+"""Interactive pseudo-terminal sessions bridged to WebSockets."""
+
+import json
+import threading
+from typing import Callable, Optional
+
+import docker
+from docker.errors import DockerException
+
+
+class PtySession:
+    """
+    A bash process running on a real tty inside a session's container.
+
+    Unlike the persistent shell used for single commands, the tty makes
+    full-screen programs such as htop, less, nano and vim work.
+    """
+
+    SHELL_COMMAND = ["/bin/bash"]
+    READ_SIZE = 65536
+
+    def __init__(
+        self,
+        api: docker.APIClient,
+        container: str,
+        workdir: str = "/home/learner",
+        cols: int = 80,
+        rows: int = 24,
+        on_input: Optional[Callable[[], None]] = None,
+    ):
+        """
+        Start bash on a tty inside a container.
+
+        Args:
+            api: Low-level Docker API client
+            container: Container name or id to run in
+            workdir: Starting directory for the shell
+            cols: Initial terminal width
+            rows: Initial terminal height
+            on_input: Called whenever the user sends input
+        """
+        self._api = api
+        self._on_input = on_input
+        self._exec_id = api.exec_create(
+            container,
+            self.SHELL_COMMAND,
+            stdin=True,
+            tty=True,
+            workdir=workdir,
+            environment={"TERM": "xterm-256color"},
+        )["Id"]
+        self._socket = api.exec_start(self._exec_id, socket=True, tty=True)
+        # docker-py wraps the raw socket in a SocketIO object
+        self._sock = getattr(self._socket, "_sock", self._socket)
+        self.closed = False
+        self.resize(cols, rows)
+
+    def read(self) -> bytes:
+        """Read terminal output; returns b"" once the shell has exited."""
+        try:
+            return self._sock.recv(self.READ_SIZE)
+        except OSError:
+            return b""
+
+    def write(self, data: bytes) -> None:
+        """Send keystrokes to the terminal."""
+        if self._on_input is not None:
+            self._on_input()
+        self._sock.sendall(data)
+
+    def resize(self, cols: int, rows: int) -> None:
+        """Resize the terminal."""
+        try:
+            self._api.exec_resize(self._exec_id, height=rows, width=cols)
+        except DockerException:
+            # The process may not have started yet or already exited
+            pass
+
+    def close(self) -> None:
+        """Close the terminal, which hangs up the shell."""
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self._socket.close()
+        except OSError:
+            pass
+
+
+def bridge_pty(ws, pty: PtySession) -> None:
+    """
+    Pump data between a WebSocket and a terminal until either side closes.
+
+    Binary frames carry raw terminal bytes in both directions. Text frames
+    from the client are JSON control messages, currently only
+    `{"type": "resize", "cols": N, "rows": N}`. When the shell exits the
+    server sends `{"type": "exit"}` and closes the socket.
+    """
+
+    def pump_output():
+        while True:
+            data = pty.read()
+            if not data:
+                break
+            ws.send(data)
+        try:
+            ws.send(json.dumps({"type": "exit"}))
+            ws.close()
+        except Exception:
+            pass
+
+    reader = threading.Thread(target=pump_output, name="pty-output", daemon=True)
+    reader.start()
+
+    try:
+        while not pty.closed:
+            message = ws.receive()
+            if message is None:
+                break
+            if isinstance(message, bytes):
+                try:
+                    pty.write(message)
+                except OSError:
+                    break
+                continue
+
+            try:
+                control = json.loads(message)
+            except ValueError:
+                continue
+            if control.get("type") == "resize":
+                pty.resize(int(control.get("cols", 80)), int(control.get("rows", 24)))
+    finally:
+        pty.close()
+        reader.join(timeout=1)
@@ -0,0 +1,208 @@
+"""Token-bucket rate limiting shared between worker processes."""
+
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+from app.terminal.state_store import STATE_DIR
+
+
+class TokenBucketTable:
+    """
+    Fixed-size table of token buckets in a memory-mapped file.
+
+    Every worker on the host maps the same file, so a client is limited
+    the same way whichever worker serves it. Each bucket is one slot of
+    (key hash, tokens, last update); a key may use any of a few slots
+    after its hash position, and when they are all taken the stalest one
+    is reused. Updates hold an exclusive lock on the file, which only
+    covers a few arithmetic operations.
+
+    Without fcntl (e.g. on Windows) buckets are only shared between the
+    threads of one process.
+    """
+
+    SLOT = struct.Struct("<Qdd")
+    PROBES = 4
+
+    def __init__(self, filename: str, rate: float, burst: float, slots: int = 4096):
+        self.filename = filename
+        self.rate = rate
+        self.burst = burst
+        self.slots = slots
+        self.path = os.path.join(STATE_DIR, filename)
+        self._lock = threading.Lock()
+        self._file = None
+        self._map: Optional[mmap.mmap] = None
+        self._pid: Optional[int] = None
+
+    def configure(
+        self, rate: float = None, burst: float = None, state_dir: str = None
+    ) -> None:
+        """Update the refill rate, burst size or file location."""
+        with self._lock:
+            if rate is not None:
+                self.rate = rate
+            if burst is not None:
+                self.burst = burst
+            if state_dir:
+                self.path = os.path.join(state_dir, self.filename)
+                self._close()
+
+    def take(self, key: str, cost: float = 1.0) -> float:
+        """
+        Take tokens from a key's bucket.
+
+        Args:
+            key: Client identifier
+            cost: Tokens the request costs
+
+        Returns:
+            0 if the request is allowed, else seconds until it would be
+        """
+        return self._update(key, cost)
+
+    def refund(self, key: str, cost: float = 1.0) -> None:
+        """Give back tokens taken for a request that didn't go ahead."""
+        self._update(key, -min(cost, self.burst))
+
+    def _update(self, key: str, cost: float) -> float:
+        if self.rate <= 0:
+            return 0
+        # A request costing more than a full bucket waits for a full bucket
+        cost = min(cost, self.burst)
+        key_hash = _hash_key(key)
+        now = time.time()
+        with self._lock:
+            table = self._open()
+            if table is None:
+                # Limiting is best effort; never block requests on it
+                return 0
+            if fcntl is not None:
+                fcntl.flock(self._file, fcntl.LOCK_EX)
+            try:
+                offset = self._find_slot(table, key_hash)
+                stored_hash, tokens, updated = self.SLOT.unpack_from(table, offset)
+                if stored_hash != key_hash:
+                    tokens, updated = self.burst, now
+                tokens = min(self.burst, tokens + max(0.0, now - updated) * self.rate)
+                if tokens >= cost:
+                    tokens = min(self.burst, tokens - cost)
+                    wait = 0.0
+                else:
+                    wait = (cost - tokens) / self.rate
+                self.SLOT.pack_into(table, offset, key_hash, tokens, now)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._file, fcntl.LOCK_UN)
+        return wait
+
+    def _find_slot(self, table: mmap.mmap, key_hash: int) -> int:
+        """Offset of the key's slot, or of the slot it should replace."""
+        start = key_hash % self.slots
+        stalest, stalest_time = None, None
+        for probe in range(self.PROBES):
+            offset = ((start + probe) % self.slots) * self.SLOT.size
+            stored_hash, _, updated = self.SLOT.unpack_from(table, offset)
+            if stored_hash in (key_hash, 0):
+                return offset
+            if stalest_time is None or updated < stalest_time:
+                stalest, stalest_time = offset, updated
+        return stalest
+
+    def _open(self) -> Optional[mmap.mmap]:
+        if self._map is not None and self._pid == os.getpid():
+            return self._map
+        # A forked worker shares the parent's open file, and so its lock;
+        # open the file again to get a lock of its own
+        self._close()
+        self._pid = os.getpid()
+        size = self.slots * self.SLOT.size
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(self.path, "a+b")
+            if os.fstat(self._file.fileno()).st_size < size:
+                self._file.truncate(size)
+            self._map = mmap.mmap(self._file.fileno(), size)
+        except (OSError, ValueError):
+            self._close()
+            return None
+        return self._map
+
+    def _close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class RateLimiter:
+    """
+    Limits how often sessions and client IPs may run sandbox commands.
+
+    Each session has its own bucket, and so does each client IP address.
+    The IP bucket is larger because a classroom often shares one address.
+    """
+
+    def __init__(self):
+        self.sessions = TokenBucketTable("ratelimit-sessions.bin", rate=2, burst=10)
+        self.addresses = TokenBucketTable("ratelimit-addresses.bin", rate=20, burst=100)
+
+    def init_app(self, app) -> None:
+        """Apply rate limits from the Flask app config."""
+        state_dir = app.config.get("SANDBOX_STATE_DIR")
+        self.sessions.configure(
+            rate=app.config.get("SANDBOX_RATE"),
+            burst=app.config.get("SANDBOX_BURST"),
+            state_dir=state_dir,
+        )
+        self.addresses.configure(
+            rate=app.config.get("SANDBOX_IP_RATE"),
+            burst=app.config.get("SANDBOX_IP_BURST"),
+            state_dir=state_dir,
+        )
+
+    def check(self, session_id: str, address: Optional[str], cost: float = 1) -> int:
+        """
+        Count a request against the session's and the address's buckets.
+
+        Args:
+            session_id: Session making the request
+            address: Client IP address, if known
+            cost: Number of commands the request runs
+
+        Returns:
+            0 if the request may go ahead, else whole seconds to wait
+        """
+        session_key = f"session:{session_id}"
+        wait = self.sessions.take(session_key, cost)
+        if not wait and address:
+            wait = self.addresses.take(f"ip:{address}", cost)
+            if wait:
+                # Refused for its address, so the request doesn't cost the session
+                self.sessions.refund(session_key, cost)
+        return math.ceil(wait)
+
+
+def _hash_key(key: str) -> int:
+    """Stable, non-zero 64-bit hash of a key (the same in every process)."""
+    digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little") or 1
+
+
+# Singleton instance for the application
+rate_limiter = RateLimiter()
@@ -0,0 +1,123 @@
+"""Scheduled expiry of idle sandbox sessions."""
+
+import heapq
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Callable, Hashable, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+
+class ExpiryHeap:
+    """
+    Min-heap of deadlines holding at most one entry per key.
+
+    Activity does not touch the heap: a key keeps its original entry, and
+    when that entry comes due the caller checks the real deadline and
+    reschedules it if the key was active since. Each pop is therefore
+    O(log n) and a tick only looks at entries that are actually due.
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[float, Hashable]] = []
+        self._scheduled = set()
+        self._lock = threading.Lock()
+
+    def schedule(self, key: Hashable, deadline: float) -> None:
+        """Add a deadline for a key unless it already has one."""
+        with self._lock:
+            if key in self._scheduled:
+                return
+            self._scheduled.add(key)
+            heapq.heappush(self._heap, (deadline, key))
+
+    def pop_due(self, now: float) -> List[Hashable]:
+        """Remove and return every key whose deadline is at or before now."""
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                _, key = heapq.heappop(self._heap)
+                self._scheduled.discard(key)
+                due.append(key)
+        return due
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._heap)
+
+
+class Reaper:
+    """
+    Runs a cleanup task on a fixed interval in a daemon thread.
+
+    Every gunicorn worker runs its own reaper. When fcntl is available,
+    ticks take an exclusive lock on a shared lock file so workers reap one
+    at a time instead of racing each other for the same containers.
+    """
+
+    DEFAULT_LOCK_PATH = os.path.join(tempfile.gettempdir(), "learn-sandbox-reaper.lock")
+
+    def __init__(
+        self,
+        task: Callable[[], object],
+        interval: float = 30,
+        lock_path: Optional[str] = DEFAULT_LOCK_PATH,
+    ):
+        self._task = task
+        self.interval = interval
+        self.lock_path = lock_path
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    def configure(self, state_dir: str) -> None:
+        """Move the lock file into a different directory, shared by the workers."""
+        if self.lock_path:
+            self.lock_path = os.path.join(state_dir, os.path.basename(self.lock_path))
+
+    def start(self) -> None:
+        """Start the reaper thread (idempotent)."""
+        if self.interval <= 0:
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="sandbox-reaper", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Ask the reaper thread to exit after its current tick."""
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                with self._exclusive():
+                    self._task()
+            except Exception:
+                # A failed tick must not kill the thread; try again next time
+                pass
+
+    @contextmanager
+    def _exclusive(self):
+        """Hold the cross-process reaper lock for the duration of a tick."""
+        if fcntl is None or not self.lock_path:
+            yield
+            return
+        directory = os.path.dirname(self.lock_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
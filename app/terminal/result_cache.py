@@ -0,0 +1,83 @@
+"""Remembering the output of pure commands."""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from app.terminal.classify import is_pure
+
+
+class ResultCache:
+    """
+    LRU cache of pure commands' results, keyed by image id and command.
+
+    Many Try-It examples only print fixed text or read root-owned files
+    baked into the image (see `classify.is_pure`), so their output is the
+    same every time. Remembering it lets repeat clicks skip the container
+    entirely. Keying on the image id rather than its tag means rebuilding
+    the image never serves stale output.
+
+    Only clean runs are kept: exit code 0, no error or timeout, and
+    output under `max_output` bytes. A session's shell can shadow
+    `echo` with a function, so the sandbox only reads and fills the
+    cache for sessions with nothing of their own yet.
+    """
+
+    DEFAULT_SIZE = 256
+    DEFAULT_MAX_OUTPUT = 64 * 1024
+
+    def __init__(self, size: int = DEFAULT_SIZE, max_output: int = DEFAULT_MAX_OUTPUT):
+        self.size = size
+        self.max_output = max_output
+        self._entries: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def init_app(self, app) -> None:
+        """Apply the cache size from the Flask app config."""
+        self.size = app.config.get("SANDBOX_RESULT_CACHE", self.size)
+        with self._lock:
+            self._trim_locked()
+
+    def cacheable(self, command: str) -> bool:
+        """Whether a command's result may be cached."""
+        return self.size > 0 and is_pure(command)
+
+    def get(self, image_id: str, command: str) -> Optional[Dict[str, Any]]:
+        """
+        Get a cached result.
+
+        Returns:
+            Dictionary with output and exit_code, or None on a miss
+        """
+        key = (image_id, command)
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+            return result
+
+    def put(self, image_id: str, command: str, result: Dict[str, Any]) -> None:
+        """Remember a command's result if it was a clean run."""
+        if (
+            result.get("exit_code") != 0
+            or result.get("error")
+            or result.get("timed_out")
+            or result.get("truncated")
+            or len(result.get("output", "").encode()) > self.max_output
+        ):
+            return
+        with self._lock:
+            self._entries[(image_id, command)] = {
+                "output": result["output"],
+                "exit_code": 0,
+            }
+            self._entries.move_to_end((image_id, command))
+            self._trim_locked()
+
+    def _trim_locked(self) -> None:
+        while len(self._entries) > max(self.size, 0):
+            self._entries.popitem(last=False)
+
+
+# Singleton instance for the application
+result_cache = ResultCache()
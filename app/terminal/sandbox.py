@@ -1,9 +1,12 @@
 """Sandbox container management."""
 
+import time
 import docker
-from docker.errors import DockerException, NotFound
+from docker.errors import APIError, DockerException, NotFound
 from typing import Dict, Any, Optional
 
+from app.terminal.output import OutputCapture
+
 
 class SandboxManager:
     """Manages the sandbox container lifecycle."""
@@ -105,30 +108,54 @@ class SandboxManager:
         self.stop()
         return self.start()
 
-    def exec_command(self, command: str, workdir: str = "/home/learner") -> Dict[str, Any]:
-        """Execute a command in the running sandbox."""
-        status = self.get_status()
-        if not status.get("running"):
-            # Start if not running
-            start_result = self.start()
-            if not start_result.get("success"):
-                return {"output": "", "exit_code": -1, "error": start_result.get("error")}
+    def exec_command(
+        self,
+        command: str,
+        workdir: str = "/home/learner",
+        timeout: int = 30,
+        output_limit: int = OutputCapture.DEFAULT_LIMIT,
+    ) -> Dict[str, Any]:
+        """
+        Execute a command in the running sandbox.
 
+        The command runs under coreutils `timeout`, which kills its whole
+        process group inside the container once the deadline passes; any
+        output produced until then is still returned. Output is streamed
+        into a bounded capture rather than buffered whole.
+        """
         try:
-            container = self.client.containers.get(self.CONTAINER_NAME)
-            exit_code, output = container.exec_run(
-                f"/bin/bash -c {repr(command)}",
-                workdir=workdir,
-                demux=False,
-            )
+            api = self.client.api
+            started = time.monotonic()
+            argv = ["timeout", "--kill-after=2", str(timeout), "/bin/bash", "-c", command]
+            try:
+                exec_id = api.exec_create(self.CONTAINER_NAME, argv, workdir=workdir)["Id"]
+            except APIError as e:
+                # Missing (404) or not running (409): start it and try once more,
+                # rather than inspecting the container before every command
+                if e.status_code not in (404, 409):
+                    raise
+                start_result = self.start()
+                if not start_result.get("success"):
+                    return {"output": "", "exit_code": -1, "error": start_result.get("error")}
+                exec_id = api.exec_create(self.CONTAINER_NAME, argv, workdir=workdir)["Id"]
+            capture = OutputCapture(output_limit)
+            output = [capture.feed(chunk) for chunk in api.exec_start(exec_id, stream=True)]
+            output.append(capture.finish())
+            exit_code = api.exec_inspect(exec_id).get("ExitCode")
+            # 124: stopped by SIGTERM, 137: needed the SIGKILL follow-up
+            timed_out = exit_code in (124, 137) and time.monotonic() - started >= timeout
             return {
-                "output": output.decode("utf-8") if output else "",
+                "output": "".join(output),
                 "exit_code": exit_code,
+                "timed_out": timed_out,
+                "truncated": capture.truncated,
                 "error": None,
             }
         except Exception as e:
             return {
                 "output": "",
                 "exit_code": -1,
+                "timed_out": False,
+                "truncated": False,
                 "error": str(e),
             }
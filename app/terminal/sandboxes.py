@@ -0,0 +1,11 @@
+"""The sandbox backend the playground runs sessions in."""
+
+from app.terminal.backend import BackendSwitch
+from app.terminal.namespace_sandbox import namespace_sandbox
+from app.terminal.sharding import session_sandbox
+
+# Singleton instance for the application
+sandbox_backend = BackendSwitch(
+    {"docker": session_sandbox, "namespace": namespace_sandbox},
+    default="docker",
+)
@@ -1,49 +1,562 @@
 """Session-based sandbox container management for multi-user support."""
 
 import docker
+import os
+import tempfile
 import threading
 import time
-from docker.errors import DockerException, NotFound, ImageNotFound
-from typing import Dict, Any, Optional
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from docker.errors import APIError, DockerException, NotFound, ImageNotFound
+from typing import Callable, Dict, Any, Iterator, List, Optional, Tuple
 from datetime import datetime, timedelta
 
+from app.terminal.state_store import ActivityStore
+from app.terminal.backend import BACKPRESSURE_KEYS, SandboxBackend
+from app.terminal.capacity import CapacityManager
+from app.terminal.classify import is_read_only
+from app.terminal.container_pool import ContainerPool
+from app.terminal.container_state import ContainerStateCache
+from app.terminal.engine_client import EngineClient
+from app.terminal.hibernate import HibernationFailed, HibernationStore
+from app.terminal.output import OutputCapture
+from app.terminal.pty_bridge import PtySession
+from app.terminal.reaper import ExpiryHeap, Reaper
+from app.terminal.result_cache import result_cache
+from app.terminal.shared_lane import SharedLane
+from app.terminal.shell_session import PersistentShell, ShellClosed
 
-class SessionSandbox:
+
+class SessionSandbox(SandboxBackend):
     """
     Manages per-session sandbox containers.
 
     Each user session gets their own persistent Docker container,
     allowing state to persist across command executions.
-    Containers are automatically cleaned up after 30 minutes of inactivity.
+    Containers are paused after a few idle minutes (and unpaused on the
+    next command), and removed after 30 minutes of inactivity; the
+    learner's home directory is saved first and restored on their return.
     """
 
     CONTAINER_PREFIX = "learn-"
+    # Replaced containers are renamed to this prefix while being removed
+    TRASH_PREFIX = "sandbox-trash-"
     DEFAULT_IMAGE = "linux-sandbox:latest"
     IDLE_TIMEOUT_MINUTES = 30
+    # Idle seconds before a container is paused (0 disables pausing)
+    PAUSE_AFTER_SECONDS = 300
+    LOCK_STRIPES = 64
+    # Containers removed concurrently per reaper tick
+    REAP_WORKERS = 8
+    # Minimum seconds between persisted activity updates for one session
+    ACTIVITY_WRITE_INTERVAL = 15
+    # How long a successful image lookup is trusted
+    IMAGE_CACHE_SECONDS = 300
+    # Resource limits shared by session and pooled containers
+    CONTAINER_OPTIONS = {
+        "detach": True,
+        "tty": True,
+        "stdin_open": True,
+        "mem_limit": "256m",
+        "cpu_period": 100000,
+        "cpu_quota": 50000,  # 50% CPU
+        "command": "/bin/bash",
+    }
 
-    def __init__(self):
+    def __init__(
+        self,
+        name: Optional[str] = None,
+        client_factory: Optional[Callable[[], docker.DockerClient]] = None,
+        base_url: Optional[str] = None,
+    ):
+        """
+        Args:
+            name: Distinguishes this Docker host's state files when several
+                hosts are used; None for a single host
+            client_factory: Creates the Docker client (defaults to the
+                environment's daemon)
+            base_url: URL of the Docker host the factory connects to
+        """
+        self.name = name
+        self._client_factory = client_factory or docker.from_env
         self._client: Optional[docker.DockerClient] = None
+        # Host URL for the lean exec clients; None if only the factory knows it
+        self.base_url = (
+            base_url if client_factory else base_url or os.environ.get("DOCKER_HOST", "")
+        )
+        self._api: Any = None
+        suffix = f"-{name}" if name else ""
+        # Container states mirrored from the Docker event stream
+        self.state = ContainerStateCache(lambda: self.client)
+        # Host budgets for containers and in-flight commands
+        self.capacity = CapacityManager(
+            lambda: self.client,
+            self._container_usage,
+            container_memory=self.CONTAINER_OPTIONS["mem_limit"],
+            container_cpus=(
+                self.CONTAINER_OPTIONS["cpu_quota"] / self.CONTAINER_OPTIONS["cpu_period"]
+            ),
+            tickets_filename=f"capacity{suffix}.db",
+        )
+        # Pre-started containers handed out on a session's first command
+        self.pool = ContainerPool(
+            lambda: self.client,
+            self.CONTAINER_OPTIONS,
+            image=self.DEFAULT_IMAGE,
+            has_room=self.capacity.has_room,
+        )
+        # Read-only containers for sessions that haven't changed anything yet
+        self.lane = SharedLane(
+            lambda: self.client,
+            self.CONTAINER_OPTIONS,
+            image=self.DEFAULT_IMAGE,
+            api_getter=lambda: self.api,
+        )
+        # Guards the shared registries below; never held across Docker calls
         self._lock = threading.RLock()
+        # Striped locks serializing work on a single session's container,
+        # so independent sessions can run commands concurrently
+        self._session_locks = [threading.RLock() for _ in range(self.LOCK_STRIPES)]
         # Track last activity time for each session
         self._last_activity: Dict[str, datetime] = {}
+        # Activity shared with other workers and kept across restarts
+        self.activity = ActivityStore(filename=f"activity{suffix}.db")
+        self._persisted: Dict[str, datetime] = {}
+        self._activity_loaded = False
+        # Idle deadlines, checked by the background reaper
+        self.pause_after = self.PAUSE_AFTER_SECONDS
+        self._pause_expiry = ExpiryHeap()
+        self._expiry = ExpiryHeap()
+        self.reaper = Reaper(
+            self.reap_expired,
+            lock_path=os.path.join(
+                tempfile.gettempdir(), f"learn-sandbox-reaper{suffix}.lock"
+            ),
+        )
+        # Attached bash process for each session, used under its session lock
+        self._shells: Dict[str, PersistentShell] = {}
+        # Container handle for each session, dropped when Docker disagrees
+        self._handles: Dict[str, Any] = {}
+        # Image name -> (monotonic time until which it is known to exist, id)
+        self._images: Dict[str, Tuple[float, str]] = {}
+        # Home directories of sessions removed for inactivity
+        self.hibernation = HibernationStore()
 
     @property
     def client(self) -> docker.DockerClient:
         """Lazy initialization of Docker client."""
         if self._client is None:
             try:
-                self._client = docker.from_env()
+                self._client = self._client_factory()
             except DockerException as e:
                 raise RuntimeError(f"Docker is not available: {e}")
         return self._client
 
+    @property
+    def api(self) -> Any:
+        """
+        Low-level client for the exec and container calls made per command.
+
+        For a daemon on a local unix socket this is the lean EngineClient,
+        with a connection pool as large as the worker's execution slots;
+        otherwise it is docker-py's APIClient.
+        """
+        if self._api is None:
+            engine = None
+            if self.base_url is not None:
+                engine = EngineClient.for_url(self.base_url, pool_size=self.capacity.max_execs)
+            self._api = engine or self.client.api
+        return self._api
+
+    def init_app(self, app) -> None:
+        """Apply sandbox settings from the Flask app config."""
+        self.pool.configure(
+            image=app.config.get("DOCKER_IMAGE", self.DEFAULT_IMAGE),
+            size=app.config.get("SANDBOX_POOL_SIZE", 0),
+        )
+        self.lane.configure(
+            image=app.config.get("DOCKER_IMAGE", self.DEFAULT_IMAGE),
+            size=app.config.get("SANDBOX_LANE_SIZE", 0),
+        )
+        self.reaper.interval = app.config.get("SANDBOX_REAP_INTERVAL", 30)
+        self.pause_after = app.config.get("SANDBOX_PAUSE_AFTER", self.PAUSE_AFTER_SECONDS)
+        state_dir = app.config.get("SANDBOX_STATE_DIR")
+        self.hibernation.configure(
+            directory=app.config.get("SANDBOX_HIBERNATE_DIR")
+            or (os.path.join(state_dir, "hibernate") if state_dir else None),
+            limit=app.config.get("SANDBOX_HIBERNATE_LIMIT"),
+        )
+        if state_dir:
+            self.activity.configure(state_dir)
+            self.reaper.configure(state_dir)
+        self.capacity.configure(
+            max_containers=app.config.get("SANDBOX_MAX_CONTAINERS"),
+            memory_budget=app.config.get("SANDBOX_MEMORY_BUDGET"),
+            cpu_budget=app.config.get("SANDBOX_CPU_BUDGET"),
+            max_execs=app.config.get("SANDBOX_MAX_EXECS"),
+            state_dir=state_dir,
+        )
+
+    def start(self) -> None:
+        """Start background workers: warm pool, shared lane, event subscriber and reaper."""
+        self._load_activity()
+        self.state.start()
+        self.pool.start()
+        self.lane.start()
+        self.reaper.start()
+
+    def has_container(self, session_id: str) -> Optional[bool]:
+        """Whether the session has a container here; None if unknown."""
+        if not self.state.ready:
+            return None
+        return self.state.get(self._container_name(session_id)) is not None
+
+    def free_capacity(self) -> int:
+        """Number of containers that could still be started on this host."""
+        return self.capacity.free_slots()
+
     def _container_name(self, session_id: str) -> str:
         """Get container name for a session."""
         return f"{self.CONTAINER_PREFIX}{session_id}"
 
+    def _session_lock(self, session_id: str) -> threading.RLock:
+        """Get the lock stripe guarding a session's container."""
+        return self._session_locks[hash(session_id) % self.LOCK_STRIPES]
+
+    def _load_activity(self) -> None:
+        """Pick up activity persisted by earlier or sibling processes (once)."""
+        with self._lock:
+            if self._activity_loaded:
+                return
+            self._activity_loaded = True
+
+        for session_id, timestamp in self.activity.load().items():
+            last_active = datetime.fromtimestamp(timestamp)
+            with self._lock:
+                current = self._last_activity.get(session_id)
+                if current is None or current < last_active:
+                    self._last_activity[session_id] = last_active
+                    self._persisted[session_id] = last_active
+            self._schedule_idle(session_id, last_active)
+
+    def _schedule_idle(self, session_id: str, last_active: datetime) -> None:
+        """Schedule the pause and removal checks for a session's idle time."""
+        if self.pause_after > 0:
+            pause_at = last_active + timedelta(seconds=self.pause_after)
+            self._pause_expiry.schedule(session_id, pause_at.timestamp())
+        remove_at = last_active + timedelta(minutes=self.IDLE_TIMEOUT_MINUTES)
+        self._expiry.schedule(session_id, remove_at.timestamp())
+
     def _update_activity(self, session_id: str) -> None:
         """Update last activity timestamp for a session."""
-        self._last_activity[session_id] = datetime.now()
+        timestamp = self.touch(session_id)
+        if timestamp is not None:
+            self.activity.touch(session_id, timestamp)
+
+    def touch(self, session_id: str) -> Optional[float]:
+        """
+        Record activity for a session in this worker only.
+
+        Makes no Docker calls and writes no files, so an event loop can
+        call it directly.
+
+        Returns:
+            Timestamp to write to the shared store with `activity.touch`,
+            or None if a recent write still covers it
+        """
+        now = datetime.now()
+        with self._lock:
+            self._last_activity[session_id] = now
+            persisted = self._persisted.get(session_id)
+            persist = persisted is None or (
+                now - persisted >= timedelta(seconds=self.ACTIVITY_WRITE_INTERVAL)
+            )
+            if persist:
+                self._persisted[session_id] = now
+        self._schedule_idle(session_id, now)
+        return now.timestamp() if persist else None
+
+    def may_be_paused(self, session_id: str) -> bool:
+        """Whether the session's container may be paused, so input needs `resume`."""
+        if not self.state.ready:
+            return self.pause_after > 0
+        cached = self.state.get(self._container_name(session_id))
+        return cached is not None and cached["status"] == "paused"
+
+    def resume(self, session_id: str) -> None:
+        """Record terminal input, unpausing the container if it was paused."""
+        container_name = self._container_name(session_id)
+        if not self.state.ready and self.pause_after > 0:
+            # The state is unknown; the container may have been paused
+            with self._lock:
+                handle = self._handles.get(session_id)
+            with self._session_lock(session_id):
+                if handle is not None:
+                    self._refresh_handle(container_name, handle)
+                else:
+                    self._ensure_running(container_name)
+        else:
+            cached = self.state.get(container_name)
+            if cached is not None and cached["status"] == "paused":
+                with self._session_lock(session_id):
+                    self._unpause(container_name, cached["id"])
+        self._update_activity(session_id)
+
+    def _forget_activity(self, session_id: str) -> None:
+        """Stop tracking activity for a session."""
+        with self._lock:
+            self._last_activity.pop(session_id, None)
+            self._persisted.pop(session_id, None)
+        self.activity.forget(session_id)
+
+    def _latest_activity(self, session_id: str) -> Optional[datetime]:
+        """Get a session's last activity as seen by any worker."""
+        with self._lock:
+            last_active = self._last_activity.get(session_id)
+        stored = self.activity.get(session_id)
+        if stored is not None:
+            stored_at = datetime.fromtimestamp(stored)
+            if last_active is None or stored_at > last_active:
+                last_active = stored_at
+        return last_active
+
+    def _get_shell(
+        self, session_id: str, container_id: str, workdir: str
+    ) -> PersistentShell:
+        """Get the session's shell, starting one if it is missing or stale."""
+        shell = self._shells.get(session_id)
+        if shell is not None and (shell.closed or shell.container != container_id):
+            # The container was replaced since the shell was attached
+            shell.close()
+            shell = None
+        if shell is None:
+            shell = PersistentShell(self.api, container_id, workdir)
+            with self._lock:
+                self._shells[session_id] = shell
+        return shell
+
+    def _close_shell(self, session_id: str) -> None:
+        """Close and forget the session's shell, if any."""
+        with self._lock:
+            shell = self._shells.pop(session_id, None)
+        if shell is not None:
+            shell.close()
+
+    def _list_containers(self) -> List[Dict[str, Any]]:
+        """List session containers, from the state cache when it is synced."""
+        if self.state.ready:
+            return self.state.list(self.CONTAINER_PREFIX)
+        containers = self.client.containers.list(
+            all=True,
+            filters={"name": self.CONTAINER_PREFIX},
+        )
+        return [
+            {"id": container.id, "name": container.name, "status": container.status}
+            for container in containers
+            if container.name.startswith(self.CONTAINER_PREFIX)
+        ]
+
+    def _container_usage(self) -> Dict[str, int]:
+        """
+        Count sandbox containers (sessions and pool) using host resources.
+
+        Returns:
+            Dictionary with "containers" (holding memory, including paused
+            ones) and "running" (also using CPU)
+        """
+        if self.state.ready:
+            statuses = [entry["status"] for entry in self.state.list()]
+        else:
+            statuses = [
+                container.status
+                for container in self.client.containers.list(
+                    filters={"label": "learn-session"}
+                )
+            ]
+        return {
+            "containers": sum(1 for status in statuses if status != "exited"),
+            "running": sum(1 for status in statuses if status == "running"),
+        }
+
+    def _unpause(self, container_name: str, container_id: str) -> None:
+        """Unpause a container and record it as running."""
+        try:
+            self.api.unpause(container_name)
+        except APIError as e:
+            # 409: not paused after all (e.g. another worker unpaused it)
+            if e.status_code != 409:
+                raise
+        self.state.record(container_name, container_id, "running")
+
+    def _ensure_running(self, container_name: str) -> Optional[Any]:
+        """
+        Make sure an existing container is running.
+
+        Returns:
+            The container, or None if it does not exist
+        """
+        try:
+            container = self.client.containers.get(container_name)
+        except NotFound:
+            self.state.discard(container_name)
+            return None
+
+        # If it exists but isn't running, unpause or start it
+        if container.status == "paused":
+            container.unpause()
+        elif container.status != "running":
+            container.start()
+        self.state.record(container_name, container.id, "running")
+        return container
+
+    def _refresh_handle(self, container_name: str, container) -> Optional[Any]:
+        """
+        Reload a cached container handle and make sure it is running.
+
+        Returns:
+            The container, or None if it no longer exists
+        """
+        try:
+            container.reload()
+        except NotFound:
+            self.state.discard(container_name)
+            return None
+        if container.status == "paused":
+            self._unpause(container_name, container.id)
+        elif container.status != "running":
+            container.start()
+        self.state.record(container_name, container.id, "running")
+        return container
+
+    def _remember_container(self, session_id: str, container) -> None:
+        """Cache a session's container handle."""
+        with self._lock:
+            self._handles[session_id] = container
+
+    def _forget_container(self, session_id: str) -> None:
+        """Drop a session's cached container handle and shell."""
+        with self._lock:
+            self._handles.pop(session_id, None)
+        self._close_shell(session_id)
+
+    def container_lost(self, session_id: str) -> None:
+        """Forget a session's container after Docker said it is gone."""
+        self._forget_container(session_id)
+        self.state.discard(self._container_name(session_id))
+
+    def _remove_container(self, session_id: str, hibernate: bool = False) -> bool:
+        """
+        Force-remove a session's container.
+
+        Args:
+            session_id: Session whose container to remove
+            hibernate: Save the home directory first so it can be restored
+
+        Returns:
+            True if it was removed, False if it did not exist
+
+        Raises:
+            HibernationFailed: If the home directory couldn't be saved; the
+                container, its handle and its shell are left in place
+        """
+        container_name = self._container_name(session_id)
+        with self._lock:
+            container = self._handles.get(session_id)
+        try:
+            if container is None:
+                container = self.client.containers.get(container_name)
+            if hibernate:
+                self.hibernation.save(session_id, container)
+        except NotFound:
+            self._forget_container(session_id)
+            self.state.discard(container_name)
+            return False
+        self._forget_container(session_id)
+        try:
+            container.remove(force=True)
+        except NotFound:
+            return False
+        finally:
+            self.state.discard(container_name)
+        self.capacity.released()
+        return True
+
+    def _retire_container(self, session_id: str) -> bool:
+        """
+        Free a session's container name now and remove the container later.
+
+        The container is renamed out of the way (a quick metadata change)
+        and force-removed on a background thread, so a replacement can
+        take the name immediately.
+
+        Returns:
+            True if a container was retired, False if there was none
+        """
+        container_name = self._container_name(session_id)
+        trash_name = f"{self.TRASH_PREFIX}{uuid.uuid4().hex[:12]}"
+        self._forget_container(session_id)
+        try:
+            self.api.rename(container_name, trash_name)
+        except NotFound:
+            return False
+        finally:
+            self.state.discard(container_name)
+
+        threading.Thread(
+            target=self._remove_trash,
+            args=(trash_name,),
+            name="sandbox-trash",
+            daemon=True,
+        ).start()
+        return True
+
+    def _remove_trash(self, trash_name: str) -> None:
+        """Remove a retired container."""
+        try:
+            self.api.remove_container(trash_name, force=True)
+        except (DockerException, RuntimeError):
+            # Left for the reaper's trash sweep
+            return
+        self.capacity.released()
+
+    def _sweep_trash(self) -> None:
+        """Remove retired containers whose background removal failed."""
+        if self.state.ready:
+            names = [entry["name"] for entry in self.state.list(self.TRASH_PREFIX)]
+        else:
+            try:
+                containers = self.client.containers.list(
+                    all=True,
+                    filters={"name": self.TRASH_PREFIX},
+                )
+            except (DockerException, RuntimeError):
+                # Docker unavailable; try again on the next sweep
+                return
+            names = [
+                container.name
+                for container in containers
+                if container.name.startswith(self.TRASH_PREFIX)
+            ]
+        for name in names:
+            self._remove_trash(name)
+
+    def _image_available(self, image: str) -> bool:
+        """Check whether an image exists, trusting a recent answer."""
+        return self._image_id(image) is not None
+
+    def _image_id(self, image: str) -> Optional[str]:
+        """Get an image's id (None if it doesn't exist), trusting a recent answer."""
+        with self._lock:
+            known_until, image_id = self._images.get(image, (0, None))
+        if known_until > time.monotonic():
+            return image_id
+        try:
+            image_id = self.client.images.get(image).id
+        except ImageNotFound:
+            return None
+        with self._lock:
+            self._images[image] = (time.monotonic() + self.IMAGE_CACHE_SECONDS, image_id)
+        return image_id
 
     def get_or_create_container(
         self, session_id: str, image: str = None
@@ -61,55 +574,115 @@ class SessionSandbox:
         image = image or self.DEFAULT_IMAGE
         container_name = self._container_name(session_id)
 
-        with self._lock:
-            try:
-                # Check if container already exists
-                container = self.client.containers.get(container_name)
+        with self._session_lock(session_id):
+            # Check if container already exists; a synced state cache or
+            # the handle from an earlier call answers without asking the daemon
+            with self._lock:
+                handle = self._handles.get(session_id)
+            synced = self.state.ready
+            cached = self.state.get(container_name) if synced else None
+            if cached is not None and cached["status"] == "running":
+                container_id = cached["id"][:12]
+            elif cached is not None and cached["status"] == "paused":
+                # Paused while idle; thaw it for this command
+                self._unpause(container_name, cached["id"])
+                container_id = cached["id"][:12]
+            elif cached is None and synced:
+                container_id = None
+            elif handle is not None and not synced and self.pause_after <= 0:
+                container_id = handle.short_id
+            elif handle is not None and not synced:
+                # Without the event stream we can't tell whether the reaper
+                # paused it since; ask Docker about the handle
+                container = self._refresh_handle(container_name, handle)
+                container_id = container.short_id if container else None
+            else:
+                container = self._ensure_running(container_name)
+                container_id = container.short_id if container else None
+                if container is not None:
+                    self._remember_container(session_id, container)
 
-                # If it exists but isn't running, start it
-                if container.status != "running":
-                    container.start()
+            if container_id is None and handle is not None:
+                # The container went away since we last used it
+                self._forget_container(session_id)
 
+            if container_id is not None:
                 self._update_activity(session_id)
                 return {
                     "success": True,
-                    "container_id": container.short_id,
+                    "container_id": container_id,
                     "status": "running",
                     "created": False,
                 }
 
-            except NotFound:
-                # Container doesn't exist, create it
-                pass
-
-            # Check if image exists
-            try:
-                self.client.images.get(image)
-            except ImageNotFound:
+            # Claim a pre-started container if one is idle
+            container = self.pool.claim(container_name, image)
+            if container is not None:
+                self.state.record(container_name, container.id, "running")
+                self._remember_container(session_id, container)
+                self._update_activity(session_id)
                 return {
-                    "success": False,
-                    "error": f"Docker image '{image}' not found. Run 'docker build -t {image} docker/' to build it.",
+                    "success": True,
+                    "container_id": container.short_id,
+                    "status": "running",
+                    "created": True,
+                    "restored": self.hibernation.restore(session_id, container),
                 }
 
+            image_missing = {
+                "success": False,
+                "error": f"Docker image '{image}' not found. Run 'docker build -t {image} docker/' to build it.",
+            }
+
             try:
+                # Check if image exists
+                if not self._image_available(image):
+                    return image_missing
+
+                # Wait our turn if the host is at capacity
+                admission = self.capacity.admit(session_id)
+                if not admission.get("success"):
+                    return admission
+
                 container = self.client.containers.run(
                     image,
                     name=container_name,
-                    detach=True,
-                    tty=True,
-                    stdin_open=True,
-                    mem_limit="256m",
-                    cpu_period=100000,
-                    cpu_quota=50000,  # 50% CPU
-                    command="/bin/bash",
                     labels={"learn-session": session_id},
+                    **self.CONTAINER_OPTIONS,
                 )
+                self.state.record(container_name, container.id, "running")
+                self._remember_container(session_id, container)
                 self._update_activity(session_id)
                 return {
                     "success": True,
                     "container_id": container.short_id,
                     "status": "running",
                     "created": True,
+                    "restored": self.hibernation.restore(session_id, container),
+                }
+
+            except ImageNotFound:
+                # Removed since we last checked
+                with self._lock:
+                    self._images.pop(image, None)
+                return image_missing
+
+            except APIError as e:
+                # Another worker created it since our cache last heard
+                if e.status_code == 409:
+                    container = self._ensure_running(container_name)
+                    if container is not None:
+                        self._remember_container(session_id, container)
+                        self._update_activity(session_id)
+                        return {
+                            "success": True,
+                            "container_id": container.short_id,
+                            "status": "running",
+                            "created": False,
+                        }
+                return {
+                    "success": False,
+                    "error": str(e),
                 }
 
             except Exception as e:
@@ -118,68 +691,420 @@ class SessionSandbox:
                     "error": str(e),
                 }
 
-    def execute_command(
+    def stream_command(
         self,
         session_id: str,
         command: str,
         workdir: str = "/home/learner",
         image: str = None,
-    ) -> Dict[str, Any]:
+        timeout: Optional[float] = None,
+        output_limit: int = OutputCapture.DEFAULT_LIMIT,
+    ) -> Iterator[Dict[str, Any]]:
         """
-        Execute a command in the session's container.
+        Execute a command in the session's container, yielding output as it arrives.
+
+        Commands run in the session's persistent shell, so the working
+        directory, environment and background jobs carry over between calls.
+
+        Pure commands (see `classify.is_pure`) of sessions with nothing of
+        their own yet are answered from the result cache when they ran
+        before on the same image, and read-only commands of such sessions
+        run in the shared lane.
 
         Args:
             session_id: Unique session identifier
             command: Shell command to execute
-            workdir: Working directory inside the container
+            workdir: Starting directory when the session's shell is created
             image: Docker image to use if container needs to be created
+            timeout: Seconds before the command is killed (None for no limit)
+            output_limit: Maximum bytes of output to pass on; past half of
+                it only the most recent output is kept and sent at the end
+
+        Yields:
+            Dictionaries with an output chunk, then a final dictionary
+            with exit_code, timed_out, truncated and error
+        """
+        if not result_cache.cacheable(command) or self.has_own_state(session_id):
+            yield from self._stream_with_slot(
+                session_id, command, workdir, image, timeout, output_limit
+            )
+            return
+
+        cached = self.cached_result(session_id, command, image)
+        if cached is not None:
+            capture = OutputCapture(output_limit)
+            text = capture.feed(cached["output"].encode()) + capture.finish()
+            if text:
+                yield {"output": text}
+            yield {
+                "exit_code": cached["exit_code"],
+                "timed_out": False,
+                "truncated": capture.truncated,
+                "error": None,
+            }
+            return
+
+        events = self._stream_with_slot(
+            session_id, command, workdir, image, timeout, output_limit
+        )
+        output = []
+        for event in events:
+            if "output" in event:
+                output.append(event["output"])
+            else:
+                self.remember_result(command, image, {**event, "output": "".join(output)})
+            yield event
+
+    def cached_result(
+        self, session_id: str, command: str, image: str = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Get the remembered result of a pure command, without touching its container.
+
+        Sessions with a container, shell or saved home directory of their
+        own never get one: their shell may shadow the command.
+
+        Args:
+            session_id: Unique session identifier
+            command: Shell command to execute
+            image: Docker image the command would run in
 
         Returns:
-            Dictionary with output, exit_code, and optionally error
+            Dictionary with output and exit_code, or None if not cached
         """
-        # Ensure container exists
+        if not result_cache.cacheable(command) or self.has_own_state(session_id):
+            return None
+        image_id = self._cached_image_id(image)
+        return result_cache.get(image_id, command) if image_id else None
+
+    def remember_result(self, command: str, image: Optional[str], result: Dict[str, Any]) -> None:
+        """
+        Cache a finished command's result if the command is pure.
+
+        Only pass results of commands that started while their session had
+        nothing of its own (see `has_own_state`).
+
+        Args:
+            command: Shell command that ran
+            image: Docker image it ran in
+            result: Dictionary with output, exit_code, timed_out, truncated and error
+        """
+        if not result_cache.cacheable(command):
+            return
+        image_id = self._cached_image_id(image)
+        if image_id:
+            result_cache.put(image_id, command, result)
+
+    def _cached_image_id(self, image: Optional[str]) -> Optional[str]:
+        try:
+            return self._image_id(image or self.DEFAULT_IMAGE)
+        except DockerException:
+            return None
+
+    def _stream_with_slot(
+        self,
+        session_id: str,
+        command: str,
+        workdir: str,
+        image: Optional[str],
+        timeout: Optional[float],
+        output_limit: int,
+    ) -> Iterator[Dict[str, Any]]:
+        """Run a command while holding an execution slot; see stream_command."""
+        with self.capacity.exec_slot() as acquired:
+            if not acquired:
+                yield {
+                    "exit_code": -1,
+                    "timed_out": False,
+                    "truncated": False,
+                    "error": "The sandbox is busy. Please try again in a moment.",
+                    "retry_after": 1,
+                }
+                return
+            events = None
+            if self.can_use_lane(session_id, command):
+                events = self.lane.stream(
+                    command, image or self.DEFAULT_IMAGE, workdir, timeout, output_limit
+                )
+            if events is None:
+                events = self._stream_in_container(
+                    session_id, command, workdir, image, timeout, output_limit
+                )
+            yield from events
+
+    def can_use_lane(self, session_id: str, command: str) -> bool:
+        """
+        Whether a command can run in the shared lane instead of the session's container.
+
+        Only read-only commands of sessions with nothing of their own yet
+        (see `has_own_state`) qualify.
+        """
+        if not self.lane.size or not is_read_only(command):
+            return False
+        return not self.has_own_state(session_id)
+
+    def has_own_state(self, session_id: str) -> bool:
+        """
+        Whether a session may have changed anything a command could see.
+
+        True unless the session has no container (per the synced state
+        cache), no attached shell and no hibernated home directory.
+        """
+        if self.has_container(session_id) is not False:
+            return True
+        with self._lock:
+            if session_id in self._handles or session_id in self._shells:
+                return True
+        return self.hibernation.has(session_id)
+
+    def execute_batch(
+        self,
+        session_id: str,
+        commands: List[str],
+        workdir: str = "/home/learner",
+        image: str = None,
+        timeout: Optional[float] = None,
+        output_limit: int = OutputCapture.DEFAULT_LIMIT,
+    ) -> Dict[str, Any]:
+        """
+        Execute several commands in order in the session's shell.
+
+        The whole batch is one write to the shell, with each command's
+        output and exit code framed by its own marker, so it costs a
+        single round trip. The timeout covers the whole batch; if it
+        expires, or a command ends the shell, later commands don't run.
+
+        Args:
+            session_id: Unique session identifier
+            commands: Shell commands to execute
+            workdir: Starting directory when the session's shell is created
+            image: Docker image to use if container needs to be created
+            timeout: Seconds before the batch is killed (None for no limit)
+            output_limit: Maximum bytes of output to keep per command
+
+        Returns:
+            Dictionary with results (output, exit_code and truncated for
+            each command that ran, in order), timed_out, and optionally
+            error
+        """
+        with self.capacity.exec_slot() as acquired:
+            if not acquired:
+                return {
+                    "results": [],
+                    "timed_out": False,
+                    "error": "The sandbox is busy. Please try again in a moment.",
+                    "retry_after": 1,
+                }
+            with self._session_lock(session_id):
+                return self._run_batch(
+                    session_id, commands, workdir, image, timeout, output_limit
+                )
+
+    def _run_batch(
+        self,
+        session_id: str,
+        commands: List[str],
+        workdir: str,
+        image: Optional[str],
+        timeout: Optional[float],
+        output_limit: int,
+    ) -> Dict[str, Any]:
+        """Run a batch in the session's shell; see execute_batch."""
         container_result = self.get_or_create_container(session_id, image)
         if not container_result.get("success"):
-            return {
-                "output": "",
-                "exit_code": -1,
+            response = {
+                "results": [],
+                "timed_out": False,
                 "error": container_result.get("error"),
             }
+            for key in BACKPRESSURE_KEYS:
+                if key in container_result:
+                    response[key] = container_result[key]
+            return response
 
-        container_name = self._container_name(session_id)
+        captures = [OutputCapture(output_limit) for _ in commands]
+        outputs: List[List[str]] = [[] for _ in commands]
+        exit_codes: List[Optional[int]] = [None] * len(commands)
+        # Index of the command that was running when the batch stopped
+        current = 0
+        shell = None
+        error = None
+        try:
+            shell = self._get_shell(session_id, container_result["container_id"], workdir)
+            for event in shell.stream_batch(commands, timeout):
+                current = event["index"]
+                if "output" in event:
+                    outputs[current].append(captures[current].feed(event["output"]))
+                else:
+                    exit_codes[current] = event["exit_code"]
+                    current += 1
+            self._update_activity(session_id)
+            if current < len(commands):
+                # Interrupted: the shell reports the batch's status
+                exit_codes[current] = shell.last_exit_code
+        except ShellClosed:
+            # A command ended the shell (e.g. `exit`)
+            self._close_shell(session_id)
+            if current < len(commands):
+                exit_code = shell.exit_code() if shell else None
+                exit_codes[current] = exit_code if exit_code is not None else -1
+        except NotFound:
+            self.container_lost(session_id)
+            error = "Container not found. Please try again."
+        except APIError as e:
+            self._forget_container(session_id)
+            error = str(e)
+        except Exception as e:
+            error = str(e)
 
-        with self._lock:
+        results = []
+        for index, exit_code in enumerate(exit_codes):
+            if exit_code is None:
+                break
+            results.append({
+                "output": "".join(outputs[index]) + captures[index].finish(),
+                "exit_code": exit_code,
+                "truncated": captures[index].truncated,
+            })
+        return {
+            "results": results,
+            "timed_out": shell.timed_out if shell else False,
+            "error": error,
+        }
+
+    def _stream_in_container(
+        self,
+        session_id: str,
+        command: str,
+        workdir: str,
+        image: Optional[str],
+        timeout: Optional[float],
+        output_limit: int,
+    ) -> Iterator[Dict[str, Any]]:
+        """Run a command in the session's shell; see stream_command."""
+        with self._session_lock(session_id):
+            # Ensure container exists
+            container_result = self.get_or_create_container(session_id, image)
+            if not container_result.get("success"):
+                final = {
+                    "exit_code": -1,
+                    "timed_out": False,
+                    "truncated": False,
+                    "error": container_result.get("error"),
+                }
+                for key in BACKPRESSURE_KEYS:
+                    if key in container_result:
+                        final[key] = container_result[key]
+                yield final
+                return
+
+            capture = OutputCapture(output_limit)
+            shell = None
+            chunks = None
             try:
-                container = self.client.containers.get(container_name)
-                exit_code, output = container.exec_run(
-                    f"/bin/bash -c {repr(command)}",
-                    workdir=workdir,
-                    demux=False,
+                shell = self._get_shell(
+                    session_id, container_result["container_id"], workdir
                 )
+                chunks = shell.stream(command, timeout)
+                for chunk in chunks:
+                    text = capture.feed(chunk)
+                    if text:
+                        yield {"output": text}
                 self._update_activity(session_id)
-                return {
-                    "output": output.decode("utf-8") if output else "",
-                    "exit_code": exit_code,
+                final = {
+                    "exit_code": shell.last_exit_code,
+                    "timed_out": shell.timed_out,
+                    "error": None,
+                }
+
+            except ShellClosed as e:
+                # The command ended the shell (e.g. `exit`); the next
+                # command starts a fresh one
+                self._close_shell(session_id)
+                text = capture.feed(e.output)
+                if text:
+                    yield {"output": text}
+                exit_code = shell.exit_code() if shell else None
+                final = {
+                    "exit_code": exit_code if exit_code is not None else -1,
+                    "timed_out": shell.timed_out if shell else False,
                     "error": None,
                 }
 
             except NotFound:
-                return {
-                    "output": "",
+                self.container_lost(session_id)
+                final = {
                     "exit_code": -1,
+                    "timed_out": False,
                     "error": "Container not found. Please try again.",
                 }
 
+            except APIError as e:
+                # e.g. the container was stopped behind our back
+                self._forget_container(session_id)
+                final = {"exit_code": -1, "timed_out": False, "error": str(e)}
+
             except Exception as e:
-                return {
-                    "output": "",
-                    "exit_code": -1,
-                    "error": str(e),
-                }
+                final = {"exit_code": -1, "timed_out": False, "error": str(e)}
+
+            finally:
+                # Stop reading if the consumer went away mid-command
+                if chunks is not None:
+                    chunks.close()
+
+            text = capture.finish()
+            if text:
+                yield {"output": text}
+            final["truncated"] = capture.truncated
+            yield final
+
+    def open_pty(
+        self,
+        session_id: str,
+        cols: int = 80,
+        rows: int = 24,
+        workdir: str = "/home/learner",
+        image: str = None,
+    ) -> Dict[str, Any]:
+        """
+        Open an interactive terminal in the session's container.
+
+        Args:
+            session_id: Unique session identifier
+            cols: Initial terminal width
+            rows: Initial terminal height
+            workdir: Starting directory for the terminal's shell
+            image: Docker image to use if container needs to be created
+
+        Returns:
+            Dictionary with the PtySession under "pty", or an error
+        """
+        with self._session_lock(session_id):
+            container_result = self.get_or_create_container(session_id, image)
+            if not container_result.get("success"):
+                return {"success": False, "error": container_result.get("error")}
+
+            try:
+                pty = PtySession(
+                    self.api,
+                    container_result["container_id"],
+                    workdir,
+                    cols=cols,
+                    rows=rows,
+                    on_input=lambda: self.resume(session_id),
+                )
+            except Exception as e:
+                return {"success": False, "error": str(e)}
+
+            return {"success": True, "pty": pty}
 
     def reset_session(self, session_id: str, image: str = None) -> Dict[str, Any]:
         """
-        Destroy and recreate the session's container.
+        Replace the session's container with a clean one.
+
+        The old container is renamed aside and removed in the background
+        while the session takes a pre-started container from the pool, so
+        a reset usually costs two renames rather than a container boot.
 
         Args:
             session_id: Unique session identifier
@@ -188,26 +1113,30 @@ class SessionSandbox:
         Returns:
             Dictionary with success status and message
         """
-        container_name = self._container_name(session_id)
-
-        with self._lock:
-            # Remove existing container
+        with self._session_lock(session_id):
+            # Retire existing container; a reset also drops any saved home
+            self.hibernation.discard(session_id)
             try:
-                container = self.client.containers.get(container_name)
-                container.remove(force=True)
-            except NotFound:
-                pass
-            except Exception as e:
-                return {"success": False, "error": f"Failed to remove container: {e}"}
+                self._retire_container(session_id)
+            except Exception:
+                # Couldn't rename it aside; remove it in place instead
+                try:
+                    self._remove_container(session_id)
+                except Exception as e:
+                    return {"success": False, "error": f"Failed to remove container: {e}"}
 
             # Clear activity tracking
-            self._last_activity.pop(session_id, None)
+            self._forget_activity(session_id)
 
             # Create fresh container
             result = self.get_or_create_container(session_id, image)
             if result.get("success"):
                 return {"success": True, "message": "Sandbox reset successfully"}
-            return {"success": False, "error": result.get("error")}
+            failure = {"success": False, "error": result.get("error")}
+            for key in BACKPRESSURE_KEYS:
+                if key in result:
+                    failure[key] = result[key]
+            return failure
 
     def get_session_status(self, session_id: str) -> Dict[str, Any]:
         """
@@ -220,10 +1149,27 @@ class SessionSandbox:
             Dictionary with container status information
         """
         container_name = self._container_name(session_id)
+        last_activity = self._latest_activity(session_id)
+
+        if self.state.ready:
+            cached = self.state.get(container_name)
+            if cached is None:
+                return {
+                    "running": False,
+                    "status": "not_created",
+                    "id": None,
+                    "session_id": session_id,
+                }
+            return {
+                "running": cached["status"] == "running",
+                "status": cached["status"],
+                "id": cached["id"][:12],
+                "session_id": session_id,
+                "last_activity": last_activity.isoformat() if last_activity else None,
+            }
 
         try:
             container = self.client.containers.get(container_name)
-            last_activity = self._last_activity.get(session_id)
             return {
                 "running": container.status == "running",
                 "status": container.status,
@@ -246,54 +1192,147 @@ class SessionSandbox:
                 "session_id": session_id,
             }
 
+    def reap_expired(self) -> Dict[str, Any]:
+        """
+        Pause and remove containers whose idle deadlines have passed.
+
+        Called by the background reaper. Only sessions that are due on the
+        expiry heaps are examined: containers idle for `pause_after`
+        seconds are paused, and those idle for IDLE_TIMEOUT_MINUTES are
+        removed. Both run in parallel without holding the registry lock.
+
+        Returns:
+            Dictionary with cleanup results and the paused sessions
+        """
+        now = datetime.now()
+
+        paused = []
+        if self.pause_after > 0:
+            pause_idle = timedelta(seconds=self.pause_after)
+            due = self._due_sessions(self._pause_expiry, pause_idle, now)
+            if due:
+                workers = min(self.REAP_WORKERS, len(due))
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    results = executor.map(
+                        lambda session_id: self._pause_if_idle(session_id, now - pause_idle),
+                        due,
+                    )
+                    paused = [
+                        session_id for session_id, done in zip(due, results) if done
+                    ]
+
+        timeout = timedelta(minutes=self.IDLE_TIMEOUT_MINUTES)
+        expired = self._due_sessions(self._expiry, timeout, now)
+        result = self._remove_expired(expired, now - timeout)
+        result["paused_sessions"] = paused
+        self.hibernation.prune()
+        self._sweep_trash()
+        return result
+
+    def _due_sessions(
+        self, heap: ExpiryHeap, idle: timedelta, now: datetime
+    ) -> List[str]:
+        """Pop the sessions on a heap that have really been idle for `idle`."""
+        due = []
+        for session_id in heap.pop_due(now.timestamp()):
+            last_active = self._latest_activity(session_id)
+            if last_active is None:
+                # Reset or removed since it was scheduled
+                continue
+            if last_active + idle > now:
+                # Active since it was scheduled; check again later
+                heap.schedule(session_id, (last_active + idle).timestamp())
+                continue
+            due.append(session_id)
+        return due
+
+    def _pause_if_idle(self, session_id: str, cutoff: datetime) -> bool:
+        """
+        Pause a session's container unless it became active again.
+
+        Returns:
+            True if the container was paused
+        """
+        container_name = self._container_name(session_id)
+        with self._session_lock(session_id):
+            last_active = self._latest_activity(session_id)
+            if last_active is not None and last_active >= cutoff:
+                return False
+            cached = self.state.get(container_name)
+            if cached is not None and cached["status"] != "running":
+                return False
+            try:
+                self.api.pause(container_name)
+            except (APIError, RuntimeError):
+                # Gone, not running or already paused
+                return False
+            if cached is not None:
+                self.state.record(container_name, cached["id"], "paused")
+            return True
+
     def cleanup_expired(self) -> Dict[str, Any]:
         """
         Remove containers that have been idle for more than IDLE_TIMEOUT_MINUTES.
 
+        Unlike the background reaper this is a full sweep over every tracked
+        session, including those last used through other workers.
+
         Returns:
             Dictionary with cleanup results
         """
         cutoff = datetime.now() - timedelta(minutes=self.IDLE_TIMEOUT_MINUTES)
-        removed = []
-        errors = []
+        activity = self._activity_snapshot()
+
+        # Find expired sessions
+        expired_sessions = [
+            session_id
+            for session_id, last_active in activity.items()
+            if last_active < cutoff
+        ]
+
+        # Containers with no activity on record (e.g. created before activity
+        # was persisted) start their idle clock now rather than being removed
+        try:
+            for container in self._list_containers():
+                # Extract session_id from container name
+                session_id = container["name"][len(self.CONTAINER_PREFIX):]
+                if session_id not in activity:
+                    self._update_activity(session_id)
+        except Exception:
+            pass
 
+        return self._remove_expired(set(expired_sessions), cutoff)
+
+    def _activity_snapshot(self) -> Dict[str, datetime]:
+        """Get the latest activity of every session known to any worker."""
+        activity = {
+            session_id: datetime.fromtimestamp(timestamp)
+            for session_id, timestamp in self.activity.load().items()
+        }
         with self._lock:
-            # Find expired sessions
-            expired_sessions = [
-                session_id
-                for session_id, last_active in self._last_activity.items()
-                if last_active < cutoff
-            ]
+            for session_id, last_active in self._last_activity.items():
+                if session_id not in activity or activity[session_id] < last_active:
+                    activity[session_id] = last_active
+        return activity
 
-            # Also find any orphaned containers (in case activity wasn't tracked)
-            try:
-                containers = self.client.containers.list(
-                    all=True,
-                    filters={"name": self.CONTAINER_PREFIX},
-                )
-                for container in containers:
-                    # Extract session_id from container name
-                    if container.name.startswith(self.CONTAINER_PREFIX):
-                        session_id = container.name[len(self.CONTAINER_PREFIX):]
-                        if session_id not in self._last_activity:
-                            # No activity tracked, consider it expired
-                            expired_sessions.append(session_id)
-            except Exception:
-                pass
+    def _remove_expired(self, session_ids, cutoff: datetime) -> Dict[str, Any]:
+        """Remove the containers of expired sessions in parallel."""
+        removed = []
+        errors = []
+        if not session_ids:
+            return {"removed_count": 0, "removed_sessions": removed, "errors": errors}
 
-            # Remove expired containers
-            for session_id in set(expired_sessions):
-                container_name = self._container_name(session_id)
-                try:
-                    container = self.client.containers.get(container_name)
-                    container.remove(force=True)
+        workers = min(self.REAP_WORKERS, len(session_ids))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(
+                lambda session_id: (session_id, self._remove_if_idle(session_id, cutoff)),
+                session_ids,
+            )
+            for session_id, error in results:
+                if error is None:
                     removed.append(session_id)
-                    self._last_activity.pop(session_id, None)
-                except NotFound:
-                    # Already removed
-                    self._last_activity.pop(session_id, None)
-                except Exception as e:
-                    errors.append({"session_id": session_id, "error": str(e)})
+                elif error:
+                    errors.append({"session_id": session_id, "error": error})
 
         return {
             "removed_count": len(removed),
@@ -301,6 +1340,30 @@ class SessionSandbox:
             "errors": errors,
         }
 
+    def _remove_if_idle(self, session_id: str, cutoff: datetime) -> Optional[str]:
+        """
+        Remove a session's container unless it became active again.
+
+        Returns:
+            None if removed, "" if skipped or already gone, else an error message
+        """
+        with self._session_lock(session_id):
+            # Skip sessions that became active while we were scanning
+            last_active = self._latest_activity(session_id)
+            if last_active is not None and last_active >= cutoff:
+                return ""
+            try:
+                removed = self._remove_container(session_id, hibernate=True)
+            except HibernationFailed as e:
+                # Keep the learner's files; the next reap tries again
+                self._expiry.schedule(session_id, time.time())
+                return str(e)
+            except Exception as e:
+                return str(e)
+            self._forget_activity(session_id)
+            # An empty result means it was already removed
+            return None if removed else ""
+
     def list_active_sessions(self) -> Dict[str, Any]:
         """
         List all active session containers.
@@ -309,27 +1372,19 @@ class SessionSandbox:
             Dictionary with list of active sessions
         """
         sessions = []
+        activity = self._activity_snapshot()
 
         try:
-            containers = self.client.containers.list(
-                all=True,
-                filters={"name": self.CONTAINER_PREFIX},
-            )
-            for container in containers:
-                if container.name.startswith(self.CONTAINER_PREFIX):
-                    session_id = container.name[len(self.CONTAINER_PREFIX):]
-                    last_activity = self._last_activity.get(session_id)
-                    sessions.append({
-                        "session_id": session_id,
-                        "container_id": container.short_id,
-                        "status": container.status,
-                        "last_activity": last_activity.isoformat() if last_activity else None,
-                    })
+            for container in self._list_containers():
+                session_id = container["name"][len(self.CONTAINER_PREFIX):]
+                last_activity = activity.get(session_id)
+                sessions.append({
+                    "session_id": session_id,
+                    "container_id": container["id"][:12],
+                    "status": container["status"],
+                    "last_activity": last_activity.isoformat() if last_activity else None,
+                })
         except Exception as e:
             return {"error": str(e), "sessions": []}
 
         return {"sessions": sessions, "count": len(sessions)}
-
-
-# Singleton instance for the application
-session_sandbox = SessionSandbox()
@@ -0,0 +1,293 @@
+"""Placement of sandbox sessions across several Docker hosts."""
+
+import hashlib
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import docker
+from docker.errors import DockerException
+
+from app.terminal.backend import SandboxBackend
+from app.terminal.output import OutputCapture
+from app.terminal.session_sandbox import SessionSandbox
+from app.terminal.state_store import SqliteStore
+
+
+class PlacementStore(SqliteStore):
+    """Which Docker host each session lives on, shared between workers."""
+
+    FILENAME = "placements.db"
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS placements ("
+        "session_id TEXT PRIMARY KEY, host TEXT NOT NULL, updated REAL NOT NULL)"
+    )
+
+    def get(self, session_id: str) -> Optional[str]:
+        """Get the host a session was placed on, or None."""
+        rows = self._query(
+            "SELECT host FROM placements WHERE session_id = ?", (session_id,)
+        )
+        return rows[0][0] if rows else None
+
+    def set(self, session_id: str, host: str) -> None:
+        """Record a session's host."""
+        self._write(
+            "INSERT OR REPLACE INTO placements (session_id, host, updated) "
+            "VALUES (?, ?, ?)",
+            (session_id, host, time.time()),
+        )
+
+    def prune(self, before: float) -> None:
+        """Delete placements made before a timestamp."""
+        self._write("DELETE FROM placements WHERE updated < ?", (before,))
+
+
+class ShardedSandbox(SandboxBackend):
+    """
+    Spreads sessions over one SessionSandbox per Docker host.
+
+    With no hosts configured there is a single sandbox on the
+    environment's Docker daemon and every call goes straight to it.
+
+    With several hosts, a new session is placed by weighted rendezvous
+    hashing: each host scores the session with a hash of (host, session)
+    scaled by the host's free container capacity, and the best score
+    wins. Placements are recorded so a session stays on its host; a
+    session is only moved when its host no longer has its container and
+    has no room for a new one. Status, cleanup and listing calls query
+    every host in parallel.
+    """
+
+    # Hosts queried at once by fan-out calls
+    FAN_OUT_WORKERS = 8
+    # Placements older than this are forgotten
+    PLACEMENT_TTL_SECONDS = 24 * 60 * 60
+
+    def __init__(
+        self,
+        client_factory: Optional[Callable[[str], docker.DockerClient]] = None,
+    ):
+        """
+        Args:
+            client_factory: Creates a Docker client for a host URL
+        """
+        self._client_factory = client_factory or (
+            lambda url: docker.DockerClient(base_url=url)
+        )
+        # Host URL -> sandbox; "" is the environment's default daemon
+        self.shards: Dict[str, SessionSandbox] = {"": SessionSandbox()}
+        self.placements = PlacementStore()
+        self._lock = threading.Lock()
+
+    def init_app(self, app) -> None:
+        """Create a sandbox per configured Docker host and configure them."""
+        hosts = app.config.get("SANDBOX_DOCKER_HOSTS") or []
+        if hosts:
+            self.configure(hosts)
+        for shard in self.shards.values():
+            shard.init_app(app)
+        state_dir = app.config.get("SANDBOX_STATE_DIR")
+        if state_dir:
+            self.placements.configure(state_dir)
+
+    def configure(self, hosts: List[str]) -> None:
+        """Use one sandbox per Docker host URL."""
+        self.shards = {
+            url: SessionSandbox(
+                name=_host_key(url),
+                client_factory=partial(self._client_factory, url),
+                base_url=url,
+            )
+            for url in hosts
+        }
+
+    def start(self) -> None:
+        """Start every host's background workers."""
+        for shard in self.shards.values():
+            shard.start()
+
+    def shard_for(self, session_id: str) -> SessionSandbox:
+        """Get the sandbox for the host a session lives on, placing it if new."""
+        if len(self.shards) == 1:
+            return next(iter(self.shards.values()))
+
+        shard = self.shards.get(self.placements.get(session_id))
+        if shard is not None and self._can_stay(shard, session_id):
+            return shard
+
+        with self._lock:
+            host = self._existing_host(session_id) or self._choose_host(session_id)
+            self.placements.prune(time.time() - self.PLACEMENT_TTL_SECONDS)
+            self.placements.set(session_id, host)
+            return self.shards[host]
+
+    def get_or_create_container(
+        self, session_id: str, image: str = None
+    ) -> Dict[str, Any]:
+        """See SessionSandbox.get_or_create_container."""
+        return self.shard_for(session_id).get_or_create_container(session_id, image)
+
+    def execute_command(
+        self,
+        session_id: str,
+        command: str,
+        workdir: str = "/home/learner",
+        image: str = None,
+        timeout: Optional[float] = None,
+        output_limit: int = OutputCapture.DEFAULT_LIMIT,
+    ) -> Dict[str, Any]:
+        """See SandboxBackend.execute_command."""
+        return self.shard_for(session_id).execute_command(
+            session_id, command, workdir, image, timeout, output_limit
+        )
+
+    def stream_command(
+        self,
+        session_id: str,
+        command: str,
+        workdir: str = "/home/learner",
+        image: str = None,
+        timeout: Optional[float] = None,
+        output_limit: int = OutputCapture.DEFAULT_LIMIT,
+    ) -> Iterator[Dict[str, Any]]:
+        """See SessionSandbox.stream_command."""
+        return self.shard_for(session_id).stream_command(
+            session_id, command, workdir, image, timeout, output_limit
+        )
+
+    def execute_batch(
+        self,
+        session_id: str,
+        commands: List[str],
+        workdir: str = "/home/learner",
+        image: str = None,
+        timeout: Optional[float] = None,
+        output_limit: int = OutputCapture.DEFAULT_LIMIT,
+    ) -> Dict[str, Any]:
+        """See SessionSandbox.execute_batch."""
+        return self.shard_for(session_id).execute_batch(
+            session_id, commands, workdir, image, timeout, output_limit
+        )
+
+    def cached_result(
+        self, session_id: str, command: str, image: str = None
+    ) -> Optional[Dict[str, Any]]:
+        """See SessionSandbox.cached_result."""
+        return self.shard_for(session_id).cached_result(session_id, command, image)
+
+    def can_use_lane(self, session_id: str, command: str) -> bool:
+        """See SessionSandbox.can_use_lane."""
+        return self.shard_for(session_id).can_use_lane(session_id, command)
+
+    def open_pty(
+        self,
+        session_id: str,
+        cols: int = 80,
+        rows: int = 24,
+        workdir: str = "/home/learner",
+        image: str = None,
+    ) -> Dict[str, Any]:
+        """See SessionSandbox.open_pty."""
+        return self.shard_for(session_id).open_pty(session_id, cols, rows, workdir, image)
+
+    def reset_session(self, session_id: str, image: str = None) -> Dict[str, Any]:
+        """See SessionSandbox.reset_session."""
+        return self.shard_for(session_id).reset_session(session_id, image)
+
+    def get_session_status(self, session_id: str) -> Dict[str, Any]:
+        """See SessionSandbox.get_session_status."""
+        return self.shard_for(session_id).get_session_status(session_id)
+
+    def cleanup_expired(self) -> Dict[str, Any]:
+        """Run SessionSandbox.cleanup_expired on every host and merge the results."""
+        removed = []
+        errors = []
+        for result in self._fan_out(lambda shard: shard.cleanup_expired()):
+            removed.extend(result.get("removed_sessions", []))
+            errors.extend(result.get("errors", []))
+        return {
+            "removed_count": len(removed),
+            "removed_sessions": removed,
+            "errors": errors,
+        }
+
+    def list_active_sessions(self) -> Dict[str, Any]:
+        """Run SessionSandbox.list_active_sessions on every host and merge the results."""
+        sessions = []
+        errors = []
+        for result in self._fan_out(lambda shard: shard.list_active_sessions()):
+            sessions.extend(result.get("sessions", []))
+            if result.get("error"):
+                errors.append(result["error"])
+        response = {"sessions": sessions, "count": len(sessions)}
+        if errors:
+            response["error"] = "; ".join(errors)
+        return response
+
+    def _fan_out(self, call: Callable[[SessionSandbox], Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Call every host's sandbox in parallel."""
+        shards = list(self.shards.values())
+
+        def safe_call(shard):
+            try:
+                return call(shard)
+            except Exception as e:
+                return {"error": str(e)}
+
+        if len(shards) == 1:
+            return [safe_call(shards[0])]
+        workers = min(self.FAN_OUT_WORKERS, len(shards))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(safe_call, shards))
+
+    def _can_stay(self, shard: SessionSandbox, session_id: str) -> bool:
+        """Whether a placed session should stay on its host."""
+        if shard.has_container(session_id) is not False:
+            return True
+        try:
+            return shard.free_capacity() > 0
+        except (DockerException, RuntimeError):
+            return False
+
+    def _existing_host(self, session_id: str) -> Optional[str]:
+        """Find a host that already runs the session's container."""
+        for host, shard in self.shards.items():
+            if shard.has_container(session_id):
+                return host
+        return None
+
+    def _choose_host(self, session_id: str) -> str:
+        """Pick a host by rendezvous hashing weighted by free capacity."""
+        weights = {}
+        for host, shard in self.shards.items():
+            try:
+                weights[host] = max(0, shard.free_capacity())
+            except (DockerException, RuntimeError):
+                # Unreachable hosts get no new sessions
+                weights[host] = 0
+        if not any(weights.values()):
+            # Every host is full: place by plain hashing and queue there
+            weights = {host: 1 for host in weights}
+
+        def score(host: str) -> float:
+            if not weights[host]:
+                return -math.inf
+            digest = hashlib.blake2b(f"{host}|{session_id}".encode(), digest_size=8).digest()
+            # Uniform in (0, 1)
+            point = (int.from_bytes(digest, "big") + 1) / (2 ** 64 + 1)
+            return -weights[host] / math.log(point)
+
+        return max(weights, key=score)
+
+
+def _host_key(url: str) -> str:
+    """Short, file-name safe identifier for a Docker host URL."""
+    return hashlib.blake2b(url.encode(), digest_size=4).hexdigest()
+
+
+# Singleton instance for the application
+session_sandbox = ShardedSandbox()
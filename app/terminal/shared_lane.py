@@ -0,0 +1,227 @@
+"""Shared read-only containers for commands that don't change anything."""
+
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import docker
+from docker.errors import APIError, DockerException, NotFound
+
+from app.terminal.output import OutputCapture
+
+
+class SharedLane:
+    """
+    A few long-lived containers with a read-only root filesystem, shared
+    by every session on the host.
+
+    A learner browsing concepts mostly clicks read-only examples (see
+    `classify.is_read_only`). Until they change something, any fresh
+    container of the image answers those the same way their own would,
+    so they run here as one-shot execs instead of creating a session
+    container per visitor.
+
+    Containers have fixed names, so every worker on the host shares the
+    same ones and they survive restarts. A container that fails is
+    dropped and recreated in the background; while none is ready,
+    callers fall back to the session's own container.
+    """
+
+    LANE_PREFIX = "sandbox-lane-"
+    RETRY_SECONDS = 10
+    # Seconds a timed-out command gets after SIGTERM before SIGKILL
+    KILL_GRACE_SECONDS = 2
+    # Exit statuses of `timeout` when it had to stop the command
+    TIMEOUT_EXIT_CODES = (124, 137)
+
+    def __init__(
+        self,
+        client_getter: Callable[[], docker.DockerClient],
+        run_options: Dict[str, Any],
+        image: str = "linux-sandbox:latest",
+        size: int = 0,
+        api_getter: Optional[Callable[[], Any]] = None,
+    ):
+        self._client_getter = client_getter
+        # Low-level client for execs; docker-py's unless given a leaner one
+        self._api_getter = api_getter or (lambda: client_getter().api)
+        self._run_options = {
+            **run_options,
+            "read_only": True,
+            # Shared by everyone, so keep fork bombs contained
+            "pids_limit": 128,
+        }
+        self.image = image
+        self.size = size
+        # Names of containers known to be running the current image
+        self._ready: List[str] = []
+        self._next = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def configure(self, image: str = None, size: int = None) -> None:
+        """Update the lane image and number of containers."""
+        with self._lock:
+            if image is not None and image != self.image:
+                self.image = image
+                self._ready = []
+            if size is not None:
+                self.size = max(0, size)
+                self._ready = self._ready[:self.size]
+        self._wakeup.set()
+
+    def start(self) -> None:
+        """Start the background thread that keeps the lane filled (idempotent)."""
+        if self.size <= 0:
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._ready = []
+            self._thread = threading.Thread(
+                target=self._fill_loop, name="sandbox-lane", daemon=True
+            )
+            self._thread.start()
+
+    def stream(
+        self,
+        command: str,
+        image: str,
+        workdir: str = "/home/learner",
+        timeout: Optional[float] = None,
+        output_limit: int = OutputCapture.DEFAULT_LIMIT,
+    ) -> Optional[Iterator[Dict[str, Any]]]:
+        """
+        Start a command in one of the lane's containers.
+
+        Args:
+            command: Read-only shell command to execute
+            image: Image the session would use; only the lane's image is served
+            workdir: Directory to run the command in
+            timeout: Seconds before the command is killed (None for no limit)
+            output_limit: Maximum bytes of output to pass on
+
+        Returns:
+            Iterator of output chunks and a final status dictionary, as
+            SessionSandbox.stream_command yields them; None if no lane
+            container could take the command
+        """
+        name = self.pick(image)
+        if name is None:
+            return None
+        try:
+            api = self._api_getter()
+            exec_id = api.exec_create(name, self.argv(command, timeout), workdir=workdir)["Id"]
+            deadline = time.monotonic() + timeout if timeout else None
+            chunks = api.exec_start(exec_id, stream=True)
+        except DockerException:
+            self.discard(name)
+            return None
+        return self._events(api, exec_id, chunks, deadline, output_limit)
+
+    def argv(self, command: str, timeout: Optional[float] = None) -> List[str]:
+        """Command line that runs a command in a lane container, killed after the timeout."""
+        argv = ["/bin/bash", "-c", command]
+        if timeout:
+            argv = ["timeout", "-k", str(self.KILL_GRACE_SECONDS), str(timeout)] + argv
+        return argv
+
+    def _events(
+        self,
+        api: Any,
+        exec_id: str,
+        chunks: Iterator[bytes],
+        deadline: Optional[float],
+        output_limit: int,
+    ) -> Iterator[Dict[str, Any]]:
+        capture = OutputCapture(output_limit)
+        final = {"exit_code": -1, "timed_out": False, "error": None}
+        try:
+            for chunk in chunks:
+                text = capture.feed(chunk)
+                if text:
+                    yield {"output": text}
+            exit_code = api.exec_inspect(exec_id).get("ExitCode")
+            final["exit_code"] = exit_code if exit_code is not None else -1
+            # The command itself may exit 124 or be OOM-killed; only
+            # count it as timed out once the deadline has passed
+            final["timed_out"] = (
+                deadline is not None
+                and exit_code in self.TIMEOUT_EXIT_CODES
+                and time.monotonic() >= deadline
+            )
+        except DockerException as e:
+            final["error"] = str(e)
+        finally:
+            if hasattr(chunks, "close"):
+                chunks.close()
+        text = capture.finish()
+        if text:
+            yield {"output": text}
+        final["truncated"] = capture.truncated
+        yield final
+
+    def pick(self, image: str) -> Optional[str]:
+        """Next ready container, round robin; None if the lane can't serve."""
+        with self._lock:
+            if image != self.image or not self._ready:
+                return None
+            self._next = (self._next + 1) % len(self._ready)
+            return self._ready[self._next]
+
+    def discard(self, name: str) -> None:
+        """Stop using a container that failed and have it recreated."""
+        with self._lock:
+            if name in self._ready:
+                self._ready.remove(name)
+        self._wakeup.set()
+
+    def _fill_loop(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                self._fill()
+                timeout = None
+            except (DockerException, RuntimeError):
+                # Docker unavailable or image missing; retry later
+                timeout = self.RETRY_SECONDS
+            self._wakeup.wait(timeout)
+
+    def _fill(self) -> None:
+        """Make sure lane containers 0..size-1 exist and run the current image."""
+        with self._lock:
+            image, size, ready = self.image, self.size, set(self._ready)
+        client = self._client_getter()
+        image_id = client.images.get(image).id
+        for index in range(size):
+            name = f"{self.LANE_PREFIX}{index}"
+            if name in ready:
+                continue
+            self._ensure(client, name, image, image_id)
+            with self._lock:
+                if image == self.image and index < self.size and name not in self._ready:
+                    self._ready.append(name)
+
+    def _ensure(
+        self, client: docker.DockerClient, name: str, image: str, image_id: str
+    ) -> None:
+        """Start a lane container, replacing one that is stale or stopped."""
+        try:
+            container = client.containers.get(name)
+            if container.attrs.get("Image") == image_id and container.status == "running":
+                return
+            container.remove(force=True)
+        except NotFound:
+            pass
+        try:
+            client.containers.run(
+                image,
+                name=name,
+                labels={"learn-session": ""},
+                **self._run_options,
+            )
+        except APIError as e:
+            if e.status_code != 409:
+                raise
+            # Another worker created it first
@@ -0,0 +1,459 @@
+"""Long-lived bash shells attached to session containers."""
+
+import base64
+import re
+import socket
+import struct
+import time
+import uuid
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import docker
+
+# Interactive bash without a terminal complains whenever a foreground job
+# dies from a signal (e.g. `yes | head`); these lines are not command output
+_TTY_NOISE = re.compile(rb"(?m)^bash: \[\d+: \d+ \(\d+\)\] tcsetattr: [^\n]*\n")
+_TTY_NOISE_PREFIX = b"bash: ["
+
+
+class ShellClosed(Exception):
+    """The shell process ended before a command finished."""
+
+    def __init__(self, output: bytes = b""):
+        super().__init__("Shell exited")
+        self.output = output
+
+
+class FrameDecoder:
+    """
+    Strips the framing from Docker's multiplexed attach stream.
+
+    Without a tty, every write of the attached process arrives as an
+    8-byte header (stream type and payload length) and the payload;
+    reads may split headers and payloads anywhere.
+    """
+
+    def __init__(self):
+        self._header = b""
+        self._remaining = 0
+
+    def feed(self, data: bytes) -> bytes:
+        """Add bytes read from the socket; returns the payload they complete."""
+        payload = []
+        while data:
+            if self._remaining == 0:
+                need = 8 - len(self._header)
+                self._header += data[:need]
+                data = data[need:]
+                if len(self._header) == 8:
+                    _, self._remaining = struct.unpack(">BxxxL", self._header)
+                    self._header = b""
+                continue
+            piece = data[:self._remaining]
+            data = data[self._remaining:]
+            self._remaining -= len(piece)
+            payload.append(piece)
+        return b"".join(payload)
+
+
+class MarkerReader:
+    """
+    Splits a shell's output into each command's output and exit status.
+
+    Every command is followed by a line with the shell's random marker
+    and the command's exit status. Output is handed on as it arrives,
+    except for a tail that may turn out to be the start of that line or
+    tty noise to drop. Doing no I/O itself, it serves blocking and
+    asyncio shells alike.
+    """
+
+    def __init__(self, marker: bytes):
+        self._marker = marker
+        self._token = marker + b":"
+        self._pending = b""
+
+    def command(self, command: str) -> bytes:
+        """Shell input that runs a command and then prints its marker line."""
+        # eval runs in the current shell so state persists; reading stdin
+        # from /dev/null keeps a command from swallowing the marker line,
+        # which is sent separately so an interrupted command still reports
+        return (
+            f"eval \"$(printf %s '{_encode(command)}' | base64 -d)\" < /dev/null\n"
+            f"printf '%s:%d\\n' {self._marker.decode()} $?\n"
+        ).encode()
+
+    def feed(self, data: bytes) -> None:
+        """Add output read from the shell."""
+        self._pending += data
+
+    def take(self) -> Tuple[bytes, Optional[int]]:
+        """
+        Take the output that is ready.
+
+        Returns:
+            Output that can be passed on, and the command's exit status
+            once its marker line has arrived (else None)
+        """
+        self._pending = _TTY_NOISE.sub(b"", self._pending)
+        index = self._pending.find(self._token)
+        if index != -1:
+            end = self._pending.find(b"\n", index)
+            if end != -1:
+                output = self._pending[:index]
+                status = self._pending[index + len(self._token):end]
+                self._pending = self._pending[end + 1:]
+                return output, int(status)
+            hold = len(self._pending) - index
+        else:
+            hold = max(
+                _partial_suffix(self._pending, self._token),
+                _partial_noise_line(self._pending),
+            )
+
+        # Hand out everything that cannot be part of the marker line
+        split = len(self._pending) - hold
+        output, self._pending = self._pending[:split], self._pending[split:]
+        return output, None
+
+    def flush(self) -> bytes:
+        """Take everything held back, e.g. once the shell has exited."""
+        output, self._pending = self._pending, b""
+        return output
+
+
+class BatchReader:
+    """
+    Splits the output of a batch script into each command's output and status.
+
+    The script runs the commands in turn, each followed by a numbered
+    marker line with its exit status. Like MarkerReader it does no I/O.
+    """
+
+    def __init__(self, marker: bytes):
+        self._step = marker + b"+"
+        self._pending = b""
+        # Index of the command whose output is arriving
+        self.current = 0
+
+    def script(self, commands: List[str]) -> str:
+        """Command line that runs every command and reports each one's status."""
+        return "".join(
+            f"eval \"$(printf %s '{_encode(command)}' | base64 -d)\"\n"
+            f"printf '%s%d:%d\\n' {self._step.decode()} {index} $?\n"
+            for index, command in enumerate(commands)
+        )
+
+    def feed(self, data: bytes) -> List[Dict[str, Any]]:
+        """
+        Add output of the script.
+
+        Returns:
+            {"index": i, "output": bytes} and {"index": i, "exit_code": n}
+            events, in order
+        """
+        self._pending += data
+        events = self._take_steps()
+        start = self._pending.find(self._step)
+        hold = (
+            len(self._pending) - start
+            if start != -1
+            else _partial_suffix(self._pending, self._step)
+        )
+        if len(self._pending) > hold:
+            split = len(self._pending) - hold
+            events.append({"index": self.current, "output": self._pending[:split]})
+            self._pending = self._pending[split:]
+        return events
+
+    def finish(self, data: bytes = b"") -> List[Dict[str, Any]]:
+        """Add the last output of the script and take everything held back."""
+        self._pending += data
+        events = self._take_steps()
+        if self._pending:
+            events.append({"index": self.current, "output": self._pending})
+            self._pending = b""
+        return events
+
+    def _take_steps(self) -> List[Dict[str, Any]]:
+        events = []
+        while True:
+            start = self._pending.find(self._step)
+            end = self._pending.find(b"\n", start) if start != -1 else -1
+            if end == -1:
+                return events
+            if start:
+                events.append({"index": self.current, "output": self._pending[:start]})
+            index, status = self._pending[start + len(self._step):end].split(b":")
+            events.append({"index": int(index), "exit_code": int(status)})
+            self.current = int(index) + 1
+            self._pending = self._pending[end + 1:]
+
+
+class PersistentShell:
+    """
+    One attached bash process per session.
+
+    Commands are written to the shell's stdin and their output is read
+    back up to a random marker line carrying the exit status. Because
+    every command runs in the same shell, `cd`, exported variables,
+    aliases and background jobs persist between commands, and a command
+    costs a socket write instead of an exec create/start round trip.
+    """
+
+    SHELL_COMMAND = ["/bin/bash", "--noediting", "-i"]
+    # Merge stderr into stdout so output keeps its natural order,
+    # silence the interactive prompts and keep our framing out of history
+    SETUP = (
+        b"exec 2>&1\n"
+        b"PS1= PS2= PS0= PROMPT_COMMAND=\n"
+        b"unset HISTFILE\n"
+    )
+    READ_SIZE = 65536
+    # How long a signalled command gets to unwind before escalating
+    KILL_GRACE_SECONDS = 2
+    # Signal every descendant of a process, then interrupt the process itself
+    SIGNAL_TREE_SCRIPT = (
+        'signal_tree() { for child in $(pgrep -P "$1"); do '
+        'signal_tree "$child" "$2"; kill -"$2" "$child" 2>/dev/null; done; }; '
+        'signal_tree "$0" "$1"; kill -INT "$0"'
+    )
+
+    def __init__(
+        self, api: docker.APIClient, container: str, workdir: str = "/home/learner"
+    ):
+        """
+        Start bash inside a container.
+
+        Args:
+            api: Low-level Docker API client
+            container: Container name or id to attach to
+            workdir: Starting directory for the shell
+        """
+        self._api = api
+        self.container = container
+        self._marker = uuid.uuid4().hex.encode()
+        self._exec_id = api.exec_create(
+            container,
+            self.SHELL_COMMAND,
+            stdin=True,
+            tty=False,
+            workdir=workdir,
+        )["Id"]
+        self._socket = api.exec_start(self._exec_id, socket=True)
+        # docker-py wraps the raw socket in a SocketIO object
+        self._sock = getattr(self._socket, "_sock", self._socket)
+        self._frames = FrameDecoder()
+        self._reader = MarkerReader(self._marker)
+        self.closed = False
+        self.last_exit_code: Optional[int] = None
+        self.timed_out = False
+
+        self._send(self.SETUP)
+        # Anything the shell printed while starting up precedes the pid
+        self.pid = int(self.run("echo $$")["output"].split()[-1])
+
+    def run(self, command: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Run a command in the shell and wait for it to finish.
+
+        Args:
+            command: Shell command to execute
+            timeout: Seconds before the command is killed (None for no limit)
+
+        Returns:
+            Dictionary with raw output bytes and exit_code
+
+        Raises:
+            ShellClosed: If the shell exited (e.g. the command was `exit`)
+        """
+        output = []
+        try:
+            for chunk in self.stream(command, timeout):
+                output.append(chunk)
+        except ShellClosed as e:
+            raise ShellClosed(b"".join(output) + e.output)
+        return {"output": b"".join(output), "exit_code": self.last_exit_code}
+
+    def stream(self, command: str, timeout: Optional[float] = None) -> Iterator[bytes]:
+        """
+        Run a command in the shell, yielding output as it arrives.
+
+        Once the generator is exhausted, `last_exit_code` holds the
+        command's exit status. Abandoning the generator early closes the
+        shell, since the command may still be writing to it.
+
+        When the timeout expires `timed_out` is set and the command is
+        interrupted the way Ctrl-C would: SIGINT to every process the shell
+        started and to the shell, which abandons the rest of the command
+        line. Processes that ignore it get SIGKILL after a grace period,
+        and as a last resort the shell itself is killed and ShellClosed
+        is raised.
+
+        Args:
+            command: Shell command to execute
+            timeout: Seconds before the command is killed (None for no limit)
+
+        Raises:
+            ShellClosed: If the shell exited (e.g. the command was `exit`)
+        """
+        self.last_exit_code = None
+        self.timed_out = False
+        deadline = time.monotonic() + timeout if timeout else None
+        self._send(self._reader.command(command))
+
+        finished = False
+        kill_stage = 0
+        try:
+            while True:
+                output, status = self._reader.take()
+                if output:
+                    yield output
+                if status is not None:
+                    self.last_exit_code = status
+                    finished = True
+                    return
+
+                try:
+                    chunk = self._read_stream(deadline)
+                except socket.timeout:
+                    deadline = time.monotonic() + self.KILL_GRACE_SECONDS
+                    self.timed_out = True
+                    kill_stage += 1
+                    if kill_stage == 1:
+                        self._signal_command("INT")
+                        continue
+                    if kill_stage == 2:
+                        self._signal_command("KILL")
+                        continue
+                    if kill_stage == 3:
+                        # The shell itself is stuck; take it down
+                        self._exec(["kill", "-KILL", str(self.pid)])
+                        continue
+                    # The container is unresponsive; give up on the shell
+                    chunk = b""
+                if not chunk:
+                    finished = True
+                    self.close()
+                    raise ShellClosed(self._reader.flush())
+                self._reader.feed(chunk)
+        finally:
+            if not finished:
+                self.close()
+
+    def stream_batch(
+        self, commands: List[str], timeout: Optional[float] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Run several commands in one go, yielding each one's output and status.
+
+        The commands are sent in a single write as one command line that
+        runs each in turn and prints a numbered marker with its exit
+        status. The timeout covers the whole batch; interrupting it
+        abandons the command line, so later commands don't run.
+
+        Args:
+            commands: Shell commands to execute, in order
+            timeout: Seconds before the batch is killed (None for no limit)
+
+        Yields:
+            {"index": i, "output": bytes} as command i writes output, and
+            {"index": i, "exit_code": n} once it finishes
+
+        Raises:
+            ShellClosed: If the shell exited (e.g. a command was `exit`)
+        """
+        reader = BatchReader(self._marker)
+        try:
+            for chunk in self.stream(reader.script(commands), timeout):
+                yield from reader.feed(chunk)
+        except ShellClosed as e:
+            yield from reader.finish(e.output)
+            raise ShellClosed()
+        yield from reader.finish()
+
+    def exit_code(self) -> Optional[int]:
+        """Exit code of the shell process once it has ended."""
+        try:
+            return self._api.exec_inspect(self._exec_id).get("ExitCode")
+        except docker.errors.DockerException:
+            return None
+
+    def close(self) -> None:
+        """Close the attach socket, which ends the shell."""
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self._socket.close()
+        except OSError:
+            pass
+
+    def _send(self, data: bytes) -> None:
+        try:
+            self._sock.sendall(data)
+        except OSError:
+            self.close()
+            raise ShellClosed()
+
+    def _signal_command(self, signal: str) -> None:
+        """Signal every process started by the shell, then interrupt the shell."""
+        self._exec(["/bin/bash", "-c", self.SIGNAL_TREE_SCRIPT, str(self.pid), signal])
+
+    def _exec(self, cmd) -> None:
+        """Run a helper command next to the shell in the same container."""
+        try:
+            exec_id = self._api.exec_create(self.container, cmd)["Id"]
+            self._api.exec_start(exec_id)
+        except docker.errors.DockerException:
+            pass
+
+    def _read_stream(self, deadline: Optional[float] = None) -> bytes:
+        """
+        Read the next chunk of output from the multiplexed attach stream.
+
+        Raises:
+            socket.timeout: If nothing arrived before the deadline
+        """
+        while True:
+            data = self._recv(self.READ_SIZE, deadline)
+            if not data:
+                return b""
+            output = self._frames.feed(data)
+            if output:
+                return output
+
+    def _recv(self, size: int, deadline: Optional[float] = None) -> bytes:
+        if deadline is None:
+            self._sock.settimeout(None)
+        else:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise socket.timeout()
+            self._sock.settimeout(remaining)
+        try:
+            return self._sock.recv(size)
+        except socket.timeout:
+            raise
+        except OSError:
+            return b""
+
+
+def _encode(command: str) -> str:
+    """Base64 form of a command, safe to put in a single-quoted word."""
+    return base64.b64encode(command.encode("utf-8")).decode("ascii")
+
+
+def _partial_suffix(data: bytes, token: bytes) -> int:
+    """Length of the longest suffix of data that is a prefix of token."""
+    for size in range(min(len(token), len(data)), 0, -1):
+        if data.endswith(token[:size]):
+            return size
+    return 0
+
+
+def _partial_noise_line(data: bytes) -> int:
+    """Length of an unfinished last line that may turn out to be tty noise."""
+    line = data[data.rfind(b"\n") + 1:]
+    if line and line[:len(_TTY_NOISE_PREFIX)] == _TTY_NOISE_PREFIX[:len(line)]:
+        return len(line)
+    return 0
@@ -0,0 +1,99 @@
+"""Sandbox state persisted to local SQLite files shared between workers."""
+
+import os
+import sqlite3
+import tempfile
+import threading
+from typing import Dict, List, Optional
+
+STATE_DIR = os.path.join(tempfile.gettempdir(), "learn-sandbox")
+
+
+class SqliteStore:
+    """
+    Base class for small SQLite databases shared by every worker on a host.
+
+    Each thread gets its own connection; WAL mode keeps readers from
+    blocking the writer. Persistence is best effort: if the file cannot
+    be read or written, reads return nothing and writes are dropped.
+    """
+
+    FILENAME = "state.db"
+    SCHEMA = ""
+    BUSY_TIMEOUT_SECONDS = 5
+
+    def __init__(self, path: Optional[str] = None, filename: Optional[str] = None):
+        self.filename = filename or self.FILENAME
+        self.path = path or os.path.join(STATE_DIR, self.filename)
+        self._local = threading.local()
+
+    def configure(self, state_dir: str) -> None:
+        """Move the database into a different directory."""
+        self.path = os.path.join(state_dir, self.filename)
+        # Connections opened for the old path are dropped lazily
+        self._local = threading.local()
+
+    def _write(self, sql: str, params: tuple = ()) -> None:
+        try:
+            connection = self._connection()
+            with connection:
+                connection.execute(sql, params)
+        except (sqlite3.Error, OSError):
+            pass
+
+    def _query(self, sql: str, params: tuple = ()) -> List[tuple]:
+        try:
+            return self._connection().execute(sql, params).fetchall()
+        except (sqlite3.Error, OSError):
+            return []
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=self.BUSY_TIMEOUT_SECONDS)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(self.SCHEMA)
+            self._local.connection = connection
+        return connection
+
+
+class ActivityStore(SqliteStore):
+    """
+    Last-activity times for sandbox sessions.
+
+    Because all workers share the file, they see each other's activity,
+    and the timestamps survive a restart or deploy.
+    """
+
+    FILENAME = "activity.db"
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS activity ("
+        "session_id TEXT PRIMARY KEY, last_active REAL NOT NULL)"
+    )
+
+    def touch(self, session_id: str, timestamp: float) -> None:
+        """Record activity for a session, keeping the most recent time."""
+        self._write(
+            "INSERT INTO activity (session_id, last_active) VALUES (?, ?) "
+            "ON CONFLICT(session_id) DO UPDATE SET "
+            "last_active = MAX(last_active, excluded.last_active)",
+            (session_id, timestamp),
+        )
+
+    def forget(self, session_id: str) -> None:
+        """Stop tracking a session."""
+        self._write("DELETE FROM activity WHERE session_id = ?", (session_id,))
+
+    def get(self, session_id: str) -> Optional[float]:
+        """Get a session's last activity time, or None if it is unknown."""
+        rows = self._query(
+            "SELECT last_active FROM activity WHERE session_id = ?", (session_id,)
+        )
+        return rows[0][0] if rows else None
+
+    def load(self) -> Dict[str, float]:
+        """Get the last activity time of every tracked session."""
+        return dict(self._query("SELECT session_id, last_active FROM activity"))
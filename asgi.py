@@ -0,0 +1,18 @@
+#!/usr/bin/env python3
+"""
+ASGI entry point for the Unix & Networking learning platform.
+
+Sandbox commands, streams and terminals run on one event loop per
+worker; everything else is the same Flask app as run.py:
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+"""
+
+from app.asgi import create_asgi_app
+
+app = create_asgi_app()
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host="0.0.0.0", port=5000)
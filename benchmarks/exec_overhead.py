@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Per-exec client overhead: docker-py versus EngineClient.
+
+Both clients run the same create/start/inspect sequence a sandbox
+command costs against a fake Docker Engine on a local unix socket. The
+fake answers instantly, except that each exec "runs" for EXEC_SECONDS
+before printing its output, as a real process would; that time is
+subtracted, so the reported figures are the clients' own overhead.
+
+    python -m benchmarks.exec_overhead --iterations 2000
+"""
+
+import argparse
+import json
+import os
+import re
+import socketserver
+import struct
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+
+import docker
+
+from app.terminal.engine_client import EngineClient
+
+OUTPUT = b"hello from the sandbox\n"
+# How long each fake exec takes to produce its output
+EXEC_SECONDS = 0.001
+
+
+class FakeEngineHandler(BaseHTTPRequestHandler):
+    """Just enough of the Engine API for an exec round trip."""
+
+    protocol_version = "HTTP/1.1"
+    exec_ids = iter(range(1, 1 << 62))
+
+    def do_GET(self):
+        if re.search(r"/exec/[^/]+/json$", self.path):
+            self._json(200, {"ExitCode": 0, "Running": False})
+        else:
+            self._json(404, {"message": f"no route {self.path}"})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if re.search(r"/containers/[^/]+/exec$", self.path):
+            json.loads(body)
+            self._json(201, {"Id": f"exec{next(self.exec_ids)}"})
+        elif re.search(r"/exec/[^/]+/start$", self.path):
+            self._attach()
+        else:
+            self._json(404, {"message": f"no route {self.path}"})
+
+    def _json(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _attach(self):
+        # Like the daemon: answer the upgrade if asked, stream frames, hang up
+        if self.headers.get("Upgrade"):
+            self.send_response(101, "UPGRADED")
+            self.send_header("Connection", "Upgrade")
+            self.send_header("Upgrade", "tcp")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.docker.multiplexed-stream")
+        self.end_headers()
+        time.sleep(EXEC_SECONDS)
+        self.wfile.write(struct.pack(">BxxxL", 1, len(OUTPUT)) + OUTPUT)
+        self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeEngine(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def run_execs(api, iterations: int) -> float:
+    """Run the sandbox's exec sequence; returns seconds per exec."""
+    started = time.perf_counter()
+    for _ in range(iterations):
+        exec_id = api.exec_create("learn-bench", ["/bin/bash", "-c", "true"])["Id"]
+        output = b"".join(api.exec_start(exec_id, stream=True))
+        assert output == OUTPUT, output
+        assert api.exec_inspect(exec_id)["ExitCode"] == 0
+    return (time.perf_counter() - started) / iterations - EXEC_SECONDS
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=1000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "docker.sock")
+    server = FakeEngine(path, FakeEngineHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    clients = {
+        "docker-py APIClient": docker.APIClient(base_url=f"unix://{path}", version="1.41"),
+        "EngineClient": EngineClient(path),
+    }
+    try:
+        results = {}
+        for name, api in clients.items():
+            run_execs(api, 50)  # warm up
+            results[name] = run_execs(api, args.iterations)
+        baseline = results["docker-py APIClient"]
+        print(f"{args.iterations} execs (create + start + inspect) per client")
+        for name, seconds in results.items():
+            print(
+                f"  {name:<20} {seconds * 1e6:8.0f} us/exec"
+                f"  ({baseline / seconds:.1f}x docker-py)"
+            )
+    finally:
+        server.shutdown()
+        server.server_close()
+        os.remove(path)
+        os.rmdir(directory)
+
+
+if __name__ == "__main__":
+    main()
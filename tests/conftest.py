@@ -0,0 +1,36 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.terminal.session_sandbox import SessionSandbox
+from tests.fake_docker import FakeDockerClient
+
+
+def wait_for(condition, timeout: float = 5.0) -> None:
+    """Poll until a condition holds, failing the test after the timeout."""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            pytest.fail("condition not met in time")
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def make_sandbox(tmp_path):
+    """Build SessionSandboxes over fake Docker daemons, with state under tmp_path."""
+    count = 0
+
+    def make(client: FakeDockerClient = None, **config) -> SessionSandbox:
+        nonlocal count
+        count += 1
+        client = client or FakeDockerClient(str(tmp_path))
+        sandbox = SessionSandbox(name=f"fake{count}", client_factory=lambda: client)
+        sandbox.init_app(SimpleNamespace(config={
+            "SANDBOX_STATE_DIR": str(tmp_path / "state"),
+            "SANDBOX_REAP_INTERVAL": 0,
+            **config,
+        }))
+        return sandbox
+
+    return make
@@ -0,0 +1,287 @@
+"""In-memory stand-in for a Docker daemon, running execs as local processes."""
+
+import itertools
+import os
+import queue
+import socket
+import struct
+import subprocess
+import threading
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from docker.errors import APIError, NotFound
+
+
+class FakeImage:
+    def __init__(self, name: str):
+        self.id = f"sha256:{abs(hash(name)):x}"
+
+
+class FakeContainer:
+    def __init__(self, client: "FakeDockerClient", name: str, image: str, labels: Dict[str, str]):
+        self.client = client
+        self.name = name
+        self.id = uuid.uuid4().hex * 2
+        self.short_id = self.id[:12]
+        self.image = image
+        self.labels = labels
+        self.status = "running"
+        self.attrs = {"Image": client.images.get(image).id}
+        # What `docker diff` reports
+        self.changes: List[Dict[str, Any]] = []
+
+    def reload(self) -> None:
+        if self.client.containers.by_name.get(self.name) is not self:
+            raise NotFound(self.name)
+
+    def start(self) -> None:
+        self._set_status("running", "start")
+
+    def stop(self, timeout: int = 10) -> None:
+        self._set_status("exited", "die")
+
+    def pause(self) -> None:
+        self._set_status("paused", "pause")
+
+    def unpause(self) -> None:
+        self._set_status("running", "unpause")
+
+    def rename(self, name: str) -> None:
+        containers = self.client.containers
+        with containers.lock:
+            self.reload()
+            del containers.by_name[self.name]
+            old_name, self.name = self.name, name
+            containers.by_name[name] = self
+        self.client.emit("rename", self, oldName=f"/{old_name}")
+
+    def remove(self, force: bool = False, v: bool = False) -> None:
+        with self.client.containers.lock:
+            if self.client.containers.by_name.get(self.name) is self:
+                del self.client.containers.by_name[self.name]
+        self.client.emit("destroy", self)
+
+    def diff(self) -> List[Dict[str, Any]]:
+        self.reload()
+        return self.changes
+
+    def exec_run(self, cmd, workdir: str = None, demux: bool = False, **options):
+        api = self.client.api
+        exec_id = api.exec_create(self.id, cmd, workdir=workdir)["Id"]
+        output = api.exec_start(exec_id)
+        return api.exec_inspect(exec_id)["ExitCode"], output
+
+    def _set_status(self, status: str, action: str) -> None:
+        self.status = status
+        self.client.emit(action, self)
+
+
+class FakeContainers:
+    def __init__(self, client: "FakeDockerClient"):
+        self.client = client
+        self.by_name: Dict[str, FakeContainer] = {}
+        self.lock = threading.Lock()
+        # Names of every container started, in order
+        self.created: List[str] = []
+
+    def run(self, image: str, name: Optional[str] = None, labels: Dict[str, str] = None, **options) -> FakeContainer:
+        name = name or f"container-{next(self.client.ids)}"
+        with self.lock:
+            if name in self.by_name:
+                raise APIError(f"Conflict: {name} exists", response=_Response(409))
+            container = FakeContainer(self.client, name, image, labels or {})
+            self.by_name[name] = container
+            self.created.append(name)
+        self.client.emit("create", container)
+        self.client.emit("start", container)
+        return container
+
+    def get(self, name: str) -> FakeContainer:
+        with self.lock:
+            for container in self.by_name.values():
+                if name == container.name or container.id.startswith(name):
+                    return container
+        raise NotFound(name)
+
+    def list(self, all: bool = False, filters: Dict[str, Any] = None) -> List[FakeContainer]:
+        name = (filters or {}).get("name", "")
+        label = (filters or {}).get("label")
+        with self.lock:
+            containers = list(self.by_name.values())
+        return [
+            container
+            for container in containers
+            if (all or container.status == "running")
+            and name in container.name
+            and (label is None or label.split("=", 1)[0] in container.labels)
+        ]
+
+
+class FakeImages:
+    def __init__(self):
+        self._images: Dict[str, FakeImage] = {}
+
+    def get(self, name: str) -> FakeImage:
+        return self._images.setdefault(name, FakeImage(name))
+
+
+class FakeAPI:
+    """
+    Low-level client whose execs are local processes.
+
+    `exec_start(stream=True)` yields the process's output and
+    `exec_start(socket=True)` returns a socket speaking Docker's
+    multiplexed stream framing, so PersistentShell drives a real bash.
+    `before_start`, if set, is called with the exec id before each start.
+    """
+
+    def __init__(self, client: "FakeDockerClient"):
+        self.client = client
+        self.execs: Dict[str, Dict[str, Any]] = {}
+        self.before_start: Optional[Callable[[str], None]] = None
+
+    def exec_create(self, container: str, cmd, stdin: bool = False, tty: bool = False, workdir: str = None, **options) -> Dict[str, str]:
+        self.client.containers.get(container)
+        exec_id = f"exec-{next(self.client.ids)}"
+        argv = cmd if isinstance(cmd, list) else ["/bin/sh", "-c", cmd]
+        self.execs[exec_id] = {"cmd": argv, "container": container, "process": None}
+        return {"Id": exec_id}
+
+    def exec_start(self, exec_id: str, socket: bool = False, stream: bool = False, **options):
+        if self.before_start is not None:
+            self.before_start(exec_id)
+        entry = self.execs[exec_id]
+        process = subprocess.Popen(
+            entry["cmd"],
+            stdin=subprocess.PIPE if socket else subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            cwd=self.client.workdir,
+            env={"PATH": os.environ.get("PATH", ""), "HOME": self.client.workdir},
+            start_new_session=True,
+        )
+        entry["process"] = process
+        if socket:
+            return _attach(process)
+        if stream:
+            return iter(lambda: process.stdout.read1(65536), b"")
+        output = process.stdout.read()
+        process.wait()
+        return output
+
+    def exec_inspect(self, exec_id: str) -> Dict[str, Any]:
+        process = self.execs[exec_id]["process"]
+        if process is None:
+            return {"ExitCode": None, "Running": False}
+        exit_code = process.wait()
+        # Docker reports a process killed by a signal as 128 + signal
+        return {"ExitCode": 128 - exit_code if exit_code < 0 else exit_code, "Running": False}
+
+    def exec_resize(self, exec_id: str, height: int = None, width: int = None) -> None:
+        pass
+
+    def remove_container(self, container: str, force: bool = False, v: bool = False) -> None:
+        self.client.containers.get(container).remove(force=force, v=v)
+
+    def pause(self, container: str) -> None:
+        self.client.containers.get(container).pause()
+
+    def unpause(self, container: str) -> None:
+        self.client.containers.get(container).unpause()
+
+
+class FakeDockerClient:
+    """Just enough of docker.DockerClient for SessionSandbox."""
+
+    def __init__(self, workdir: str, memory: int = 64 << 30, cpus: int = 64):
+        self.workdir = workdir
+        self.ids = itertools.count()
+        self.memory = memory
+        self.cpus = cpus
+        self.images = FakeImages()
+        self.containers = FakeContainers(self)
+        self.api = FakeAPI(self)
+        self._subscribers: List[queue.Queue] = []
+
+    def ping(self) -> bool:
+        return True
+
+    def info(self) -> Dict[str, Any]:
+        return {"MemTotal": self.memory, "NCPU": self.cpus}
+
+    def events(self, decode: bool = False, filters: Dict[str, Any] = None) -> "_EventStream":
+        events = _EventStream()
+        self._subscribers.append(events.queue)
+        return events
+
+    def emit(self, action: str, container: FakeContainer, **attributes) -> None:
+        event = {
+            "Type": "container",
+            "Action": action,
+            "Actor": {
+                "ID": container.id,
+                "Attributes": {"name": container.name, **container.labels, **attributes},
+            },
+        }
+        for subscriber in list(self._subscribers):
+            subscriber.put(event)
+
+
+class _EventStream:
+    def __init__(self):
+        self.queue: queue.Queue = queue.Queue()
+
+    def __iter__(self):
+        while True:
+            event = self.queue.get()
+            if event is None:
+                return
+            yield event
+
+    def close(self) -> None:
+        self.queue.put(None)
+
+
+class _Response:
+    def __init__(self, status_code: int):
+        self.status_code = status_code
+        self.reason = ""
+
+
+def _attach(process: subprocess.Popen) -> socket.socket:
+    """Bridge a process to a socket, framing its output as stdout frames."""
+    ours, theirs = socket.socketpair()
+
+    def pump_output():
+        while True:
+            data = process.stdout.read1(65536)
+            if not data:
+                break
+            try:
+                ours.sendall(struct.pack(">BxxxL", 1, len(data)) + data)
+            except OSError:
+                break
+        try:
+            ours.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+
+    def pump_input():
+        while True:
+            try:
+                data = ours.recv(65536)
+            except OSError:
+                data = b""
+            try:
+                if not data:
+                    process.stdin.close()
+                    break
+                process.stdin.write(data)
+                process.stdin.flush()
+            except (OSError, ValueError):
+                break
+
+    threading.Thread(target=pump_output, daemon=True).start()
+    threading.Thread(target=pump_input, daemon=True).start()
+    return theirs
@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+
+from app.terminal.async_sandbox import AsyncSessionSandbox
+from app.terminal.backend import BackendSwitch
+from tests.conftest import wait_for
+
+
+@pytest.fixture
+def sandbox(make_sandbox, monkeypatch):
+    sandbox = make_sandbox()
+    sandbox.state.start()
+    wait_for(lambda: sandbox.state.ready)
+    assert sandbox.get_or_create_container("a")["success"]
+    wait_for(lambda: sandbox.has_container("a"))
+    sandbox.resumed = []
+    monkeypatch.setattr(sandbox, "resume", sandbox.resumed.append)
+    return sandbox
+
+
+def _type(sandbox, keystrokes):
+    async_sandbox = AsyncSessionSandbox(BackendSwitch({"docker": sandbox}, "docker"))
+
+    async def run():
+        for _ in range(keystrokes):
+            async_sandbox._record_input(sandbox, "a")
+        await asyncio.gather(*async_sandbox._background)
+
+    asyncio.run(run())
+
+
+def test_input_to_running_container_only_records_activity(sandbox):
+    sandbox._last_activity.clear()
+
+    _type(sandbox, 3)
+
+    assert sandbox.resumed == []
+    assert "a" in sandbox._last_activity
+
+
+def test_input_to_paused_container_resumes_it_once(sandbox):
+    sandbox.client.containers.get("learn-a").pause()
+    wait_for(lambda: sandbox.may_be_paused("a"))
+
+    _type(sandbox, 3)
+
+    assert sandbox.resumed == ["a"]
@@ -0,0 +1,81 @@
+import time
+
+import pytest
+from docker.errors import DockerException
+
+from app.terminal.capacity import CapacityManager
+from tests.fake_docker import FakeDockerClient
+
+
+@pytest.fixture
+def usage():
+    return {"containers": 0, "running": 0}
+
+
+@pytest.fixture
+def capacity(tmp_path, usage):
+    client = FakeDockerClient(str(tmp_path), memory=4 << 30, cpus=2)
+    capacity = CapacityManager(lambda: client, lambda: dict(usage))
+    capacity.configure(max_containers=10, state_dir=str(tmp_path))
+    return capacity
+
+
+def test_free_slots_is_the_smallest_budget(capacity, usage):
+    # 4 GiB / 256 MiB = 16 containers, 2 CPUs / 0.5 = 4 running
+    assert capacity.free_slots() == 4
+
+    usage.update(containers=6, running=1)
+    # Paused containers only count against the container and memory budgets
+    assert capacity.free_slots() == 3
+
+    capacity.configure(max_containers=7)
+    assert capacity.free_slots() == 1
+
+
+def test_full_host_admits_sessions_in_arrival_order(capacity, usage):
+    usage.update(containers=4, running=4)
+
+    first = capacity.admit("first")
+    second = capacity.admit("second")
+    assert (first["queue_position"], second["queue_position"]) == (1, 2)
+    assert first["retry_after"] == CapacityManager.RETRY_SECONDS
+    assert not capacity.has_room()
+
+    # One slot frees up: only the head of the line gets it
+    usage.update(containers=3, running=3)
+    assert not capacity.admit("second")["success"]
+    assert capacity.admit("first")["success"]
+    usage.update(containers=4, running=4)
+    assert capacity.admit("second")["queue_position"] == 1
+
+
+def test_sessions_that_stop_retrying_leave_the_line(capacity, usage):
+    usage.update(containers=4, running=4)
+    capacity.admit("gone")
+    stale = time.time() - CapacityManager.RETRY_SECONDS * CapacityManager.STALE_RETRIES - 1
+    # Its last retry was longer ago than the stale cutoff
+    capacity.tickets.join("gone", stale)
+
+    usage.update(containers=3, running=3)
+    assert capacity.admit("next")["success"]
+
+
+def test_unreachable_daemon_admits(tmp_path, usage):
+    def unreachable():
+        raise DockerException("connection refused")
+
+    capacity = CapacityManager(unreachable, lambda: dict(usage))
+    capacity.configure(state_dir=str(tmp_path))
+
+    assert capacity.admit("session") == {"success": True}
+
+
+def test_exec_slots_are_capped(capacity, monkeypatch):
+    monkeypatch.setattr(CapacityManager, "EXEC_WAIT_SECONDS", 0.01)
+    capacity.configure(max_execs=1)
+
+    with capacity.exec_slot() as first:
+        with capacity.exec_slot() as second:
+            assert (first, second) == (True, False)
+    with capacity.exec_slot() as again:
+        assert again
@@ -0,0 +1,88 @@
+import pytest
+
+from app.terminal.classify import is_pure, is_read_only
+
+
+@pytest.mark.parametrize("command", [
+    "echo hello",
+    "printf '%s\\n' a b | sort | uniq -c",
+    "cat /var/log/sample-app.log",
+    "grep ERROR /var/log/sample-app.log | wc -l",
+    "head -n 3 /etc/passwd && tail -2 /etc/os-release",
+    "cut -d: -f1 /etc/passwd",
+])
+def test_pure(command):
+    assert is_pure(command)
+
+
+@pytest.mark.parametrize("command", [
+    "cat",
+    "cat notes.txt",
+    "cat /home/learner/documents/notes/todo.txt",
+    "cat /etc/hosts",
+    "cat /tmp/f",
+    "cat /var/log/../../tmp/f",
+    "grep -r ERROR /var/log",
+    "echo $HOME",
+    "cat /var/log/*.log",
+    "echo hi > /tmp/out",
+    "printf -v x hi",
+    "date",
+])
+def test_impure(command):
+    assert not is_pure(command)
+
+
+@pytest.mark.parametrize("command", [
+    "ls -la",
+    "ls /",
+    "ls ..",
+    "ls *.txt",
+    "cat ~/documents/notes/todo.txt",
+    "grep ERROR /var/log/sample-app.log | wc -l",
+    "grep -r TODO .",
+    "find . -name '*.md'",
+    "wc -l < /etc/passwd",
+    "echo $HOME",
+    "cat /etc/passwd 2>/dev/null",
+    "ss -tuln",
+    "dig example.com",
+])
+def test_read_only(command):
+    assert is_read_only(command)
+
+
+@pytest.mark.parametrize("command", [
+    # Changes something
+    "touch notes.txt",
+    "cd /tmp",
+    "sort -o out.txt in.txt",
+    "find . -delete",
+    "echo hi > out.txt",
+    "sleep 5 &",
+    "echo $(whoami)",
+    # Looks at other learners' processes in the shared lane
+    "ps aux",
+    "cat /proc/1/cmdline",
+    "cat /proc/*/cmdline",
+    "ls -l /proc/*/cwd",
+    "grep -r . /proc/*/environ",
+    "cat ../../proc/1/cmdline",
+    "cat /dev/fd/../../1/cmdline",
+    "cat < /proc/1/cmdline",
+    "timeout 5 cat /proc/1/cmdline",
+    "ls /pro?",
+    "ls {/proc,/tmp}",
+    "cat ${SHELL:0:1}proc",
+    "cat $_",
+    "ls -R /",
+    "grep -r secret /",
+    "find / -name cmdline",
+    "find ../.. -lname '*sleep*'",
+    "du -a /.",
+    "tree //",
+    "ss -tulpn",
+    "netstat -p",
+])
+def test_not_read_only(command):
+    assert not is_read_only(command)
@@ -0,0 +1,57 @@
+import threading
+
+import pytest
+
+from app.terminal import container_pool
+from app.terminal.container_pool import ContainerPool
+from tests.conftest import wait_for
+from tests.fake_docker import FakeDockerClient
+
+IMAGE = "linux-sandbox:latest"
+
+
+@pytest.fixture
+def client(tmp_path):
+    return FakeDockerClient(str(tmp_path))
+
+
+@pytest.fixture
+def pool(client):
+    pool = ContainerPool(lambda: client, {}, image=IMAGE, size=2)
+    yield pool
+    pool.drain()
+
+
+def test_drain_is_registered_once_across_restarts(pool, monkeypatch):
+    registered = []
+    monkeypatch.setattr(container_pool.atexit, "register", registered.append)
+
+    pool.start()
+    pool.start()
+    # A refill thread that died is replaced on the next start
+    pool._thread = threading.Thread(target=lambda: None)
+    pool._thread.start()
+    pool._thread.join()
+    pool.start()
+
+    assert registered == [pool.drain]
+
+
+def test_claim_renames_an_idle_container_and_refills(pool, client):
+    pool.start()
+    wait_for(lambda: pool.idle_count() == 2)
+
+    container = pool.claim("learn-abc", IMAGE)
+
+    assert container.name == "learn-abc"
+    assert client.containers.get("learn-abc") is container
+    wait_for(lambda: pool.idle_count() == 2)
+    assert len(client.containers.created) == 3
+
+
+def test_claim_leaves_the_pool_alone_for_another_image(pool):
+    pool.start()
+    wait_for(lambda: pool.idle_count() == 2)
+
+    assert pool.claim("learn-abc", "other:latest") is None
+    assert pool.idle_count() == 2
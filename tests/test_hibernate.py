@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta
+
+import pytest
+from docker.errors import APIError
+
+from app.terminal.hibernate import HibernationFailed, HibernationStore
+
+
+def _fail(*args, **kwargs):
+    raise APIError("daemon hiccup")
+
+
+@pytest.fixture
+def container(make_sandbox):
+    sandbox = make_sandbox()
+    assert sandbox.get_or_create_container("a")["success"]
+    return sandbox.client.containers.get("learn-a")
+
+
+def test_nothing_changed_is_not_saved(tmp_path, container):
+    store = HibernationStore(str(tmp_path / "hibernate"))
+
+    assert store.save("a", container) is False
+    assert not store.has("a")
+
+
+def test_docker_failures_raise(tmp_path, container):
+    store = HibernationStore(str(tmp_path / "hibernate"))
+    container.changes = [{"Path": "/home/learner/notes.txt", "Kind": 1}]
+    container.get_archive = _fail
+
+    with pytest.raises(HibernationFailed):
+        store.save("a", container)
+    container.diff = _fail
+    with pytest.raises(HibernationFailed):
+        store.save("a", container)
+    assert not store.has("a")
+    assert not list((tmp_path / "hibernate").iterdir())
+
+
+def test_reaper_keeps_container_it_could_not_hibernate(make_sandbox):
+    sandbox = make_sandbox()
+    assert sandbox.execute_command("a", "cd /")["exit_code"] == 0
+    container = sandbox.client.containers.get("learn-a")
+    container.diff = _fail
+    idle_cutoff = datetime.now() + timedelta(minutes=1)
+    # As the reaper does, take the session off the expiry heap first
+    assert sandbox._expiry.pop_due(idle_cutoff.timestamp() + 3600) == ["a"]
+
+    assert sandbox._remove_if_idle("a", idle_cutoff)
+    assert sandbox.client.containers.by_name == {"learn-a": container}
+    # The shell survives too, and the session is due again on the next reap
+    assert sandbox.execute_command("a", "pwd")["output"] == "/\n"
+    assert sandbox._expiry.pop_due(datetime.now().timestamp()) == ["a"]
+
+    del container.diff
+    assert sandbox._remove_if_idle("a", idle_cutoff) is None
+    assert sandbox.client.containers.by_name == {}
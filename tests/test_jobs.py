@@ -0,0 +1,75 @@
+import threading
+import time
+
+import pytest
+
+from app import create_app
+from app.routes import playground
+from app.terminal.jobs import JobManager
+
+
+@pytest.fixture
+def jobs(tmp_path):
+    jobs = JobManager(max_workers=1, max_pending=1)
+    jobs.store.configure(str(tmp_path))
+    return jobs
+
+
+def test_long_poll_returns_as_soon_as_the_job_finishes(jobs):
+    release = threading.Event()
+    job_id = jobs.submit("s1", lambda: release.wait() and {"output": "done"})["job_id"]
+    threading.Timer(0.1, release.set).start()
+
+    started = time.monotonic()
+    job = jobs.get(job_id, "s1", wait=5)
+
+    assert job == {"job_id": job_id, "status": JobManager.DONE, "result": {"output": "done"}}
+    # Woken by the job rather than by the store poll
+    assert time.monotonic() - started < JobManager.POLL_SECONDS
+
+
+def test_long_poll_gives_up_after_wait(jobs):
+    release = threading.Event()
+    job_id = jobs.submit("s1", release.wait)["job_id"]
+    try:
+        assert jobs.get(job_id, "s1", wait=0.1)["status"] != JobManager.DONE
+    finally:
+        release.set()
+
+
+def test_jobs_of_other_sessions_are_not_found(jobs):
+    job_id = jobs.submit("s1", dict)["job_id"]
+
+    assert jobs.get(job_id, "s2") is None
+
+
+def test_submit_refuses_past_the_pending_cap(jobs):
+    release = threading.Event()
+    try:
+        assert jobs.submit("s1", release.wait)["success"]
+        assert jobs.submit("s1", release.wait)["success"]
+        assert not jobs.submit("s1", release.wait)["success"]
+    finally:
+        release.set()
+
+
+def test_full_queue_is_http_429(tmp_path, monkeypatch, jobs):
+    app = create_app({
+        "TESTING": True,
+        "SANDBOX_STATE_DIR": str(tmp_path / "state"),
+        "SANDBOX_POOL_SIZE": 0,
+        "SANDBOX_REAP_INTERVAL": 0,
+    })
+    monkeypatch.setattr(playground, "job_manager", jobs)
+    release = threading.Event()
+    jobs.submit("other", release.wait)
+    jobs.submit("other", release.wait)
+
+    try:
+        with app.test_client() as http:
+            response = http.post("/playground/jobs", json={"command": "echo hi"})
+    finally:
+        release.set()
+
+    assert response.status_code == 429
+    assert not response.get_json()["success"]
@@ -0,0 +1,80 @@
+import subprocess
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+from app.terminal.backend import BackendSwitch
+from app.terminal.namespace_sandbox import NamespaceSandbox, ShellRegistry
+
+# Claims a shell in another process and holds it until stdin closes
+WORKER = """
+import sys
+from app.terminal.namespace_sandbox import ShellRegistry
+print(ShellRegistry(sys.argv[1]).claim(sys.argv[2], 1), flush=True)
+sys.stdin.read()
+"""
+
+
+@pytest.fixture
+def sandbox(tmp_path):
+    sandbox = NamespaceSandbox(client_factory=lambda: None)
+    sandbox.init_app(SimpleNamespace(config={"SANDBOX_STATE_DIR": str(tmp_path)}))
+    return sandbox
+
+
+@pytest.mark.parametrize("session_id", ["../escape", "a/b", ".", "", "name with space"])
+def test_session_ids_that_are_not_directory_names_are_rejected(sandbox, session_id):
+    with pytest.raises(ValueError):
+        sandbox._home(session_id)
+
+
+def test_session_id_becomes_a_directory_under_homes(sandbox):
+    assert sandbox._home("abc_DEF-123") == f"{sandbox.homes}/abc_DEF-123"
+
+
+def test_limit_covers_shells_of_other_workers(tmp_path):
+    path = str(tmp_path / "shells.db")
+    registry = ShellRegistry(path)
+    worker = subprocess.Popen(
+        [sys.executable, "-c", WORKER, path, "theirs"],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        assert worker.stdout.readline().strip() == "True"
+        assert not registry.claim("ours", 1)
+    finally:
+        worker.communicate("")
+
+    # Shells of workers that exited no longer count
+    assert registry.claim("ours", 1)
+
+
+def test_release_frees_the_slot(tmp_path):
+    registry = ShellRegistry(str(tmp_path / "shells.db"))
+
+    assert registry.claim("first", 1)
+    registry.release("first")
+
+    assert registry.claim("second", 1)
+
+
+def test_unreadable_registry_refuses_like_a_full_one(tmp_path, sandbox):
+    (tmp_path / "not-a-dir").write_text("")
+    sandbox.registry.configure(str(tmp_path / "not-a-dir"))
+
+    assert not sandbox.registry.claim("session", 50)
+    result = sandbox.get_or_create_container("session")
+    assert not result["success"]
+    assert "retry_after" in result
+
+
+def test_unknown_backend_is_rejected():
+    backends = {"docker": NamespaceSandbox(), "namespace": NamespaceSandbox()}
+    switch = BackendSwitch(backends, "docker")
+
+    with pytest.raises(ValueError, match="Unknown SANDBOX_BACKEND 'podman'"):
+        switch.init_app(SimpleNamespace(config={"SANDBOX_BACKEND": "podman"}))
+    assert switch.backend is backends["docker"]
@@ -0,0 +1,43 @@
+import pytest
+
+from app.terminal.executor import RUN_OPTIONS
+from app.terminal.one_shot_pool import OneShotPool
+from tests.conftest import wait_for
+from tests.fake_docker import FakeDockerClient
+
+IMAGE = "linux-sandbox:latest"
+
+
+@pytest.fixture
+def client(tmp_path):
+    return FakeDockerClient(str(tmp_path))
+
+
+@pytest.fixture
+def pool(client):
+    return OneShotPool(lambda: client, RUN_OPTIONS, image=IMAGE)
+
+
+def test_each_command_gets_a_fresh_container(pool, client):
+    first = pool.run("echo one", IMAGE)
+    second = pool.run("echo two", IMAGE)
+
+    assert (first["output"], second["output"]) == ("one\n", "two\n")
+    assert len(client.containers.created) == 2
+    # Used containers are removed in the background
+    wait_for(lambda: not client.containers.by_name)
+
+
+def test_command_past_its_deadline_times_out(pool):
+    result = pool.run("sleep 5", IMAGE, timeout=0.5)
+
+    assert result["exit_code"] == 124
+    assert result["timed_out"]
+
+
+@pytest.mark.parametrize("command", ["exit 124", "timeout 0.1 sleep 5", "kill -9 $$"])
+def test_timeout_exit_codes_before_the_deadline_are_not_timeouts(pool, command):
+    result = pool.run(command, IMAGE, timeout=30)
+
+    assert result["exit_code"] in (124, 137)
+    assert not result["timed_out"]
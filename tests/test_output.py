@@ -0,0 +1,51 @@
+from app.terminal.output import OutputCapture
+
+
+def capture_all(capture, chunks):
+    return "".join(capture.feed(chunk) for chunk in chunks) + capture.finish()
+
+
+def test_characters_split_across_chunks_decode_whole():
+    data = "héllo → wörld ✓\n".encode()
+    capture = OutputCapture()
+
+    text = capture_all(capture, [data[i:i + 1] for i in range(len(data))])
+
+    assert text == "héllo → wörld ✓\n"
+    assert not capture.truncated
+
+
+def test_character_split_at_the_head_limit_decodes_whole():
+    # The four-byte head ends inside the three-byte arrow
+    data = "ab→cd".encode()
+    capture = OutputCapture(limit=8)
+
+    assert capture.feed(data[:3]) == "ab"
+    assert capture_all(capture, [data[3:]]) == "→cd"
+    assert not capture.truncated
+
+
+def test_long_output_keeps_head_and_tail():
+    capture = OutputCapture(limit=10)
+    chunks = [b"0123456789", b"abcdefghij", b"ABCDEFGHIJ"]
+
+    shown = [capture.feed(chunk) for chunk in chunks]
+    rest = capture.finish()
+
+    assert shown == ["01234", "", ""]
+    assert capture.truncated
+    assert capture.total_bytes == 30
+    assert rest == "\n[... output truncated: 20 bytes omitted ...]\nFGHIJ"
+
+
+def test_tail_does_not_start_inside_a_character():
+    capture = OutputCapture(limit=8)
+
+    # The four tail bytes kept start in the middle of "¢"
+    text = capture_all(capture, ["ab".encode(), "xy¢€".encode()])
+
+    assert text == "abxy\n[... output truncated: 2 bytes omitted ...]\n€"
+
+
+def test_invalid_utf8_is_replaced():
+    assert capture_all(OutputCapture(), [b"ok \xff\xfe\n"]) == "ok ��\n"
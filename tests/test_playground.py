@@ -0,0 +1,64 @@
+import json
+
+from app import create_app
+from app.routes.playground import MAX_BATCH_COMMANDS
+from app.terminal.sharding import session_sandbox
+from tests.conftest import wait_for
+
+
+def _events(body: str):
+    """Parse a Server-Sent Events body into (event, payload) pairs."""
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_fresh_session_ls_runs_in_shared_lane(tmp_path, monkeypatch, make_sandbox):
+    app = create_app({
+        "TESTING": True,
+        "SANDBOX_STATE_DIR": str(tmp_path / "state"),
+        "SANDBOX_LANE_SIZE": 1,
+        "SANDBOX_POOL_SIZE": 0,
+        "SANDBOX_REAP_INTERVAL": 0,
+        "SANDBOX_RESULT_CACHE": 0,
+    })
+    sandbox = make_sandbox(SANDBOX_LANE_SIZE=1)
+    monkeypatch.setattr(session_sandbox, "shards", {"": sandbox})
+    sandbox.state.start()
+    sandbox.lane.start()
+    wait_for(lambda: sandbox.state.ready and sandbox.lane.pick(sandbox.DEFAULT_IMAGE))
+    client = sandbox.client
+
+    with app.test_client() as http:
+        with http.session_transaction() as session:
+            session["sandbox_id"] = "fresh"
+        response = http.post("/playground/execute/stream", json={"command": "ls"})
+        events = _events(response.get_data(as_text=True))
+
+    assert response.status_code == 200
+    assert events[-1][0] == "done"
+    assert events[-1][1]["exit_code"] == 0
+    assert "state" in "".join(payload.get("output", "") for _, payload in events)
+    assert [name for name in client.containers.created if name.startswith("learn-")] == []
+    assert [entry["container"] for entry in client.api.execs.values()] == ["sandbox-lane-0"]
+
+
+def test_batch_over_the_command_cap_is_refused(tmp_path, monkeypatch, make_sandbox):
+    app = create_app({
+        "TESTING": True,
+        "SANDBOX_STATE_DIR": str(tmp_path / "state"),
+        "SANDBOX_POOL_SIZE": 0,
+        "SANDBOX_REAP_INTERVAL": 0,
+    })
+    sandbox = make_sandbox()
+    monkeypatch.setattr(session_sandbox, "shards", {"": sandbox})
+    commands = ["echo hi"] * (MAX_BATCH_COMMANDS + 1)
+
+    with app.test_client() as http:
+        response = http.post("/playground/execute/batch", json={"commands": commands})
+
+    assert response.status_code == 400
+    assert str(MAX_BATCH_COMMANDS) in response.get_json()["error"]
+    assert sandbox.client.containers.created == []
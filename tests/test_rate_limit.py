@@ -0,0 +1,68 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+from app.terminal.rate_limit import RateLimiter
+
+# Slow enough that buckets don't refill during a test
+RATE = 1e-6
+
+
+@pytest.fixture
+def limiter(tmp_path):
+    limiter = RateLimiter()
+    limiter.init_app(SimpleNamespace(config={
+        "SANDBOX_STATE_DIR": str(tmp_path),
+        "SANDBOX_RATE": RATE,
+        "SANDBOX_BURST": 10,
+        "SANDBOX_IP_RATE": RATE,
+        "SANDBOX_IP_BURST": 15,
+    }))
+    return limiter
+
+
+def test_concurrent_requests_only_charge_the_address_for_allowed_ones(limiter):
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        waits = list(executor.map(lambda _: limiter.check("s1", "10.0.0.1"), range(50)))
+
+    assert waits.count(0) == 10
+    # The address paid for the 10 allowed requests only
+    assert limiter.addresses.take("ip:10.0.0.1", 5) == 0
+    assert limiter.addresses.take("ip:10.0.0.1", 1) > 0
+
+
+def test_request_refused_for_its_address_does_not_cost_the_session(limiter):
+    assert limiter.check("s1", "10.0.0.1", cost=10) == 0
+    assert limiter.check("s2", "10.0.0.1", cost=10) > 0
+
+    # s2 still has its whole burst
+    assert limiter.check("s2", None, cost=10) == 0
+    assert limiter.check("s2", None) > 0
+
+
+def test_session_bucket_is_checked_and_charged_at_once(limiter, monkeypatch):
+    take = limiter.addresses.take
+    charged = []
+
+    def slow_take(key, cost=1.0):
+        charged.append(key)
+        # Leave time for the other request to check the session bucket
+        time.sleep(0.2)
+        return take(key, cost)
+
+    monkeypatch.setattr(limiter.addresses, "take", slow_take)
+    barrier = threading.Barrier(2)
+
+    def check(_):
+        barrier.wait()
+        return limiter.check("s1", "10.0.0.1", cost=10)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        waits = sorted(executor.map(check, range(2)))
+
+    assert waits[0] == 0 and waits[1] > 0
+    # Only the request the session could afford reached the address bucket
+    assert charged == ["ip:10.0.0.1"]
@@ -0,0 +1,25 @@
+from app.terminal.reaper import ExpiryHeap
+
+
+def test_pop_due_returns_due_keys_in_deadline_order():
+    heap = ExpiryHeap()
+    heap.schedule("late", 30)
+    heap.schedule("early", 10)
+    heap.schedule("middle", 20)
+
+    assert heap.pop_due(20) == ["early", "middle"]
+    assert heap.pop_due(25) == []
+    assert len(heap) == 1
+
+
+def test_key_keeps_its_first_deadline_until_popped():
+    heap = ExpiryHeap()
+    heap.schedule("session", 10)
+    heap.schedule("session", 50)
+
+    assert len(heap) == 1
+    assert heap.pop_due(10) == ["session"]
+    # Once popped it can be rescheduled
+    heap.schedule("session", 50)
+    assert heap.pop_due(49) == []
+    assert heap.pop_due(50) == ["session"]
@@ -0,0 +1,44 @@
+import pytest
+
+from app.terminal import session_sandbox as session_sandbox_module
+from app.terminal.result_cache import ResultCache
+from tests.conftest import wait_for
+
+COMMAND = "cat /etc/os-release"
+
+
+@pytest.fixture(autouse=True)
+def result_cache(monkeypatch):
+    cache = ResultCache()
+    monkeypatch.setattr(session_sandbox_module, "result_cache", cache)
+    return cache
+
+
+def test_image_file_read_is_served_to_fresh_sessions(make_sandbox):
+    sandbox = make_sandbox()
+    # Sessions only count as fresh once the state cache has synced
+    sandbox.state.start()
+    wait_for(lambda: sandbox.state.ready)
+    first = sandbox.execute_command("a", COMMAND)
+    assert first["exit_code"] == 0 and first["output"]
+    execs = len(sandbox.client.api.execs)
+
+    assert sandbox.execute_command("b", COMMAND)["output"] == first["output"]
+    assert len(sandbox.client.api.execs) == execs
+    assert sandbox.client.containers.created == ["learn-a"]
+
+
+def test_sessions_with_their_own_shell_skip_the_cache(make_sandbox, result_cache):
+    sandbox = make_sandbox()
+    sandbox.state.start()
+    wait_for(lambda: sandbox.state.ready)
+    assert sandbox.execute_command("a", "cd /")["exit_code"] == 0
+    result_cache.put(sandbox._image_id(sandbox.DEFAULT_IMAGE), COMMAND, {
+        "output": "stale\n",
+        "exit_code": 0,
+    })
+
+    result = sandbox.execute_command("a", COMMAND)
+
+    assert result["output"] != "stale\n"
+    assert result["output"] == open("/etc/os-release").read()
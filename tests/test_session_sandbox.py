@@ -0,0 +1,82 @@
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+SESSIONS = 6
+# Seconds each session's exec takes in the fake daemon
+EXEC_SECONDS = 0.5
+
+
+def _session_ids(sandbox, count):
+    """Session ids on distinct lock stripes, which never wait for each other."""
+    ids = []
+    for index in itertools.count():
+        session_id = f"session-{index}"
+        lock = sandbox._session_lock(session_id)
+        if all(lock is not sandbox._session_lock(other) for other in ids):
+            ids.append(session_id)
+        if len(ids) == count:
+            return ids
+
+
+def test_sessions_run_commands_in_parallel(make_sandbox):
+    sandbox = make_sandbox()
+    # Every exec waits until all sessions have one in flight, so
+    # sessions serialized behind each other break the barrier
+    barrier = threading.Barrier(SESSIONS, timeout=SESSIONS * EXEC_SECONDS)
+
+    def slow_exec(exec_id):
+        barrier.wait()
+        time.sleep(EXEC_SECONDS)
+
+    sandbox.client.api.before_start = slow_exec
+    session_ids = _session_ids(sandbox, SESSIONS)
+
+    def run(index):
+        return sandbox.execute_command(session_ids[index], f"echo hello {index}")
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=SESSIONS) as executor:
+        results = list(executor.map(run, range(SESSIONS)))
+    elapsed = time.monotonic() - started
+
+    for index, result in enumerate(results):
+        assert result["error"] is None
+        assert result["exit_code"] == 0
+        assert result["output"] == f"hello {index}\n"
+    assert elapsed < 2 * EXEC_SECONDS
+
+
+def test_session_keeps_shell_state(make_sandbox):
+    sandbox = make_sandbox()
+
+    assert sandbox.execute_command("a", "cd / && export GREETING=hi")["exit_code"] == 0
+    result = sandbox.execute_command("a", 'echo "$PWD $GREETING"')
+
+    assert result["output"] == "/ hi\n"
+    assert sandbox.client.containers.created == ["learn-a"]
+
+
+def test_trash_sweep_works_before_the_state_cache_syncs(make_sandbox):
+    sandbox = make_sandbox()
+    containers = sandbox.client.containers
+    containers.run("linux-sandbox:latest", name=f"{sandbox.TRASH_PREFIX}abc", labels={"learn-session": ""})
+    containers.run("linux-sandbox:latest", name="learn-session-0", labels={"learn-session": "session-0"})
+    assert not sandbox.state.ready
+
+    sandbox._sweep_trash()
+
+    assert set(containers.by_name) == {"learn-session-0"}
+
+
+def test_batch_stops_at_a_command_that_ends_the_shell(make_sandbox):
+    sandbox = make_sandbox()
+
+    result = sandbox.execute_batch("session-0", ["echo one", "exit 3", "echo never"])
+
+    assert [r["exit_code"] for r in result["results"]] == [0, 3]
+    assert result["results"][0]["output"] == "one\n"
+    assert not result["error"]
+    # The next command gets a fresh shell
+    assert sandbox.execute_command("session-0", "echo again")["output"] == "again\n"
@@ -0,0 +1,80 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.terminal.sharding import ShardedSandbox
+from tests.conftest import wait_for
+from tests.fake_docker import FakeDockerClient
+
+HOSTS = ["tcp://docker-a:2375", "tcp://docker-b:2375", "tcp://docker-c:2375"]
+
+
+@pytest.fixture
+def make_sharded(tmp_path):
+    """Build ShardedSandboxes over one fake daemon per host, sharing state."""
+    clients = {url: FakeDockerClient(str(tmp_path)) for url in HOSTS}
+
+    def make() -> ShardedSandbox:
+        sharded = ShardedSandbox(client_factory=lambda url: clients[url])
+        sharded.init_app(SimpleNamespace(config={
+            "SANDBOX_DOCKER_HOSTS": HOSTS,
+            "SANDBOX_STATE_DIR": str(tmp_path / "state"),
+            "SANDBOX_REAP_INTERVAL": 0,
+        }))
+        for shard in sharded.shards.values():
+            shard.state.start()
+        wait_for(lambda: all(shard.state.ready for shard in sharded.shards.values()))
+        return sharded
+
+    return make
+
+
+def test_shard_for_is_stable_per_session(make_sharded):
+    sharded = make_sharded()
+    placed = {f"session-{index}": sharded.shard_for(f"session-{index}") for index in range(30)}
+
+    assert all(sharded.shard_for(session_id) is shard for session_id, shard in placed.items())
+    # Sessions spread over every host
+    assert {id(shard) for shard in placed.values()} == {id(shard) for shard in sharded.shards.values()}
+    # Another worker sharing the state dir agrees
+    other = make_sharded()
+    hosts = {id(shard): url for url, shard in sharded.shards.items()}
+    for session_id, shard in placed.items():
+        assert other.shard_for(session_id) is other.shards[hosts[id(shard)]]
+
+
+def test_full_shards_are_skipped(make_sharded):
+    sharded = make_sharded()
+    for url in HOSTS[:2]:
+        sharded.shards[url].capacity.configure(max_containers=0)
+
+    shards = {sharded.shard_for(f"session-{index}") for index in range(20)}
+
+    assert shards == {sharded.shards[HOSTS[2]]}
+
+
+def test_session_sticks_to_its_shard(make_sharded):
+    sharded = make_sharded()
+    shard = sharded.shard_for("sticky")
+    assert sharded.get_or_create_container("sticky")["success"]
+    wait_for(lambda: shard.has_container("sticky"))
+
+    # Its host is now full, but it still has the session's container
+    shard.capacity.configure(max_containers=1)
+
+    assert sharded.shard_for("sticky") is shard
+    assert sharded.execute_command("sticky", "echo still here")["output"] == "still here\n"
+    assert [
+        name
+        for other in sharded.shards.values()
+        for name in other.client.containers.created
+    ] == ["learn-sticky"]
+
+
+def test_session_without_container_leaves_full_shard(make_sharded):
+    sharded = make_sharded()
+    shard = sharded.shard_for("placed")
+
+    shard.capacity.configure(max_containers=0)
+
+    assert sharded.shard_for("placed") is not shard
@@ -0,0 +1,31 @@
+import pytest
+
+from tests.conftest import wait_for
+
+
+@pytest.fixture
+def lane(make_sandbox):
+    sandbox = make_sandbox(SANDBOX_LANE_SIZE=1)
+    sandbox.lane.start()
+    wait_for(lambda: sandbox.lane.pick(sandbox.DEFAULT_IMAGE))
+    return sandbox.lane
+
+
+def _run(lane, command, timeout):
+    events = list(lane.stream(command, lane.image, timeout=timeout))
+    return "".join(event.get("output", "") for event in events), events[-1]
+
+
+def test_command_past_its_deadline_times_out(lane):
+    _, final = _run(lane, "sleep 5", timeout=0.5)
+
+    assert final["exit_code"] == 124
+    assert final["timed_out"]
+
+
+@pytest.mark.parametrize("command", ["exit 124", "timeout 0.1 sleep 5", "kill -9 $$"])
+def test_timeout_exit_codes_before_the_deadline_are_not_timeouts(lane, command):
+    _, final = _run(lane, command, timeout=30)
+
+    assert final["exit_code"] in (124, 137)
+    assert not final["timed_out"]
@@ -0,0 +1,51 @@
+from app.terminal.state_store import ActivityStore
+
+
+def test_activity_is_shared_between_workers(tmp_path):
+    path = str(tmp_path / "activity.db")
+    ours, theirs = ActivityStore(path), ActivityStore(path)
+
+    ours.touch("s1", 100.0)
+    theirs.touch("s2", 200.0)
+
+    assert ours.load() == theirs.load() == {"s1": 100.0, "s2": 200.0}
+
+
+def test_touch_keeps_the_most_recent_time(tmp_path):
+    store = ActivityStore(str(tmp_path / "activity.db"))
+
+    store.touch("s1", 200.0)
+    store.touch("s1", 100.0)
+
+    assert store.get("s1") == 200.0
+
+
+def test_forget_and_unknown_sessions(tmp_path):
+    store = ActivityStore(str(tmp_path / "activity.db"))
+    store.touch("s1", 100.0)
+
+    store.forget("s1")
+
+    assert store.get("s1") is None
+    assert store.load() == {}
+
+
+def test_activity_survives_a_restart(tmp_path):
+    store = ActivityStore()
+    store.configure(str(tmp_path))
+    store.touch("s1", 100.0)
+
+    restarted = ActivityStore()
+    restarted.configure(str(tmp_path))
+
+    assert restarted.get("s1") == 100.0
+
+
+def test_unusable_file_is_best_effort(tmp_path):
+    (tmp_path / "file").write_text("")
+    store = ActivityStore(str(tmp_path / "file" / "activity.db"))
+
+    store.touch("s1", 100.0)
+
+    assert store.get("s1") is None
+    assert store.load() == {}